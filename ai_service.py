@@ -1,91 +1,122 @@
 import openai
-import requests
-import tempfile
 import os
 from config import OPENAI_API_KEY
+from meal_plan_cache import create_meal_plan_cache, make_cache_key
+from single_flight import create_single_flight
+from preference_index import sdk_embed
+from meal_plan_library import create_meal_plan_library
+from meal_optimizer import create_meal_plan_optimizer
+from shopping_extractor import extract_shopping_items_locally
+from meal_plan_stream import stream_completion
+from http_pool import get_session
+from voice_audio import download_voice, close_audio
+from transcription_cache import create_transcription_cache
+from stt_backends import create_transcriber
+from rate_limiter import create_rate_limiter, estimate_tokens
+from resilience import OPENAI, TELEGRAM, call, send_request
+from meal_plans import (
+    MEAL_PLAN_MODEL, MEAL_PLAN_TEMPERATURE, meal_plan_request, shopping_items_request, generate_meal_plan_json
+)
 
 class AIService:
-    def __init__(self):
+    def __init__(self, user_store=None):
         if not OPENAI_API_KEY:
             raise ValueError("OpenAI API key not found in environment variables")
-        self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
+        # Retries are left to resilience.py
+        self.client = openai.OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+        self.meal_plan_cache = create_meal_plan_cache(embed=sdk_embed(self.client))
+        self.meal_plan_flights = create_single_flight()
+        # Rotation through library plans is remembered in user_store when given
+        self.meal_plan_library = create_meal_plan_library(user_store)
+        self.meal_plan_optimizer = create_meal_plan_optimizer()
+        self.transcription_cache = create_transcription_cache()
+        self.transcriber = create_transcriber(self.client)
+        self.rate_limiter = create_rate_limiter()
     
-    def transcribe_voice(self, voice_file_path):
-        """Transcribe voice message using OpenAI Whisper"""
+    def _limit_openai_call(self, user_id, request=None):
+        """Reserve rate limit capacity for one OpenAI call (raises RateLimitExceeded)"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(user_id, estimate_tokens(request) if request else 0)
+    
+    def transcribe_voice(self, audio, duration=None):
+        """Transcribe voice message (bytes or a download stream) with the STT_BACKEND transcriber"""
         try:
-            with open(voice_file_path, 'rb') as audio_file:
-                transcript = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file
-                )
-            return transcript.text.lower()
+            return self.transcriber.transcribe(audio, duration).lower()
         except Exception as e:
             print(f"Error transcribing voice: {e}")
             return None
+        finally:
+            close_audio(audio)
     
-    def generate_meal_plan(self, user_preferences="", days=1):
-        """Generate meal plan using OpenAI GPT"""
-        try:
-            prompt = f"""
-            Create a {days}-day meal plan with 3 meals (breakfast, lunch, dinner) and 1 snack per day.
-            Focus on high protein, healthy, and delicious meals.
-            
-            User preferences: {user_preferences if user_preferences else "No specific preferences"}
-            
-            Format the response as a JSON object with this structure:
-            {{
-                "days": [
-                    {{
-                        "day": 1,
-                        "breakfast": {{"name": "meal name", "ingredients": ["ingredient1", "ingredient2"], "protein": "XXg", "calories": "XXX"}},
-                        "lunch": {{"name": "meal name", "ingredients": ["ingredient1", "ingredient2"], "protein": "XXg", "calories": "XXX"}},
-                        "dinner": {{"name": "meal name", "ingredients": ["ingredient1", "ingredient2"], "protein": "XXg", "calories": "XXX"}},
-                        "snack": {{"name": "snack name", "ingredients": ["ingredient1", "ingredient2"], "protein": "XXg", "calories": "XXX"}}
-                    }}
-                ]
-            }}
-            
-            Make sure each meal has at least 20g of protein and is practical to cook.
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a nutrition expert and meal planner. Provide healthy, protein-rich meal plans."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7
+    def transcribe_voice_message(self, fetch_audio, file_unique_id=None, duration=None, user_id=None):
+        """Transcribe the audio returned by fetch_audio() (served from cache when possible)"""
+        def fetch_limited_audio():
+            # Counted before the download so a shed request costs nothing
+            self._limit_openai_call(user_id)
+            return fetch_audio()
+        transcribe = lambda audio: self.transcribe_voice(audio, duration)
+        if self.transcription_cache is None:
+            return transcribe(fetch_limited_audio())
+        return self.transcription_cache.transcribe(transcribe, fetch_limited_audio, file_unique_id)
+    
+    def generate_meal_plan(self, user_preferences="", days=1, on_day=None, user_id=None):
+        """Generate meal plan using OpenAI GPT (served from the library or cache when possible)
+        
+        If on_day is given the completion is streamed and on_day(day, days_so_far)
+        is called as each day of the plan arrives. Cache misses count against
+        user_id's rate limit and raise RateLimitExceeded when it is used up.
+        """
+        if self.meal_plan_library is not None:
+            meal_plan_json = self.meal_plan_library.choose(days, user_preferences, user_id)
+            if meal_plan_json:
+                return meal_plan_json
+        if self.meal_plan_optimizer is not None:
+            meal_plan_json = self.meal_plan_optimizer.plan(days, user_preferences)
+            if meal_plan_json:
+                return meal_plan_json
+        def request_plan():
+            request = meal_plan_request(user_preferences, days)
+            self._limit_openai_call(user_id, request)
+            if on_day is not None:
+                return stream_completion(self.client, on_day, **request)
+            return self._request_meal_plan(user_preferences, days, request=request)
+        generate = lambda: generate_meal_plan_json(request_plan, days)
+        if self.meal_plan_flights is not None:
+            # Identical concurrent requests share one generation
+            generate = self.meal_plan_flights.wrap(
+                make_cache_key(days, user_preferences, MEAL_PLAN_MODEL, MEAL_PLAN_TEMPERATURE), generate
             )
+        if self.meal_plan_cache is None:
+            return generate()
+        return self.meal_plan_cache.get_or_generate(
+            generate, days, user_preferences, model=MEAL_PLAN_MODEL, temperature=MEAL_PLAN_TEMPERATURE
+        )
+    
+    def _request_meal_plan(self, user_preferences="", days=1, request=None):
+        """Request a new meal plan from OpenAI GPT (request: an already built meal_plan_request)"""
+        try:
+            request = request or meal_plan_request(user_preferences, days)
+            response = call(OPENAI, lambda: self.client.chat.completions.create(**request), hedge=True)
             
             return response.choices[0].message.content
         except Exception as e:
             print(f"Error generating meal plan: {e}")
             return None
     
-    def extract_shopping_items(self, meal_plan_text):
-        """Extract shopping list items from meal plan"""
+    def extract_shopping_items(self, meal_plan_text, user_id=None):
+        """Extract shopping list items from meal plan (locally, GPT as fallback)"""
+        shopping_items = extract_shopping_items_locally(meal_plan_text)
+        if shopping_items:
+            return shopping_items
+        print("Local shopping list extraction failed, falling back to GPT")
+        return self._request_shopping_items(meal_plan_text, user_id)
+    
+    def _request_shopping_items(self, meal_plan_text, user_id=None):
+        """Extract shopping list items from meal plan using OpenAI GPT"""
         try:
-            prompt = f"""
-            Extract all unique ingredients needed for this meal plan. 
-            Combine similar items and provide quantities.
-            
-            Meal plan: {meal_plan_text}
-            
-            Return as a simple list of items, one per line, with quantities where appropriate.
-            Example:
-            - 2 lbs chicken breast
-            - 1 dozen eggs
-            - 1 lb spinach
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that extracts shopping list items from meal plans."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3
-            )
+            request = shopping_items_request(meal_plan_text)
+            self._limit_openai_call(user_id, request)
+            response = call(OPENAI, lambda: self.client.chat.completions.create(**request), hedge=True)
             
             return response.choices[0].message.content
         except Exception as e:
@@ -93,28 +124,19 @@ class AIService:
             return None
     
     def download_voice_file(self, file_id, bot_token):
-        """Download voice file from Telegram"""
+        """Download voice file from Telegram into memory (bytes or a stream for transcribe_voice)"""
         try:
             # Get file info
-            file_info_url = f"https://api.telegram.org/bot{bot_token}/getFile?file_id={file_id}"
-            file_info = requests.get(file_info_url).json()
+            file_info_url = f"https://api.telegram.org/bot{bot_token}/getFile"
+            file_info = send_request(
+                TELEGRAM, 'get', file_info_url, session=get_session(), hedge=True, params={'file_id': file_id}
+            ).json()
             
             if not file_info['ok']:
                 return None
             
-            file_path = file_info['result']['file_path']
-            file_url = f"https://api.telegram.org/file/bot{bot_token}/{file_path}"
-            
-            # Download file
-            response = requests.get(file_url)
-            if response.status_code == 200:
-                # Save to temporary file
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.ogg')
-                temp_file.write(response.content)
-                temp_file.close()
-                return temp_file.name
-            
-            return None
+            result = file_info['result']
+            return download_voice(bot_token, result['file_path'], result.get('file_size'))
         except Exception as e:
             print(f"Error downloading voice file: {e}")
-            return None 
\ No newline at end of file
+            return None
\ No newline at end of file
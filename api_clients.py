@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Minimal Telegram Bot API and OpenAI HTTP clients
+Plain JSON over the shared keep-alive session from http_pool.py - no telebot, no OpenAI SDK, no pydantic.
+Requests go through resilience.py for retries and circuit breaking.
+"""
+import logging
+
+from resilience import OPENAI, TELEGRAM, send_request
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = 'https://api.telegram.org'
+OPENAI_API_URL = 'https://api.openai.com/v1'
+
+def get_session():
+    """Shared keep-alive session from http_pool (imported on first call to keep requests off cold start)"""
+    from http_pool import get_session as get_pooled_session
+    return get_pooled_session()
+
+class APIError(Exception):
+    """Raised when Telegram or OpenAI returns an error response"""
+
+    def __init__(self, message, status_code=None, body=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+class TelegramClient:
+    """Telegram Bot API client for the handful of methods the bot uses
+
+    timeout=None uses the per-host defaults from http_pool.
+    """
+
+    def __init__(self, token, session=None, timeout=None):
+        self.token = token
+        self.session = session
+        self.timeout = timeout
+
+    def _session(self):
+        return self.session or get_session()
+
+    def call(self, method, **params):
+        """Call a Bot API method and return its result"""
+        response = send_request(
+            TELEGRAM, 'post', f"{TELEGRAM_API_URL}/bot{self.token}/{method}",
+            session=self._session(),
+            hedge=method == 'getFile',
+            json={key: value for key, value in params.items() if value is not None},
+            timeout=self.timeout
+        )
+        try:
+            body = response.json()
+        except ValueError:
+            body = {'ok': False, 'description': response.text}
+        if response.status_code != 200 or not body.get('ok'):
+            raise APIError(
+                f"Telegram {method} failed: {response.status_code} {body.get('description')}",
+                response.status_code, body
+            )
+        return body['result']
+
+    def send_message(self, chat_id, text, parse_mode=None, reply_to_message_id=None):
+        return self.call('sendMessage', chat_id=chat_id, text=text, parse_mode=parse_mode,
+                         reply_to_message_id=reply_to_message_id)
+
+    def edit_message_text(self, chat_id, message_id, text, parse_mode=None):
+        return self.call('editMessageText', chat_id=chat_id, message_id=message_id, text=text,
+                         parse_mode=parse_mode)
+
+    def get_file(self, file_id):
+        return self.call('getFile', file_id=file_id)
+
+    def download_file(self, file_path):
+        """Download a file returned by get_file and return its bytes"""
+        response = send_request(
+            TELEGRAM, 'get', f"{TELEGRAM_API_URL}/file/bot{self.token}/{file_path}",
+            session=self._session(), hedge=True, timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise APIError(f"Telegram file download failed: {response.status_code}", response.status_code)
+        return response.content
+
+class OpenAIClient:
+    """OpenAI REST client for chat completions, embeddings, Whisper transcription and the Batch API"""
+
+    def __init__(self, api_key, session=None, timeout=None):
+        self.api_key = api_key
+        self.session = session
+        self.timeout = timeout
+
+    def _session(self):
+        return self.session or get_session()
+
+    def _request(self, method, path, attempts=None, hedge=False, **kwargs):
+        response = send_request(
+            OPENAI, method, f"{OPENAI_API_URL}/{path}",
+            session=self._session(),
+            attempts=attempts,
+            hedge=hedge,
+            headers={'Authorization': f'Bearer {self.api_key}'},
+            timeout=self.timeout,
+            **kwargs
+        )
+        if response.status_code != 200:
+            raise APIError(
+                f"OpenAI {path} failed: {response.status_code} - {response.text[:500]}",
+                response.status_code, response.text
+            )
+        return response
+
+    def _post(self, path, attempts=None, hedge=False, **kwargs):
+        return self._request('post', path, attempts=attempts, hedge=hedge, **kwargs).json()
+
+    def _get(self, path, **kwargs):
+        return self._request('get', path, **kwargs).json()
+
+    def chat_completion(self, **request):
+        """POST /chat/completions and return the decoded response"""
+        return self._post('chat/completions', hedge=True, json=request)
+
+    def chat_content(self, **request):
+        """Return the first choice's message content"""
+        return self.chat_completion(**request)['choices'][0]['message']['content']
+
+    def embed(self, texts, model='text-embedding-3-small'):
+        """Embedding vectors for texts (POST /embeddings)"""
+        result = self._post('embeddings', json={'model': model, 'input': list(texts)})
+        return [item['embedding'] for item in sorted(result['data'], key=lambda item: item['index'])]
+
+    def transcribe(self, audio, filename='voice.ogg', model='whisper-1'):
+        """Transcribe audio bytes (or a file object) with Whisper and return the text"""
+        result = self._post(
+            'audio/transcriptions',
+            # A file object can only be sent once
+            attempts=None if isinstance(audio, (bytes, bytearray)) else 1,
+            data={'model': model},
+            files={'file': (filename, audio, 'audio/ogg')}
+        )
+        return result['text']
+
+    def upload_file(self, data, filename, purpose='batch'):
+        """Upload bytes as a file (POST /files) and return the file object"""
+        return self._post('files', data={'purpose': purpose}, files={'file': (filename, data, 'application/jsonl')})
+
+    def create_batch(self, input_file_id, endpoint, completion_window='24h', metadata=None):
+        """Start a batch over an uploaded JSONL file (POST /batches) and return the batch object"""
+        request = {'input_file_id': input_file_id, 'endpoint': endpoint, 'completion_window': completion_window}
+        if metadata:
+            request['metadata'] = metadata
+        # Retrying a create that timed out could start the batch twice
+        return self._post('batches', attempts=1, json=request)
+
+    def retrieve_batch(self, batch_id):
+        """GET /batches/{id}: status and output/error file ids"""
+        return self._get(f"batches/{batch_id}")
+
+    def file_content(self, file_id):
+        """Text of a file, e.g. a batch's output (GET /files/{id}/content)"""
+        return self._request('get', f"files/{file_id}/content").text
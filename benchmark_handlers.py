@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: lambda_function_v2.py vs lambda_function_fast.py
+Measures import time (handler import, then first client construction) in fresh interpreters
+and, with --size, the deployment package size for each requirements file
+"""
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+from import_time_report import parse_importtime
+
+HANDLERS = {
+    'v2': {
+        'module': 'lambda_function_v2',
+        'requirements': 'requirements.txt',
+        # Touching the lazy clients forces telebot/openai to load
+        'warm': 'm.bot.token; m.openai_client.api_key',
+    },
+    'fast': {
+        'module': 'lambda_function_fast',
+        'requirements': 'requirements_simple.txt',
+        'warm': 'm.telegram.token; m.openai_client.api_key; __import__("api_clients").get_session()',
+    },
+}
+
+RUNS = 5
+
+def _env():
+    return {
+        **os.environ,
+        'PYTHONDONTWRITEBYTECODE': '1',
+        'TELEGRAM_BOT_TOKEN': os.environ.get('TELEGRAM_BOT_TOKEN', '123:benchmark'),
+        'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY', 'sk-benchmark'),
+        'USER_STORE_BACKEND': 'memory',
+        'DEDUP_BACKEND': 'memory',
+        'MEAL_PLAN_CACHE_BACKEND': 'memory',
+    }
+
+def measure_import(module, warm=None, python=sys.executable):
+    """Import module (and optionally run warm) in a fresh interpreter; returns total microseconds"""
+    code = f'import {module} as m'
+    if warm:
+        code += f'; {warm}'
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', code], capture_output=True, text=True, env=_env()
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    # Top-level entries sum to everything imported by the -c snippet
+    return sum(cumulative for _, _, cumulative, depth in parse_importtime(result.stderr) if depth == 0)
+
+def package_size(requirements):
+    """pip install requirements into a temp dir, zip it and return (installed_bytes, zip_bytes)"""
+    tmp = tempfile.mkdtemp(prefix='nutrition-bench-')
+    try:
+        target = os.path.join(tmp, 'package')
+        subprocess.run(
+            [sys.executable, '-m', 'pip', 'install', '-q', '-r', requirements, '-t', target],
+            check=True
+        )
+        installed = 0
+        zip_path = os.path.join(tmp, 'package.zip')
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for root, dirs, files in os.walk(target):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    installed += os.path.getsize(file_path)
+                    zipf.write(file_path, os.path.relpath(file_path, target))
+        return installed, os.path.getsize(zip_path)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def main():
+    print("⏱️ Cold-start benchmark (median of %d fresh interpreters)" % RUNS)
+    print("=" * 60)
+    results = {}
+    for name, handler in HANDLERS.items():
+        imports = [measure_import(handler['module']) for _ in range(RUNS)]
+        warmed = [measure_import(handler['module'], handler['warm']) for _ in range(RUNS)]
+        results[name] = (statistics.median(imports), statistics.median(warmed))
+        print(f"{name:>5}: import {results[name][0] / 1000:7.1f} ms | "
+              f"import + clients {results[name][1] / 1000:7.1f} ms")
+
+    if results['fast'][1]:
+        print(f"Speedup (import + clients): {results['v2'][1] / results['fast'][1]:.1f}x")
+
+    if '--size' in sys.argv:
+        print("\n📦 Package size")
+        sizes = {}
+        for name, handler in HANDLERS.items():
+            sizes[name] = package_size(handler['requirements'])
+            print(f"{name:>5}: installed {sizes[name][0] / 1e6:6.1f} MB | zip {sizes[name][1] / 1e6:6.1f} MB "
+                  f"({handler['requirements']})")
+        print(f"Zip size ratio: {sizes['v2'][1] / sizes['fast'][1]:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Intent parser benchmark: accuracy on labelled commands and time per message
+"""
+import time
+
+from intent_parser import (
+    parse_intent, PLAN_MEALS, DECLINE_PLAN, SHOW_SHOPPING, ADD_SHOPPING, REMOVE_SHOPPING,
+    CLEAR_SHOPPING, HELP, UNKNOWN
+)
+
+# (text, intent, days, preferences, items) - None skips a slot check
+CORPUS = [
+    ("/planmeals", PLAN_MEALS, 1, '', None),
+    ("/planmeals 3 days", PLAN_MEALS, 3, '', None),
+    ("/planmeals@NutritionGPTBot 5 days vegan", PLAN_MEALS, 5, 'vegan', None),
+    ("/shopping", SHOW_SHOPPING, None, None, None),
+    ("/start", HELP, None, None, None),
+    ("plan meals", PLAN_MEALS, 1, '', None),
+    ("Plan meals for 3 days", PLAN_MEALS, 3, '', None),
+    ("plan meals for three days", PLAN_MEALS, 3, '', None),
+    ("create a meal plan for a week", PLAN_MEALS, 7, '', None),
+    ("I need a vegetarian meal plan for the weekend", PLAN_MEALS, 2, 'vegetarian', None),
+    ("make me a high-protein meal plan for 2 days, no dairy", PLAN_MEALS, 2, 'high protein, no dairy', None),
+    ("Give me meals for the next couple of days", PLAN_MEALS, 2, '', None),
+    ("what should I eat tomorrow", PLAN_MEALS, 1, '', None),
+    ("Plan my meals for 10 days", PLAN_MEALS, 7, '', None),
+    ("gluten-free meal plan for 4 days without nuts", PLAN_MEALS, 4, 'gluten free, no nuts', None),
+    ("plan a 1800 calorie keto menu for five days", PLAN_MEALS, 5, 'keto, 1800 calories', None),
+    ("weekly meal prep plan", PLAN_MEALS, 7, '', None),
+    ("a week of meals please", PLAN_MEALS, 7, '', None),
+    ("I don't want a meal plan", DECLINE_PLAN, None, None, None),
+    ("I do not need a meal plan right now", DECLINE_PLAN, None, None, None),
+    ("no meal plan please", DECLINE_PLAN, None, None, None),
+    ("stop making meal plans", DECLINE_PLAN, None, None, None),
+    ("don't make me a meal plan, I don't like fish", DECLINE_PLAN, None, None, None),
+    ("i need a meal plan, i dont want dairy", PLAN_MEALS, 1, 'no dairy', None),
+    ("I want a meal plan without nuts. i don't like fish", PLAN_MEALS, 1, 'no nuts, no fish', None),
+    ("I do not need anything, make me a meal plan", PLAN_MEALS, 1, '', None),
+    ("I don't eat meat but plan my meals for 3 days", PLAN_MEALS, 3, None, None),
+    ("Add eggs to my shopping list", ADD_SHOPPING, None, None, ['eggs']),
+    ("add milk, bread and 2 apples to the shopping list", ADD_SHOPPING, None, None, ['milk', 'bread', '2 apples']),
+    ("put some spinach on my grocery list", ADD_SHOPPING, None, None, ['spinach']),
+    ("I need to buy oat milk", ADD_SHOPPING, None, None, ['oat milk']),
+    ("remove eggs from my shopping list", REMOVE_SHOPPING, None, None, ['eggs']),
+    ("take the bread off the shopping list", REMOVE_SHOPPING, None, None, ['bread']),
+    ("remove eggs from my list", REMOVE_SHOPPING, None, None, ['eggs']),
+    ("clear my shopping list", CLEAR_SHOPPING, None, None, None),
+    ("show my shopping list", SHOW_SHOPPING, None, None, None),
+    ("what's on my shopping list?", SHOW_SHOPPING, None, None, None),
+    ("what do I need to buy", SHOW_SHOPPING, None, None, None),
+    ("hello", HELP, None, None, None),
+    ("what can you do?", HELP, None, None, None),
+    ("I like food", UNKNOWN, None, None, None),
+    ("thanks!", UNKNOWN, None, None, None),
+    ("my diet is going well", UNKNOWN, None, None, None),
+    ("I am planning a party", UNKNOWN, None, None, None),
+    ("my plan is to lose weight, what should i eat", UNKNOWN, None, None, None),
+]
+
+ITERATIONS = 2000
+
+def check(entry):
+    text, name, days, preferences, items = entry
+    intent = parse_intent(text)
+    errors = []
+    if intent.name != name:
+        errors.append(f"intent {intent.name} != {name}")
+    if days is not None and intent.days != days:
+        errors.append(f"days {intent.days} != {days}")
+    if preferences is not None and intent.preferences != preferences:
+        errors.append(f"preferences {intent.preferences!r} != {preferences!r}")
+    if items is not None and intent.items != items:
+        errors.append(f"items {intent.items} != {items}")
+    return errors
+
+def main():
+    print(f"🧭 Intent parser benchmark ({len(CORPUS)} labelled messages)")
+    print("=" * 60)
+    failures = 0
+    for entry in CORPUS:
+        errors = check(entry)
+        if errors:
+            failures += 1
+            print(f"  ❌ {entry[0]!r}: {'; '.join(errors)}")
+    print(f"Accuracy: {len(CORPUS) - failures}/{len(CORPUS)}")
+
+    texts = [entry[0] for entry in CORPUS]
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for text in texts:
+            parse_intent(text)
+    per_message = (time.perf_counter() - start) / (ITERATIONS * len(texts))
+    print(f"Time: {per_message * 1e6:.1f} µs per message")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Prompt size benchmark: tokens per request before and after compact templates
+Counts with tiktoken when installed (pip install tiktoken), otherwise ~4 characters per token.
+"""
+import json
+
+from meal_plans import meal_plan_request, shopping_items_request, MEAL_PLAN_PROMPT, SHOPPING_PROMPT
+from prompt_templates import count_message_tokens, stats
+
+MEALS = ['breakfast', 'lunch', 'dinner', 'snack']
+
+# Rotated across days and meals so the plan has the ingredient variety of a real one
+SAMPLE_DISHES = [
+    ("Chicken rice bowl", ['150g chicken breast', '1 cup brown rice', '1 cup broccoli', '1 tbsp olive oil']),
+    ("Greek yogurt parfait", ['200g greek yogurt', '1/2 cup blueberries', '30g granola', '1 tsp honey']),
+    ("Salmon with quinoa", ['150g salmon fillet', '1 cup quinoa', '1 cup spinach', '1 lemon']),
+    ("Turkey wrap", ['1 whole wheat tortilla', '100g turkey breast', '1/2 avocado', '1 tomato']),
+    ("Tofu stir fry", ['200g firm tofu', '1 bell pepper', '1 cup snap peas', '2 tbsp soy sauce']),
+    ("Egg scramble", ['3 eggs', '1/2 cup mushrooms', '1 slice whole grain bread', '30g feta cheese']),
+    ("Lentil soup", ['1 cup red lentils', '1 carrot', '1 onion', '2 cups vegetable broth']),
+    ("Beef chili", ['150g lean ground beef', '1/2 cup kidney beans', '1 can diced tomatoes', '1 tsp chili powder']),
+    ("Overnight oats", ['1/2 cup rolled oats', '1 cup almond milk', '1 tbsp chia seeds', '1 banana']),
+    ("Shrimp tacos", ['150g shrimp', '2 corn tortillas', '1 cup cabbage', '1 lime']),
+    ("Cottage cheese bowl", ['1 cup cottage cheese', '1 peach', '15g walnuts', '1 tsp cinnamon']),
+]
+
+def sample_plan(days):
+    """Pretty-printed plan JSON like the model returns"""
+    plan = []
+    for day in range(1, days + 1):
+        entry = {'day': day}
+        for index, meal in enumerate(MEALS):
+            name, ingredients = SAMPLE_DISHES[(day * len(MEALS) + index) % len(SAMPLE_DISHES)]
+            entry[meal] = {
+                'name': name, 'ingredients': ingredients,
+                'protein': f"{25 + 5 * ((day + index) % 4)}g", 'calories': str(350 + 50 * ((day * 3 + index) % 5))
+            }
+        plan.append(entry)
+    return json.dumps({'days': plan}, indent=4)
+
+def main():
+    print("✂️ Prompt token benchmark")
+    print("=" * 60)
+    print(f"{'request':<22}{'before':>8}{'after':>8}{'saved':>8}{'max_tokens':>12}")
+    for days in (1, 3, 7):
+        request = meal_plan_request("high protein, no dairy", days)
+        before = count_message_tokens([
+            {'content': MEAL_PLAN_PROMPT.source_system},
+            {'content': MEAL_PLAN_PROMPT.source_user.format(days=days, preferences="high protein, no dairy")},
+        ])
+        after = count_message_tokens(request['messages'])
+        print(f"{f'meal plan {days}d':<22}{before:>8}{after:>8}{before - after:>8}{request['max_tokens']:>12}")
+    for days in (1, 3, 7):
+        plan = sample_plan(days)
+        request = shopping_items_request(plan)
+        before = count_message_tokens([
+            {'content': SHOPPING_PROMPT.source_system},
+            {'content': SHOPPING_PROMPT.source_user.format(ingredients=plan)},
+        ])
+        after = count_message_tokens(request['messages'])
+        print(f"{f'shopping {days}d':<22}{before:>8}{after:>8}{before - after:>8}{request['max_tokens']:>12}")
+    print(f"Totals: {stats.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Speech-to-text benchmark: latency and accuracy per backend on recorded voice commands
+Corpus: a directory of audio files (voice_01.ogg, ...) each with a .txt file holding the reference text.
+
+Usage: python benchmark_stt.py stt_corpus [--backends api,local,auto]
+"""
+import os
+import re
+import statistics
+import sys
+import time
+
+AUDIO_EXTENSIONS = ('.ogg', '.oga', '.mp3', '.m4a', '.wav')
+MEAL_KEYWORDS = ['plan', 'meal', 'food', 'diet']
+
+def load_corpus(directory):
+    """Return [(name, audio_bytes, reference_text)] for every audio file with a transcript"""
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        base, ext = os.path.splitext(name)
+        reference_path = os.path.join(directory, base + '.txt')
+        if ext.lower() not in AUDIO_EXTENSIONS or not os.path.exists(reference_path):
+            continue
+        with open(os.path.join(directory, name), 'rb') as f:
+            audio = f.read()
+        with open(reference_path, encoding='utf-8') as f:
+            corpus.append((name, audio, f.read().strip()))
+    return corpus
+
+def normalize(text):
+    return re.sub(r"[^a-z0-9' ]+", ' ', text.lower()).split()
+
+def word_error_rate(reference, hypothesis):
+    """Word-level edit distance divided by the reference length"""
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / max(len(ref), 1)
+
+def command_of(text):
+    """What the bot would do with the text: (is meal plan request, days)"""
+    text = text.lower()
+    day_match = re.search(r'(\d+)\s*day', text)
+    return (any(keyword in text for keyword in MEAL_KEYWORDS),
+            min(int(day_match.group(1)), 7) if day_match else 1)
+
+def run_backend(transcriber, corpus):
+    latencies, wers, commands_ok, failures = [], [], 0, 0
+    for name, audio, reference in corpus:
+        start = time.perf_counter()
+        try:
+            text = transcriber.transcribe(audio) or ''
+        except Exception as e:
+            print(f"  ❌ {name}: {e}")
+            failures += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        wers.append(word_error_rate(reference, text))
+        commands_ok += command_of(text) == command_of(reference)
+    return latencies, wers, commands_ok, failures
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    backends = ['api', 'local']
+    for arg in sys.argv[1:]:
+        if arg.startswith('--backends='):
+            backends = arg.split('=', 1)[1].split(',')
+
+    corpus = load_corpus(args[0] if args else 'stt_corpus')
+    if not corpus:
+        print("❌ No audio files with .txt references found")
+        return
+
+    from stt_backends import create_transcriber
+    client = None
+    if any(name != 'local' for name in backends):
+        import openai
+        client = openai.OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+
+    print(f"🎤 STT benchmark on {len(corpus)} clips")
+    print("=" * 60)
+    for backend_name in backends:
+        transcriber = create_transcriber(client, backend_name)
+        if transcriber.local is not None:
+            # Model load and pool start-up are one-off costs, keep them out of the latencies
+            transcriber.local.warm_up()
+        latencies, wers, commands_ok, failures = run_backend(transcriber, corpus)
+        if not latencies:
+            print(f"{backend_name:>6}: all {failures} clips failed")
+            continue
+        p95 = sorted(latencies)[max(int(len(latencies) * 0.95) - 1, 0)]
+        print(f"{backend_name:>6}: median {statistics.median(latencies) * 1000:7.0f} ms | "
+              f"p95 {p95 * 1000:7.0f} ms | WER {statistics.mean(wers):.3f} | "
+              f"commands {commands_ok}/{len(corpus)} | failures {failures}")
+        if transcriber.local is not None:
+            transcriber.local.shutdown()
+
+if __name__ == "__main__":
+    main()
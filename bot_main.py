@@ -4,11 +4,26 @@ NutritionGPT Bot - Fixed Version with Lambda Support
 Handles meal planning, shopping lists, and voice commands
 """
 import telebot
-import json
 import os
 import logging
 from ai_service import AIService
 from config import load_config
+from parallel_steps import run_steps
+from user_store import create_user_store
+from shopping_list import ShoppingList
+from meal_plan_stream import STREAM_MEAL_PLANS, ThrottledMessageEditor
+from meal_plans import format_meal_plan
+from meal_plan_batch import weekly_command
+from resilience import telebot_request_sender
+from voice_audio import download_voice
+from rate_limiter import rate_limit_message, RateLimitExceeded
+from intent_parser import (
+    parse_intent, PLAN_MEALS, DECLINE_PLAN, SHOW_SHOPPING, ADD_SHOPPING, REMOVE_SHOPPING, CLEAR_SHOPPING, HELP
+)
+
+# Per-step timeouts (seconds) for the concurrent meal plan pipeline
+REPLY_TIMEOUT = 15
+SHOPPING_TIMEOUT = 45
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,11 +33,13 @@ class NutritionGPTBot:
     def __init__(self, config):
         """Initialize the bot with configuration"""
         self.config = config
+        # Bot API calls go through resilience.py and share http_pool's keep-alive connections
+        telebot.apihelper.CUSTOM_REQUEST_SENDER = telebot_request_sender
         self.bot = telebot.TeleBot(config['telegram_bot_token'])
-        self.ai_service = AIService()  # AIService gets API key from config automatically
         
-        # Local storage for user data (in production, use DynamoDB)
-        self.local_storage = {}
+        # Persistent user state (meal plans, shopping lists and library rotation)
+        self.user_store = create_user_store(table_name=config['dynamodb_table_name'])
+        self.ai_service = AIService(self.user_store)  # AIService gets API key from config automatically
         
         # Set up message handlers
         self.setup_handlers()
@@ -43,6 +60,10 @@ class NutritionGPTBot:
         def handle_shopping(message):
             self.handle_shopping_list(message)
         
+        @self.bot.message_handler(commands=['weekly'])
+        def handle_weekly(message):
+            self.handle_weekly_command(message)
+        
         @self.bot.message_handler(content_types=['voice'])
         def handle_voice(message):
             self.handle_voice_message(message)
@@ -106,6 +127,8 @@ class NutritionGPTBot:
             self.handle_meal_plan_command(message)
         elif command == '/shopping':
             self.handle_shopping_list(message)
+        elif command == '/weekly':
+            self.handle_weekly_command(message)
         else:
             self.bot.reply_to(message, "❓ Unknown command. Use /help for available commands.")
     
@@ -118,6 +141,7 @@ I'm your AI nutrition assistant. Here's what I can do:
 
 🍽️ **Meal Planning**
 • `/planmeals` - Generate a 1-7 day meal plan
+• `/weekly` - Get a fresh 7-day plan every week (`/weekly off` to stop)
 • Voice command: "plan meals" or "create meal plan"
 
 🛒 **Shopping Lists**
@@ -138,70 +162,41 @@ Ready to start? Try `/planmeals` or send a voice message!
         """
         self.bot.reply_to(message, welcome_message, parse_mode='HTML')
     
+    def handle_weekly_command(self, message):
+        """Handle /weekly subscription changes"""
+        reply = weekly_command(self.user_store, str(message.from_user.id), message.chat.id, message.text)
+        self.bot.reply_to(message, reply)
+    
     def handle_meal_plan_command(self, message):
         """Handle meal plan generation"""
+        print(f"Processing meal plan command from user {message.from_user.id}")
+        intent = parse_intent(message.text)
+        self.start_meal_plan(
+            message, intent.days, intent.preferences,
+            f"🍽️ Generating {intent.days}-day meal plan... Please wait."
+        )
+    
+    def start_meal_plan(self, message, days, preferences, status_text):
+        """Post a status message, generate the plan and deliver it"""
         try:
-            print(f"Processing meal plan command from user {message.from_user.id}")
-            
-            # Parse days from command (default to 1 day)
-            text = message.text.lower()
-            days = 1
-            if 'day' in text or 'days' in text:
-                import re
-                day_match = re.search(r'(\d+)\s*day', text)
-                if day_match:
-                    days = min(int(day_match.group(1)), 7)  # Max 7 days
-            
-            self.bot.reply_to(message, f"🍽️ Generating {days}-day meal plan... Please wait.")
+            status_message = self.bot.reply_to(message, status_text)
+            on_day, editor = self.plan_stream_editor(status_message, days)
             
             print("Calling AI service to generate meal plan...")
-            meal_plan_json = self.ai_service.generate_meal_plan(days=days)
+            meal_plan_json = self.ai_service.generate_meal_plan(
+                user_preferences=preferences, days=days, on_day=on_day, user_id=str(message.from_user.id)
+            )
             
             if meal_plan_json:
                 print("Meal plan generated successfully")
                 
-                # Save to local storage
-                user_id = str(message.from_user.id)
-                if user_id not in self.local_storage:
-                    self.local_storage[user_id] = {}
-                self.local_storage[user_id]['meal_plan'] = meal_plan_json
-                
-                formatted_plan = self.format_meal_plan(meal_plan_json, days)
-                self.bot.reply_to(message, formatted_plan, parse_mode='HTML')
-                
-                # Generate shopping list
-                print("Generating shopping list...")
-                shopping_items = self.ai_service.extract_shopping_items(meal_plan_json)
-                if shopping_items:
-                    print(f"Shopping items received: {shopping_items}")
-                    items_list = shopping_items.split('\n')
-                    for item in items_list:
-                        item = item.strip()
-                        if item:  # Remove the dash check - accept all non-empty items
-                            # Remove leading dash and space if present
-                            if item.startswith('- '):
-                                item = item[2:]
-                            elif item.startswith('-'):
-                                item = item[1:].strip()
-                            
-                            # Add to user's shopping list
-                            if user_id not in self.local_storage:
-                                self.local_storage[user_id] = {}
-                            if 'shopping_list' not in self.local_storage[user_id]:
-                                self.local_storage[user_id]['shopping_list'] = []
-                            
-                            if item not in self.local_storage[user_id]['shopping_list']:
-                                self.local_storage[user_id]['shopping_list'].append(item)
-                                print(f"Added to shopping list: {item}")
-                    
-                    self.bot.reply_to(message, "🛒 Shopping list updated with meal plan ingredients!")
-                else:
-                    print("No shopping items received")
-                    self.bot.reply_to(message, "⚠️ Could not generate shopping list from meal plan.")
+                self.deliver_meal_plan(message, meal_plan_json, days, editor=editor)
             else:
                 print("Failed to generate meal plan")
                 self.bot.reply_to(message, "❌ Sorry, I couldn't generate a meal plan right now. Please try again.")
                 
+        except RateLimitExceeded as e:
+            self.bot.reply_to(message, rate_limit_message(e))
         except Exception as e:
             print(f"Error generating meal plan: {e}")
             self.bot.reply_to(message, "❌ Sorry, there was an error generating your meal plan. Please try again.")
@@ -211,87 +206,163 @@ Ready to start? Try `/planmeals` or send a voice message!
         try:
             print(f"Processing voice message from user {message.from_user.id}")
             
-            # Download and transcribe voice
-            print("Downloading voice file...")
-            file_info = self.bot.get_file(message.voice.file_id)
-            downloaded_file = self.bot.download_file(file_info.file_path)
+            # Download and transcribe voice (skipped for notes already transcribed)
+            def fetch_audio():
+                print("Downloading voice file...")
+                file_info = self.bot.get_file(message.voice.file_id)
+                return download_voice(self.bot.token, file_info.file_path, file_info.file_size)
             
             print("Transcribing voice...")
-            transcription = self.ai_service.transcribe_voice(downloaded_file)
+            transcription = self.ai_service.transcribe_voice_message(
+                fetch_audio, message.voice.file_unique_id, message.voice.duration,
+                user_id=str(message.from_user.id)
+            )
             
             if transcription:
                 print(f"Voice transcribed: {transcription}")
-                transcription_lower = transcription.lower()
-                
-                # Check for meal planning keywords
-                if any(keyword in transcription_lower for keyword in ['plan', 'meal', 'food', 'diet']):
-                    # Extract number of days if mentioned
-                    days = 1
-                    import re
-                    day_match = re.search(r'(\d+)\s*day', transcription_lower)
-                    if day_match:
-                        days = min(int(day_match.group(1)), 7)
-                    
-                    self.bot.reply_to(message, f"🎤 Heard: '{transcription}'\n🍽️ Generating {days}-day meal plan...")
-                    
-                    meal_plan_json = self.ai_service.generate_meal_plan(days=days)
-                    if meal_plan_json:
-                        # Save to local storage
-                        user_id = str(message.from_user.id)
-                        if user_id not in self.local_storage:
-                            self.local_storage[user_id] = {}
-                        self.local_storage[user_id]['meal_plan'] = meal_plan_json
-                        
-                        formatted_plan = self.format_meal_plan(meal_plan_json, days)
-                        self.bot.reply_to(message, formatted_plan, parse_mode='HTML')
-                        
-                        # Generate shopping list
-                        print("Generating shopping list from voice command...")
-                        shopping_items = self.ai_service.extract_shopping_items(meal_plan_json)
-                        if shopping_items:
-                            print(f"Shopping items received: {shopping_items}")
-                            items_list = shopping_items.split('\n')
-                            for item in items_list:
-                                item = item.strip()
-                                if item:  # Remove the dash check - accept all non-empty items
-                                    # Remove leading dash and space if present
-                                    if item.startswith('- '):
-                                        item = item[2:]
-                                    elif item.startswith('-'):
-                                        item = item[1:].strip()
-                                    
-                                    # Add to user's shopping list
-                                    if user_id not in self.local_storage:
-                                        self.local_storage[user_id] = {}
-                                    if 'shopping_list' not in self.local_storage[user_id]:
-                                        self.local_storage[user_id]['shopping_list'] = []
-                                    
-                                    if item not in self.local_storage[user_id]['shopping_list']:
-                                        self.local_storage[user_id]['shopping_list'].append(item)
-                                        print(f"Added to shopping list: {item}")
-                            
-                            self.bot.reply_to(message, "🛒 Shopping list updated with meal plan ingredients!")
-                        else:
-                            print("No shopping items received")
-                            self.bot.reply_to(message, "⚠️ Could not generate shopping list from meal plan.")
-                    else:
-                        self.bot.reply_to(message, "❌ Sorry, I couldn't generate a meal plan. Please try again.")
-                else:
-                    self.bot.reply_to(message, f"🎤 I heard: '{transcription}'\n\n💡 Try saying 'plan meals' or 'create meal plan' to get started!")
+                self.handle_intent(message, parse_intent(transcription), heard=transcription)
             else:
                 print("Failed to transcribe voice")
                 self.bot.reply_to(message, "❌ Sorry, I couldn't understand your voice message. Please try again.")
                 
+        except RateLimitExceeded as e:
+            self.bot.reply_to(message, rate_limit_message(e))
         except Exception as e:
             print(f"Error transcribing voice: {e}")
             self.bot.reply_to(message, "❌ Sorry, there was an error processing your voice message. Please try again.")
     
+    def handle_intent(self, message, intent, heard=None):
+        """Route a parsed text or voice intent to its handler"""
+        heard_prefix = f"🎤 Heard: '{heard}'\n" if heard else ""
+        
+        if intent.name == PLAN_MEALS:
+            self.start_meal_plan(
+                message, intent.days, intent.preferences,
+                f"{heard_prefix}🍽️ Generating {intent.days}-day meal plan..."
+            )
+        elif intent.name == DECLINE_PLAN:
+            self.bot.reply_to(message, f"{heard_prefix}👍 No problem, no meal plan. Say 'plan meals' whenever you want one!")
+        elif intent.name == SHOW_SHOPPING:
+            self.handle_shopping_list(message)
+        elif intent.name in (ADD_SHOPPING, REMOVE_SHOPPING, CLEAR_SHOPPING):
+            self.bot.reply_to(message, heard_prefix + self.edit_shopping_list(str(message.from_user.id), intent))
+        elif intent.name == HELP:
+            self.handle_start_command(message)
+        elif heard:
+            self.bot.reply_to(message, f"🎤 I heard: '{heard}'\n\n💡 Try saying 'plan meals' or 'create meal plan' to get started!")
+        else:
+            self.bot.reply_to(message, "💡 I'm here to help with your nutrition! Try:\n• `/planmeals` - Generate meal plans\n• `/shopping` - View shopping list\n• Send voice messages for hands-free operation")
+    
+    def plan_stream_editor(self, status_message, days):
+        """Return (on_day, editor) that progressively edit status_message, or (None, None)"""
+        if not STREAM_MEAL_PLANS or status_message is None:
+            return None, None
+        
+        editor = ThrottledMessageEditor(lambda text: self.bot.edit_message_text(
+            text, status_message.chat.id, status_message.message_id, parse_mode='HTML'
+        ))
+        
+        def on_day(day, days_so_far):
+            editor.update(self.format_meal_plan({'days': days_so_far}, days) + "⏳ Generating...")
+        
+        return on_day, editor
+    
+    def deliver_meal_plan(self, message, meal_plan_json, days, editor=None):
+        """Send the formatted plan and extract shopping items concurrently
+        
+        With a streaming editor the final plan replaces the progressive message
+        instead of being sent as a new reply.
+        """
+        user_id = str(message.from_user.id)
+        
+        formatted_plan = self.format_meal_plan(meal_plan_json, days)
+        
+        def send_plan():
+            if editor is not None:
+                editor.update(formatted_plan)
+                if editor.flush():
+                    return
+                # The streamed message couldn't be replaced (bad HTML, too long): send the plan on its own
+            self.bot.reply_to(message, formatted_plan, parse_mode='HTML')
+        
+        print("Sending meal plan and generating shopping list...")
+        results = run_steps({
+            'reply': send_plan,
+            'shopping': lambda: self.ai_service.extract_shopping_items(meal_plan_json, user_id)
+        }, timeouts={'reply': REPLY_TIMEOUT, 'shopping': SHOPPING_TIMEOUT})
+        
+        if not results['reply'].ok:
+            print(f"Error sending meal plan: {results['reply'].error}")
+        
+        shopping_items = results['shopping'].value
+        
+        # Save plan and shopping list in one write
+        with self.user_store.batch():
+            self.user_store.update(user_id, lambda state: state.update(meal_plan=meal_plan_json))
+            if shopping_items:
+                print(f"Shopping items received: {shopping_items}")
+                self.add_shopping_items(user_id, shopping_items)
+        
+        if shopping_items:
+            self.bot.reply_to(message, "🛒 Shopping list updated with meal plan ingredients!")
+        else:
+            print("No shopping items received")
+            self.bot.reply_to(message, "⚠️ Could not generate shopping list from meal plan.")
+    
+    def add_shopping_items(self, user_id, shopping_items):
+        """Add extracted shopping items (one per line) to the user's list"""
+        items = []
+        for item in shopping_items.split('\n'):
+            item = item.strip()
+            if item:
+                # Remove leading dash and space if present
+                if item.startswith('- '):
+                    item = item[2:]
+                elif item.startswith('-'):
+                    item = item[1:].strip()
+                items.append(item)
+        
+        def add_items(state):
+            shopping_list = ShoppingList.from_list(state.get('shopping_list', []))
+            for item in items:
+                if shopping_list.add(item):
+                    print(f"Added to shopping list: {item}")
+            state['shopping_list'] = shopping_list.to_list()
+        
+        self.user_store.update(user_id, add_items)
+    
+    def edit_shopping_list(self, user_id, intent):
+        """Apply an add/remove/clear shopping intent and return the reply text"""
+        changed = []
+        
+        def edit(state):
+            del changed[:]
+            shopping_list = ShoppingList.from_list(state.get('shopping_list', []))
+            if intent.name == CLEAR_SHOPPING:
+                shopping_list = ShoppingList()
+            for item in intent.items:
+                if intent.name == ADD_SHOPPING:
+                    shopping_list.add(item)
+                    changed.append(item)
+                elif shopping_list.remove(item):
+                    changed.append(item)
+            state['shopping_list'] = shopping_list.to_list()
+        
+        self.user_store.update(user_id, edit)
+        if intent.name == CLEAR_SHOPPING:
+            return "🛒 Your shopping list is now empty."
+        if not changed:
+            return "🛒 I couldn't find those items on your shopping list."
+        verb = "Added to" if intent.name == ADD_SHOPPING else "Removed from"
+        return f"🛒 {verb} your shopping list: {', '.join(changed)}"
+    
     def handle_shopping_list(self, message):
         """Handle shopping list display"""
         user_id = str(message.from_user.id)
         
-        if user_id in self.local_storage and 'shopping_list' in self.local_storage[user_id]:
-            shopping_list = self.local_storage[user_id]['shopping_list']
+        state = self.user_store.get(user_id)
+        if 'shopping_list' in state:
+            shopping_list = state['shopping_list']
             if shopping_list:
                 list_text = "🛒 **Your Shopping List:**\n\n"
                 for i, item in enumerate(shopping_list, 1):
@@ -304,52 +375,11 @@ Ready to start? Try `/planmeals` or send a voice message!
     
     def handle_text_message(self, message):
         """Handle general text messages"""
-        text = message.text.lower()
-        
-        if any(keyword in text for keyword in ['meal', 'food', 'plan', 'diet']):
-            self.bot.reply_to(message, "🍽️ To generate a meal plan, use `/planmeals` or send a voice message saying 'plan meals'!")
-        else:
-            self.bot.reply_to(message, "💡 I'm here to help with your nutrition! Try:\n• `/planmeals` - Generate meal plans\n• `/shopping` - View shopping list\n• Send voice messages for hands-free operation")
+        self.handle_intent(message, parse_intent(message.text))
     
     def format_meal_plan(self, meal_plan_json, days):
         """Format meal plan for display"""
-        try:
-            # Parse JSON if it's a string
-            if isinstance(meal_plan_json, str):
-                # Remove markdown code blocks if present
-                if meal_plan_json.startswith('```json'):
-                    meal_plan_json = meal_plan_json[7:]
-                if meal_plan_json.endswith('```'):
-                    meal_plan_json = meal_plan_json[:-3]
-                
-                meal_plan = json.loads(meal_plan_json.strip())
-            else:
-                meal_plan = meal_plan_json
-            
-            formatted_text = f"🍽️ **{days}-Day Meal Plan**\n\n"
-            
-            for day_data in meal_plan.get('days', []):
-                day_num = day_data.get('day', 1)
-                formatted_text += f"**Day {day_num}**\n"
-                
-                meals = ['breakfast', 'lunch', 'dinner', 'snack']
-                for meal in meals:
-                    if meal in day_data:
-                        meal_info = day_data[meal]
-                        name = meal_info.get('name', 'Unknown')
-                        protein = meal_info.get('protein', 'N/A')
-                        calories = meal_info.get('calories', 'N/A')
-                        
-                        formatted_text += f"• **{meal.title()}**: {name}\n"
-                        formatted_text += f"  Protein: {protein} | Calories: {calories}\n"
-                
-                formatted_text += "\n"
-            
-            return formatted_text
-            
-        except Exception as e:
-            print(f"Error formatting meal plan: {e}")
-            return f"🍽️ **{days}-Day Meal Plan Generated!**\n\n✅ Your meal plan has been created and shopping list updated.\n\n💡 Use `/shopping` to view your ingredients list."
+        return format_meal_plan(meal_plan_json, days)
     
     def set_webhook(self, webhook_url=None):
         """Set Telegram webhook URL"""
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Offline job that pre-generates the meal plan library served by meal_plan_library.py
+Generates plans through AIService.generate_meal_plan for every (days, diet) combination, keeps the
+ones that validate and have the requested number of days, and writes them to the library file.
+Run it with OPENAI_API_KEY set, then deploy the file alongside the Lambda code:
+
+    python build_meal_plan_library.py --variants 5 --days 1-7 --diets none vegetarian vegan keto
+"""
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from intent_parser import DIETS
+from meal_plan_library import DEFAULT_LIBRARY_PATH, make_plan, read_library, write_library
+
+def parse_days(value):
+    """"1-7" or "1,3,7" -> [1, ..., 7]"""
+    days = set()
+    for part in value.split(','):
+        if '-' in part:
+            start, end = part.split('-', 1)
+            days.update(range(int(start), int(end) + 1))
+        else:
+            days.add(int(part))
+    return sorted(days)
+
+def build_service():
+    """AIService that always generates live: no cache, coalescing, library, optimizer or rate limits"""
+    from ai_service import AIService
+    service = AIService()
+    service.meal_plan_cache = None
+    service.meal_plan_flights = None
+    service.meal_plan_library = None
+    service.meal_plan_optimizer = None
+    service.rate_limiter = None
+    return service
+
+def generate(service, days, diet):
+    plan_json = service.generate_meal_plan(diet or "", days)
+    if not plan_json:
+        return None
+    return make_plan(plan_json, tags=[diet] if diet else [], days=days)
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate the meal plan library")
+    parser.add_argument('--variants', type=int, default=3, help="plans per (days, diet)")
+    parser.add_argument('--days', type=parse_days, default=parse_days('1-7'))
+    parser.add_argument('--diets', nargs='+', default=['none'] + sorted(set(DIETS.values()) - {'high protein'}),
+                        help="diet tags to build for ('none' for no diet)")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--output', default=DEFAULT_LIBRARY_PATH)
+    parser.add_argument('--append', action='store_true', help="keep the plans already in --output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    unknown = [diet for diet in args.diets if diet != 'none' and diet not in DIETS.values()]
+    if unknown:
+        sys.exit(f"Unknown diets: {', '.join(unknown)}")
+
+    plans = {}
+    if args.append and os.path.exists(args.output):
+        plans = {plan.id: plan for plan in read_library(args.output)}
+        print(f"📚 Starting from {len(plans)} existing plans")
+
+    service = build_service()
+    jobs = [
+        (days, '' if diet == 'none' else diet)
+        for days in args.days for diet in args.diets for _ in range(args.variants)
+    ]
+    print(f"🍽️ Generating {len(jobs)} meal plans with {args.workers} workers...")
+    failed = duplicates = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(generate, service, days, diet): (days, diet) for days, diet in jobs}
+        for count, future in enumerate(as_completed(futures), 1):
+            days, diet = futures[future]
+            try:
+                plan = future.result()
+            except Exception as e:
+                print(f"❌ {days}d {diet or 'no diet'}: {e}")
+                plan = None
+            if plan is None:
+                failed += 1
+            elif plan.id in plans:
+                duplicates += 1
+            else:
+                plans[plan.id] = plan
+            if count % 10 == 0 or count == len(jobs):
+                print(f"  {count}/{len(jobs)} done")
+
+    write_library(args.output, list(plans.values()))
+    print(f"✅ Wrote {len(plans)} plans to {args.output} ({failed} failed, {duplicates} duplicates)")
+    print(f"   {os.path.getsize(args.output) / 1024:.0f} KB")
+
+if __name__ == "__main__":
+    main()
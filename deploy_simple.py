@@ -9,8 +9,51 @@ import shutil
 import zipfile
 import boto3
 import subprocess
+import sys
 
-def create_deployment_package():
+# Helper modules imported by lambda_function_simple.py
+LAMBDA_MODULES = [
+    'update_dedup.py',
+    'http_pool.py',
+    'resilience.py',
+]
+
+# Helper modules imported by lambda_function_fast.py (deploy with --fast)
+FAST_LAMBDA_MODULES = [
+    'api_clients.py',
+    'lazy.py',
+    'meal_plans.py',
+    'nutrition.py',
+    'prompt_templates.py',
+    'meal_plan_schema.py',
+    'meal_plan_cache.py',
+    'preference_index.py',
+    'single_flight.py',
+    'meal_plan_library.py',
+    'meal_optimizer.py',
+    'meal_plan_batch.py',
+    'config.py',
+    'update_queue.py',
+    'update_dedup.py',
+    'http_pool.py',
+    'resilience.py',
+    'parallel_steps.py',
+    'shopping_extractor.py',
+    'shopping_list.py',
+    'user_store.py',
+    'transcription_cache.py',
+    'intent_parser.py',
+    'rate_limiter.py',
+]
+
+# Data read at runtime (with --fast); the library is built by build_meal_plan_library.py and shipped when present
+FAST_DATA_FILES = [
+    'nutrition_table.csv',
+    'recipes.csv',
+    'meal_plan_library.json.gz',
+]
+
+def create_deployment_package(fast=False):
     """Create the deployment package with minimal dependencies"""
     print("📦 Creating simplified deployment package...")
     
@@ -22,7 +65,13 @@ def create_deployment_package():
     os.makedirs('lambda_package', exist_ok=True)
     
     # Copy the simplified Lambda function
-    shutil.copy('lambda_function_simple.py', 'lambda_package/lambda_function.py')
+    handler = 'lambda_function_fast.py' if fast else 'lambda_function_simple.py'
+    shutil.copy(handler, 'lambda_package/lambda_function.py')
+    for module in (FAST_LAMBDA_MODULES if fast else LAMBDA_MODULES):
+        shutil.copy(module, os.path.join('lambda_package', module))
+    for data_file in (FAST_DATA_FILES if fast else []):
+        if os.path.exists(data_file):
+            shutil.copy(data_file, os.path.join('lambda_package', data_file))
     
     # Install minimal dependencies
     print("📥 Installing minimal dependencies...")
@@ -97,7 +146,7 @@ def main():
     print("=" * 50)
     
     # Create deployment package
-    zip_filename = create_deployment_package()
+    zip_filename = create_deployment_package(fast='--fast' in sys.argv)
     if not zip_filename:
         print("❌ Failed to create deployment package")
         return
@@ -6,10 +6,61 @@ This script packages and deploys the bot to AWS Lambda
 
 import os
 import shutil
+import subprocess
+import sys
 import zipfile
 import boto3
 import json
 from pathlib import Path
+from import_time_report import write_report
+
+# Helper modules imported by lambda_function_v2.py
+LAMBDA_MODULES = [
+    'meal_plan_cache.py',
+    'preference_index.py',
+    'prompt_templates.py',
+    'meal_plan_schema.py',
+    'single_flight.py',
+    'meal_plan_library.py',
+    'meal_optimizer.py',
+    'meal_plan_batch.py',
+    'api_clients.py',
+    'config.py',
+    'update_queue.py',
+    'update_dedup.py',
+    'http_pool.py',
+    'resilience.py',
+    'voice_audio.py',
+    'transcription_cache.py',
+    'stt_backends.py',
+    'intent_parser.py',
+    'rate_limiter.py',
+    'parallel_steps.py',
+    'shopping_extractor.py',
+    'shopping_list.py',
+    'lazy.py',
+    'meal_plan_stream.py',
+    'user_store.py',
+    'meal_plans.py',
+    'nutrition.py',
+]
+
+# Data read at runtime; the library is built by build_meal_plan_library.py and shipped when present
+DATA_FILES = [
+    'nutrition_table.csv',
+    'recipes.csv',
+    'meal_plan_library.json.gz',
+]
+
+def bundle_tiktoken_encodings(package_dir):
+    """Download tiktoken's BPE file into the package (prompt_templates.py uses it instead of fetching it)"""
+    cache_dir = os.path.abspath(os.path.join(package_dir, 'tiktoken_cache'))
+    result = subprocess.run(
+        [sys.executable, '-c', "import tiktoken; tiktoken.get_encoding('cl100k_base')"],
+        env=dict(os.environ, TIKTOKEN_CACHE_DIR=cache_dir)
+    )
+    if result.returncode != 0:
+        print("⚠️  Could not bundle tiktoken encodings; Lambda will estimate prompt tokens")
 
 def create_deployment_package():
     """Create the deployment package with all dependencies"""
@@ -24,10 +75,22 @@ def create_deployment_package():
     
     # Copy the main Lambda function
     shutil.copy('lambda_function_v2.py', 'lambda_package/lambda_function.py')
+    for module in LAMBDA_MODULES:
+        shutil.copy(module, os.path.join('lambda_package', module))
+    for data_file in DATA_FILES:
+        if os.path.exists(data_file):
+            shutil.copy(data_file, os.path.join('lambda_package', data_file))
     
     # Install dependencies
     print("📥 Installing dependencies...")
     os.system('pip install -r requirements.txt -t lambda_package --quiet')
+    bundle_tiktoken_encodings('lambda_package')
+    
+    # Report cold-start import cost so regressions are visible
+    try:
+        write_report('lambda_package')
+    except Exception as e:
+        print(f"⚠️  Could not profile import time: {e}")
     
     # Create ZIP file
     print("🗜️ Creating ZIP file...")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP connection pools for Telegram and OpenAI
+One keep-alive requests session per container with per-host pool sizes, tuned connect/read
+timeouts and counters for connection reuse and TCP+TLS handshake time
+"""
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05))
+
+# host -> (pool_maxsize, read_timeout); reads from OpenAI wait on generation, Telegram replies fast
+HOST_SETTINGS = {
+    'api.telegram.org': (int(os.environ.get('HTTP_TELEGRAM_POOL_SIZE', 10)),
+                         float(os.environ.get('HTTP_TELEGRAM_READ_TIMEOUT', 10))),
+    'api.openai.com': (int(os.environ.get('HTTP_OPENAI_POOL_SIZE', 10)),
+                       float(os.environ.get('HTTP_OPENAI_READ_TIMEOUT', 60))),
+}
+DEFAULT_SETTINGS = (4, 30.0)
+
+class PoolMetrics:
+    """Thread-safe per-host counters for requests, new connections and handshake time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host(self, host):
+        return self._hosts.setdefault(host, {
+            'requests': 0, 'connections': 0, 'handshake_total': 0.0, 'handshake_max': 0.0
+        })
+
+    def record_request(self, host):
+        with self._lock:
+            self._host(host)['requests'] += 1
+
+    def record_connect(self, host, elapsed):
+        with self._lock:
+            counters = self._host(host)
+            counters['connections'] += 1
+            counters['handshake_total'] += elapsed
+            counters['handshake_max'] = max(counters['handshake_max'], elapsed)
+
+    def stats(self):
+        """Per-host reuse ratio and handshake times (ms)"""
+        with self._lock:
+            result = {}
+            for host, counters in self._hosts.items():
+                requests_made, connections = counters['requests'], counters['connections']
+                result[host] = {
+                    'requests': requests_made,
+                    'connections': connections,
+                    'reused': max(requests_made - connections, 0),
+                    'reuse_ratio': round(1 - connections / requests_made, 3) if requests_made else 0.0,
+                    'handshake_avg_ms': round(counters['handshake_total'] / connections * 1000, 1) if connections else 0.0,
+                    'handshake_max_ms': round(counters['handshake_max'] * 1000, 1),
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._hosts.clear()
+
+metrics = PoolMetrics()
+
+class _MeteredConnectionMixin:
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        metrics.record_connect(self.host, time.perf_counter() - start)
+
+class MeteredHTTPConnection(_MeteredConnectionMixin, HTTPConnection):
+    pass
+
+class MeteredHTTPSConnection(_MeteredConnectionMixin, HTTPSConnection):
+    pass
+
+class MeteredHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = MeteredHTTPConnection
+
+class MeteredHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = MeteredHTTPSConnection
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter with metered connections and a default (connect, read) timeout"""
+
+    def __init__(self, read_timeout, **kwargs):
+        self.read_timeout = read_timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': MeteredHTTPConnectionPool,
+            'https': MeteredHTTPSConnectionPool,
+        }
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = (CONNECT_TIMEOUT, self.read_timeout)
+        metrics.record_request(urlsplit(request.url).hostname)
+        return super().send(request, timeout=timeout, **kwargs)
+
+_session = None
+_session_lock = threading.Lock()
+
+def create_session():
+    """Build a session with one adapter (and pool) per known host"""
+    session = requests.Session()
+    pool_size, read_timeout = DEFAULT_SETTINGS
+    default_adapter = PooledAdapter(read_timeout, pool_connections=4, pool_maxsize=pool_size)
+    session.mount('https://', default_adapter)
+    session.mount('http://', default_adapter)
+    for host, (pool_size, read_timeout) in HOST_SETTINGS.items():
+        session.mount(f'https://{host}/', PooledAdapter(read_timeout, pool_connections=1, pool_maxsize=pool_size))
+    return session
+
+def get_session():
+    """Shared keep-alive session, created on first use and reused across warm invocations"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+def log_metrics():
+    """Log pool stats (handy at the end of an invocation)"""
+    for host, stats in metrics.stats().items():
+        logger.info(f"HTTP pool {host}: {stats}")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Import-time profiling for the Lambda package
+Runs `python -X importtime` against the packaged handler and reports the slowest imports
+"""
+import json
+import os
+import subprocess
+import sys
+
+REPORT_FILE = 'import_time_report.txt'
+BASELINE_FILE = 'import_time_baseline.json'
+# Warn when the handler's total import time grows by more than this fraction
+REGRESSION_THRESHOLD = 0.2
+
+def parse_importtime(stderr):
+    """Parse -X importtime output into a list of (module, self_us, cumulative_us, depth)"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            _, data = line.split(':', 1)
+            self_us, cumulative_us, name = data.split('|')
+            depth = (len(name) - len(name.lstrip())) // 2
+            entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        except ValueError:
+            continue
+    return entries
+
+def profile_imports(module='lambda_function', package_dir='.', python=sys.executable):
+    """Import module in a fresh interpreter and return the parsed importtime entries"""
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=package_dir, capture_output=True, text=True,
+        env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+def build_report(entries, module='lambda_function', top=25):
+    """Format a report of total import time and the slowest top-level imports"""
+    total_us = next((cumulative for name, _, cumulative, _ in reversed(entries) if name == module), 0)
+    top_level = sorted((e for e in entries if e[3] == 1), key=lambda e: e[2], reverse=True)
+    slowest_self = sorted(entries, key=lambda e: e[1], reverse=True)
+
+    lines = [
+        f"Import time report for {module}",
+        f"Total: {total_us / 1000:.1f} ms across {len(entries)} modules",
+        "",
+        f"Top-level imports by cumulative time (top {top}):",
+    ]
+    for name, self_us, cumulative_us, _ in top_level[:top]:
+        lines.append(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+    lines.append("")
+    lines.append(f"Modules by self time (top {top}):")
+    for name, self_us, cumulative_us, _ in slowest_self[:top]:
+        lines.append(f"  {self_us / 1000:8.1f} ms  {name}")
+    return total_us, '\n'.join(lines) + '\n'
+
+def check_regression(total_us, baseline_file=BASELINE_FILE, threshold=REGRESSION_THRESHOLD):
+    """Compare against the saved baseline; returns a warning string or None"""
+    if not os.path.exists(baseline_file):
+        return None
+    with open(baseline_file) as f:
+        baseline_us = json.load(f).get('total_us', 0)
+    if baseline_us and total_us > baseline_us * (1 + threshold):
+        return (f"Import time regressed: {total_us / 1000:.1f} ms vs baseline "
+                f"{baseline_us / 1000:.1f} ms (+{(total_us / baseline_us - 1) * 100:.0f}%)")
+    return None
+
+def write_report(package_dir='lambda_package', module='lambda_function', report_file=REPORT_FILE,
+                 update_baseline=False):
+    """Profile the packaged handler, write the report and print a summary"""
+    print("⏱️ Profiling import time...")
+    entries = profile_imports(module, package_dir)
+    total_us, report = build_report(entries, module)
+    with open(report_file, 'w') as f:
+        f.write(report)
+    print(f"✅ Import time: {total_us / 1000:.1f} ms (report: {report_file})")
+
+    warning = check_regression(total_us)
+    if warning:
+        print(f"⚠️  {warning}")
+    if update_baseline:
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump({'module': module, 'total_us': total_us}, f)
+        print(f"📌 Baseline updated: {BASELINE_FILE}")
+    return total_us
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    write_report(args[0] if args else 'lambda_package', update_baseline='--update-baseline' in sys.argv)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Intent and slot parser for NutritionGPT messages and voice transcriptions
+Precompiled patterns only - decides what the user wants (meal plan, shopping list edits, help)
+without a GPT call, and pulls out the day count, dietary preferences and shopping items.
+"""
+import re
+from collections import namedtuple
+
+PLAN_MEALS = 'plan_meals'
+DECLINE_PLAN = 'decline_plan'
+SHOW_SHOPPING = 'show_shopping'
+ADD_SHOPPING = 'add_shopping'
+REMOVE_SHOPPING = 'remove_shopping'
+CLEAR_SHOPPING = 'clear_shopping'
+HELP = 'help'
+UNKNOWN = 'unknown'
+
+MAX_DAYS = 7
+
+Intent = namedtuple('Intent', ['name', 'days', 'preferences', 'items'])
+
+COMMANDS = {
+    '/start': HELP,
+    '/help': HELP,
+    '/planmeals': PLAN_MEALS,
+    '/shopping': SHOW_SHOPPING,
+}
+
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+    'eight': 8, 'nine': 9, 'ten': 10, 'couple': 2, 'few': 3, 'several': 3,
+}
+
+DIETS = {
+    'vegetarian': 'vegetarian', 'veggie': 'vegetarian', 'vegan': 'vegan', 'pescatarian': 'pescatarian',
+    'keto': 'keto', 'ketogenic': 'keto', 'paleo': 'paleo', 'mediterranean': 'mediterranean',
+    'halal': 'halal', 'kosher': 'kosher', 'low carb': 'low carb', 'high protein': 'high protein',
+    'low fat': 'low fat', 'low sodium': 'low sodium', 'low calorie': 'low calorie',
+    'gluten free': 'gluten free', 'dairy free': 'dairy free', 'nut free': 'nut free',
+}
+
+_LIST = r"(?:(?:my\s+|the\s+|our\s+)?(?:(?:shopping|grocery)(?:\s*list)?|groceries)|(?:my|the|our)\s+list)"
+# What a meal plan request plans: "plan" alone is too common ("planning a party", "my plan is to...")
+_FOOD = r"(?:meals?|food|eating|diet|menus?|breakfasts?|lunch(?:es)?|dinners?|snacks?)"
+
+DAYS_RE = re.compile(
+    r"\b(\d+|" + '|'.join(NUMBER_WORDS) + r")(?:\s+of)?\s*-?\s*(days?|weeks?)\b"
+)
+WEEKEND_RE = re.compile(r"\bweekend\b")
+WEEK_RE = re.compile(r"\bweek(?:ly)?\b")
+CLEAR_RE = re.compile(r"\b(?:clear|empty|reset|wipe|delete)\s+(?:out\s+)?(?:all\s+(?:of\s+)?)?" + _LIST + r"\b")
+ADD_RE = re.compile(
+    r"^(?:please\s+)?(?:can\s+you\s+)?(?:add|put|include|stick)\s+(?P<items>.+?)\s+(?:to|on|onto|in|into)\s+"
+    + _LIST + r"\b"
+)
+BUY_RE = re.compile(r"^(?:i\s+)?(?:need\s+to\s+|have\s+to\s+|must\s+)?buy\s+(?P<items>.+)$")
+REMOVE_RE = re.compile(
+    r"^(?:please\s+)?(?:can\s+you\s+)?(?:remove|delete|take|cross|scratch)\s+(?P<items>.+?)\s+"
+    r"(?:off|from|out\s+of)\s+(?:of\s+)?" + _LIST + r"\b"
+)
+SHOW_RE = re.compile(r"\b(?:shopping|grocery)\s*list\b|\bwhat\s+(?:do\s+)?i\s+need\s+to\s+buy\b")
+PLAN_RE = re.compile(
+    r"\bplan(?:s|ning)?(?:\s+\S+){0,4}?\s+" + _FOOD + r"\b"
+    r"|\b(?:meals?|food|eating|diet|menu)\s*(?:prep\s+)?plans?\b"
+    r"|\bmenu\b|\bmeal\s*prep\b|^(?:(?:so|ok|okay|hey|hi|and)\W*\s+)?what\s+(?:should|can|do)\s+i\s+eat\b"
+    r"|\b(?:make|create|generate|give|suggest|send|need|want|get)\b[^,.;!?]{0,30}\b(?:meals?|diet|breakfasts?|lunch(?:es)?|dinners?)\b"
+    r"|\bmeals?\s+for\b"
+    r"|\b(?:days?|weeks?|weekend)(?:'s|\s+worth)?\s+of\s+" + _FOOD + r"\b"
+)
+NEGATION_RE = re.compile(
+    r"\b(?:don'?t|do\s+not|doesn'?t|didn'?t|never|no\s+longer|stop|cancel)\b(?:\s+\w+){0,3}?\s+"
+    r"(?:want|need|like|mak(?:e|ing)|creat(?:e|ing)|generat(?:e|ing)|plan(?:ning)?|giv(?:e|ing)|send(?:ing)?|do)\b"
+    r"|\bno\s+(?:more\s+)?meal\s*plans?\b|\bnot\s+(?:a|any|another)\s+meal\s*plan\b"
+)
+HELP_RE = re.compile(r"^(?:help|hi|hello|hey|start|what\s+can\s+you\s+do|how\s+does\s+(?:this|it)\s+work)\b")
+DIET_RE = re.compile(r"\b(" + '|'.join(sorted(DIETS, key=len, reverse=True)).replace(' ', r'[\s-]') + r")\b")
+EXCLUDE_RE = re.compile(
+    r"\b(?:no|without|avoid(?:ing)?|excluding|allergic\s+to|free\s+of"
+    r"|(?:don'?t|do\s+not|can'?t|cannot)\s+(?:want|like|eat|have))\s+"
+    r"(?P<food>[a-z][a-z ]*?)(?=$|[,.;!?]|\s+(?:and|or|for|please|with|but|in|on)\b)"
+)
+# Excluded "foods" that are really the rest of a sentence ("i don't want a meal plan")
+NOT_FOOD_RE = re.compile(r"^(?:a|an|the|it|to|any|anything|meals?)\b")
+# Clause boundaries: a negation only declines the plan phrase in its own clause
+CLAUSE_RE = re.compile(r"[,.;!?]|\b(?:but|though|although)\b")
+CALORIES_RE = re.compile(r"\b(\d{3,4})\s*-?\s*(?:k?cals?|calories|calorie)\b")
+PROTEIN_RE = re.compile(r"\b(\d{2,3})\s*-?\s*g(?:rams?)?\s+(?:of\s+)?protein\b")
+ITEM_SPLIT_RE = re.compile(r"\s*,\s*(?:and\s+)?|\s+and\s+|\s*&\s*")
+ARTICLE_RE = re.compile(r"^(?:some|a|an|the|more)\s+")
+CLEAN_RE = re.compile(r"[‘’]")
+PUNCT_RE = re.compile(r"[.!?]+$")
+
+def normalize_text(text):
+    """Lowercase, straighten quotes and collapse whitespace"""
+    return PUNCT_RE.sub('', ' '.join(CLEAN_RE.sub("'", text or '').lower().split()))
+
+def parse_days(text, default=1):
+    """Day count mentioned in text ("3 days", "three days", "a week"), capped at MAX_DAYS"""
+    return _parse_days(normalize_text(text), default)
+
+def _parse_days(text, default=1):
+    match = DAYS_RE.search(text)
+    if match:
+        count, unit = match.groups()
+        count = int(count) if count.isdigit() else NUMBER_WORDS[count]
+        if unit.startswith('week'):
+            count *= 7
+        return max(1, min(count, MAX_DAYS))
+    if WEEKEND_RE.search(text):
+        return 2
+    if WEEK_RE.search(text):
+        return MAX_DAYS
+    return default
+
+def parse_preferences(text):
+    """Dietary preferences in text as a comma-separated string ("" if none)"""
+    return _parse_preferences(normalize_text(text))
+
+def _parse_preferences(text):
+    preferences = [DIETS[diet.replace('-', ' ')] for diet in DIET_RE.findall(text)]
+    for match in EXCLUDE_RE.finditer(text):
+        food = match.group('food').strip()
+        if food and not NOT_FOOD_RE.match(food):
+            preferences.append(f"no {food}")
+    calories = CALORIES_RE.search(text)
+    if calories:
+        preferences.append(f"{calories.group(1)} calories")
+    protein = PROTEIN_RE.search(text)
+    if protein:
+        preferences.append(f"{protein.group(1)}g protein")
+    return ', '.join(dict.fromkeys(preferences))
+
+def split_items(text):
+    """Split "eggs, milk and 2 apples" into ['eggs', 'milk', '2 apples']"""
+    items = []
+    for item in ITEM_SPLIT_RE.split(text):
+        item = ARTICLE_RE.sub('', item.strip())
+        if item:
+            items.append(item)
+    return items
+
+def _declined(text, match):
+    """True if the plan phrase at match is negated earlier in its clause ("i don't want a meal plan")"""
+    start = 0
+    for boundary in CLAUSE_RE.finditer(text, 0, match.start()):
+        start = boundary.end()
+    return NEGATION_RE.search(text, start, match.end()) is not None
+
+def parse_intent(text):
+    """Classify a message or transcription into an Intent with its slots"""
+    text = normalize_text(text)
+    if not text:
+        return Intent(UNKNOWN, None, '', [])
+
+    if text.startswith('/'):
+        command, _, rest = text.partition(' ')
+        name = COMMANDS.get(command.split('@')[0], UNKNOWN)
+        if name == PLAN_MEALS:
+            return Intent(name, _parse_days(rest), _parse_preferences(rest), [])
+        return Intent(name, None, '', [])
+
+    match = REMOVE_RE.search(text)
+    if match:
+        return Intent(REMOVE_SHOPPING, None, '', split_items(match.group('items')))
+    match = ADD_RE.search(text) or BUY_RE.search(text)
+    if match:
+        return Intent(ADD_SHOPPING, None, '', split_items(match.group('items')))
+    if CLEAR_RE.search(text):
+        return Intent(CLEAR_SHOPPING, None, '', [])
+    if SHOW_RE.search(text):
+        return Intent(SHOW_SHOPPING, None, '', [])
+
+    plans = list(PLAN_RE.finditer(text))
+    if plans:
+        if all(_declined(text, match) for match in plans):
+            return Intent(DECLINE_PLAN, None, '', [])
+        return Intent(PLAN_MEALS, _parse_days(text), _parse_preferences(text), [])
+
+    if HELP_RE.search(text):
+        return Intent(HELP, None, '', [])
+    return Intent(UNKNOWN, None, '', [])
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Fast Lambda Function for NutritionGPT Bot
+Same commands as lambda_function_v2.py, but talks to the Telegram and OpenAI HTTP APIs
+through api_clients.py - only `requests` is needed, no telebot or OpenAI SDK
+"""
+import json
+import logging
+import os
+from lazy import LazyObject
+from api_clients import OpenAIClient, TelegramClient
+from meal_plan_cache import create_meal_plan_cache, make_cache_key
+from single_flight import create_single_flight
+from preference_index import EMBEDDING_MODEL
+from meal_plan_library import create_meal_plan_library
+from meal_plan_batch import weekly_command
+from meal_optimizer import create_meal_plan_optimizer
+from update_queue import create_update_queue, drain_queue, is_valid_update
+from update_dedup import create_deduplicator
+from parallel_steps import run_steps
+from user_store import create_user_store
+from shopping_list import ShoppingList
+from shopping_extractor import extract_shopping_items_locally
+from transcription_cache import create_transcription_cache
+from rate_limiter import create_rate_limiter, estimate_tokens, rate_limit_message, RateLimitExceeded
+from resilience import log_metrics
+from intent_parser import (
+    parse_intent, PLAN_MEALS, DECLINE_PLAN, SHOW_SHOPPING, ADD_SHOPPING, REMOVE_SHOPPING, CLEAR_SHOPPING, HELP
+)
+from meal_plans import (
+    MEAL_PLAN_MODEL, MEAL_PLAN_TEMPERATURE, meal_plan_request, shopping_items_request, format_meal_plan,
+    generate_meal_plan_json
+)
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Clients are built on first use and reused across warm invocations
+openai_client = LazyObject(lambda: OpenAIClient(os.environ.get('OPENAI_API_KEY')), name='openai_client')
+telegram = LazyObject(lambda: TelegramClient(os.environ.get('TELEGRAM_BOT_TOKEN')), name='telegram')
+
+# Persistent user state (meal plans and shopping lists)
+user_store = create_user_store()
+
+# Meal plan cache (persists across warm invocations)
+meal_plan_cache = create_meal_plan_cache(embed=lambda texts: openai_client.embed(texts, EMBEDDING_MODEL))
+
+# Coalesces identical in-flight meal plan generations (SINGLE_FLIGHT_BACKEND)
+meal_plan_flights = create_single_flight()
+
+# Precomputed plans served without a model call (None until build_meal_plan_library.py has run)
+meal_plan_library = create_meal_plan_library(user_store)
+
+# Plans with calorie/protein targets assembled locally from recipes.csv (MEAL_OPTIMIZER)
+meal_plan_optimizer = create_meal_plan_optimizer()
+
+# Transcriptions of voice notes already seen (forwards skip download and Whisper)
+transcription_cache = create_transcription_cache()
+
+# Per-user and global OpenAI request/token budgets (RATE_LIMIT_BACKEND)
+rate_limiter = create_rate_limiter()
+
+# Processing mode: 'sync' handles updates inline, 'async' queues them for worker_handler
+PROCESSING_MODE = os.environ.get('PROCESSING_MODE', 'sync').lower()
+WORKER_CONCURRENCY = int(os.environ.get('UPDATE_QUEUE_CONCURRENCY', 4))
+update_queue = create_update_queue(shared=True) if PROCESSING_MODE == 'async' else None
+
+# Drops Telegram redeliveries by update_id and chat
+deduplicator = create_deduplicator()
+
+# Per-step timeouts (seconds) for the concurrent meal plan pipeline
+REPLY_TIMEOUT = 15
+SHOPPING_TIMEOUT = 45
+
+WELCOME_MESSAGE = """
+🤖 **Welcome to NutritionGPT!**
+
+I'm your AI nutrition assistant. Here's what I can do:
+
+🍽️ **Meal Planning**
+• `/planmeals` - Generate a 1-7 day meal plan
+• `/weekly` - Get a fresh 7-day plan every week (`/weekly off` to stop)
+• Voice command: "plan meals" or "create meal plan"
+
+🛒 **Shopping Lists**
+• `/shopping` - View your shopping list
+• Automatically created from meal plans
+
+🎤 **Voice Commands**
+• Send voice messages for hands-free operation
+• "Plan meals for 3 days"
+• "Add eggs to shopping list"
+
+💡 **Tips**
+• Focus on high-protein, healthy meals
+• Get detailed nutrition info
+• Manage ingredients automatically
+
+Ready to start? Try `/planmeals` or send a voice message!
+"""
+
+def reply(message, text, parse_mode=None):
+    """Reply to a Telegram message dict"""
+    return telegram.send_message(
+        message['chat']['id'], text, parse_mode=parse_mode, reply_to_message_id=message.get('message_id')
+    )
+
+def limit_openai_call(user_id, request=None):
+    """Reserve rate limit capacity for one OpenAI call (raises RateLimitExceeded)"""
+    if rate_limiter is not None:
+        rate_limiter.acquire(user_id, estimate_tokens(request) if request else 0)
+
+def transcribe_voice(audio):
+    """Transcribe voice message using OpenAI Whisper"""
+    try:
+        return openai_client.transcribe(audio).lower()
+    except Exception as e:
+        logger.error(f"Error transcribing voice: {e}")
+        return None
+
+def transcribe_voice_message(voice, user_id=None):
+    """Download and transcribe a voice note (served from cache when possible)"""
+    def fetch_audio():
+        # Counted before the download so a shed request costs nothing
+        limit_openai_call(user_id)
+        file_info = telegram.get_file(voice['file_id'])
+        return telegram.download_file(file_info['file_path'])
+    if transcription_cache is None:
+        return transcribe_voice(fetch_audio())
+    return transcription_cache.transcribe(transcribe_voice, fetch_audio, voice.get('file_unique_id'))
+
+def generate_meal_plan(user_preferences="", days=1, user_id=None):
+    """Generate meal plan using OpenAI GPT (served from the library or cache when possible)
+
+    Cache misses count against user_id's rate limit and raise
+    RateLimitExceeded when it is used up.
+    """
+    if meal_plan_library is not None:
+        meal_plan_json = meal_plan_library.choose(days, user_preferences, user_id)
+        if meal_plan_json:
+            return meal_plan_json
+    if meal_plan_optimizer is not None:
+        meal_plan_json = meal_plan_optimizer.plan(days, user_preferences)
+        if meal_plan_json:
+            return meal_plan_json
+    def request_plan():
+        request = meal_plan_request(user_preferences, days)
+        limit_openai_call(user_id, request)
+        return request_meal_plan(user_preferences, days, request=request)
+    generate = lambda: generate_meal_plan_json(request_plan, days)
+    if meal_plan_flights is not None:
+        # Identical concurrent requests share one generation
+        generate = meal_plan_flights.wrap(
+            make_cache_key(days, user_preferences, MEAL_PLAN_MODEL, MEAL_PLAN_TEMPERATURE), generate
+        )
+    if meal_plan_cache is None:
+        return generate()
+    return meal_plan_cache.get_or_generate(
+        generate, days, user_preferences, model=MEAL_PLAN_MODEL, temperature=MEAL_PLAN_TEMPERATURE
+    )
+
+def request_meal_plan(user_preferences="", days=1, request=None):
+    """Request a new meal plan from OpenAI GPT (request: an already built meal_plan_request)"""
+    try:
+        return openai_client.chat_content(**(request or meal_plan_request(user_preferences, days)))
+    except Exception as e:
+        logger.error(f"Error generating meal plan: {e}")
+        return None
+
+def extract_shopping_items(meal_plan_text, user_id=None):
+    """Extract shopping list items from meal plan (locally, GPT as fallback)"""
+    shopping_items = extract_shopping_items_locally(meal_plan_text)
+    if shopping_items:
+        return shopping_items
+    logger.info("Local shopping list extraction failed, falling back to GPT")
+    try:
+        request = shopping_items_request(meal_plan_text)
+        limit_openai_call(user_id, request)
+        return openai_client.chat_content(**request)
+    except Exception as e:
+        logger.error(f"Error extracting shopping items: {e}")
+        return None
+
+def process_message(message):
+    """Process incoming message"""
+    try:
+        if message.get('voice'):
+            return handle_voice_message(message)
+        text = message.get('text')
+        if text:
+            if text.startswith('/'):
+                return handle_command(message)
+            return handle_text_message(message)
+        return "OK"
+    except Exception as e:
+        # Raised so the queue layer can retry (nack / batchItemFailures)
+        logger.error(f"Error processing message: {e}")
+        raise
+
+def handle_command(message):
+    """Handle bot commands"""
+    command = message['text'].split()[0].lower().split('@')[0]
+
+    if command in ['/start', '/help']:
+        reply(message, WELCOME_MESSAGE, parse_mode='HTML')
+    elif command == '/planmeals':
+        handle_meal_plan_command(message)
+    elif command == '/shopping':
+        handle_shopping_list(message)
+    elif command == '/weekly':
+        reply(message, weekly_command(user_store, str(message['from']['id']), message['chat']['id'], message['text']))
+    else:
+        reply(message, "❓ Unknown command. Use /help for available commands.")
+    return "OK"
+
+def handle_meal_plan_command(message):
+    """Handle meal plan generation"""
+    logger.info(f"Processing meal plan command from user {message['from']['id']}")
+    intent = parse_intent(message['text'])
+    return start_meal_plan(
+        message, intent.days, intent.preferences,
+        f"🍽️ Generating {intent.days}-day meal plan... Please wait."
+    )
+
+def start_meal_plan(message, days, preferences, status_text):
+    """Post a status message, generate the plan and deliver it"""
+    try:
+        reply(message, status_text)
+
+        meal_plan_json = generate_meal_plan(
+            user_preferences=preferences, days=days, user_id=str(message['from']['id'])
+        )
+        if meal_plan_json:
+            deliver_meal_plan(message, meal_plan_json, days)
+        else:
+            reply(message, "❌ Sorry, I couldn't generate a meal plan right now. Please try again.")
+    except RateLimitExceeded as e:
+        reply(message, rate_limit_message(e))
+    except Exception as e:
+        logger.error(f"Error generating meal plan: {e}")
+        reply(message, "❌ Sorry, there was an error generating your meal plan. Please try again.")
+    return "OK"
+
+def handle_voice_message(message):
+    """Handle voice messages"""
+    try:
+        logger.info(f"Processing voice message from user {message['from']['id']}")
+        transcription = transcribe_voice_message(message['voice'], str(message['from']['id']))
+
+        if not transcription:
+            reply(message, "❌ Sorry, I couldn't understand your voice message. Please try again.")
+        else:
+            return handle_intent(message, parse_intent(transcription), heard=transcription)
+    except RateLimitExceeded as e:
+        reply(message, rate_limit_message(e))
+    except Exception as e:
+        logger.error(f"Error processing voice message: {e}")
+        reply(message, "❌ Sorry, there was an error processing your voice message. Please try again.")
+    return "OK"
+
+def handle_intent(message, intent, heard=None):
+    """Route a parsed text or voice intent to its handler"""
+    heard_prefix = f"🎤 Heard: '{heard}'\n" if heard else ""
+
+    if intent.name == PLAN_MEALS:
+        return start_meal_plan(
+            message, intent.days, intent.preferences,
+            f"{heard_prefix}🍽️ Generating {intent.days}-day meal plan..."
+        )
+    elif intent.name == DECLINE_PLAN:
+        reply(message, f"{heard_prefix}👍 No problem, no meal plan. Say 'plan meals' whenever you want one!")
+    elif intent.name == SHOW_SHOPPING:
+        return handle_shopping_list(message)
+    elif intent.name in (ADD_SHOPPING, REMOVE_SHOPPING, CLEAR_SHOPPING):
+        reply(message, heard_prefix + edit_shopping_list(str(message['from']['id']), intent))
+    elif intent.name == HELP:
+        reply(message, WELCOME_MESSAGE, parse_mode='HTML')
+    elif heard:
+        reply(message, f"🎤 I heard: '{heard}'\n\n💡 Try saying 'plan meals' or 'create meal plan' to get started!")
+    else:
+        reply(message, "💡 I'm here to help with your nutrition! Try:\n• `/planmeals` - Generate meal plans\n• `/shopping` - View shopping list\n• Send voice messages for hands-free operation")
+    return "OK"
+
+def deliver_meal_plan(message, meal_plan_json, days):
+    """Send the formatted plan and extract shopping items concurrently"""
+    user_id = str(message['from']['id'])
+    formatted_plan = format_meal_plan(meal_plan_json, days)
+
+    results = run_steps({
+        'reply': lambda: reply(message, formatted_plan, parse_mode='HTML'),
+        'shopping': lambda: extract_shopping_items(meal_plan_json, user_id)
+    }, timeouts={'reply': REPLY_TIMEOUT, 'shopping': SHOPPING_TIMEOUT})
+
+    if not results['reply'].ok:
+        logger.error(f"Error sending meal plan: {results['reply'].error}")
+
+    shopping_items = results['shopping'].value
+
+    # Save plan and shopping list in one write
+    with user_store.batch():
+        user_store.update(user_id, lambda state: state.update(meal_plan=meal_plan_json))
+        if shopping_items:
+            add_shopping_items(user_id, shopping_items)
+
+    if shopping_items:
+        reply(message, "🛒 Shopping list updated with meal plan ingredients!")
+    else:
+        reply(message, "⚠️ Could not generate shopping list from meal plan.")
+
+def add_shopping_items(user_id, shopping_items):
+    """Add extracted shopping items (one per line) to the user's list"""
+    items = [line.strip().lstrip('-').strip() for line in shopping_items.split('\n')]
+
+    def add_items(state):
+        shopping_list = ShoppingList.from_list(state.get('shopping_list', []))
+        for item in items:
+            if item:
+                shopping_list.add(item)
+        state['shopping_list'] = shopping_list.to_list()
+
+    user_store.update(user_id, add_items)
+
+def edit_shopping_list(user_id, intent):
+    """Apply an add/remove/clear shopping intent and return the reply text"""
+    changed = []
+
+    def edit(state):
+        del changed[:]
+        shopping_list = ShoppingList.from_list(state.get('shopping_list', []))
+        if intent.name == CLEAR_SHOPPING:
+            shopping_list = ShoppingList()
+        for item in intent.items:
+            if intent.name == ADD_SHOPPING:
+                shopping_list.add(item)
+                changed.append(item)
+            elif shopping_list.remove(item):
+                changed.append(item)
+        state['shopping_list'] = shopping_list.to_list()
+
+    user_store.update(user_id, edit)
+    if intent.name == CLEAR_SHOPPING:
+        return "🛒 Your shopping list is now empty."
+    if not changed:
+        return "🛒 I couldn't find those items on your shopping list."
+    verb = "Added to" if intent.name == ADD_SHOPPING else "Removed from"
+    return f"🛒 {verb} your shopping list: {', '.join(changed)}"
+
+def handle_shopping_list(message):
+    """Handle shopping list display"""
+    shopping_list = user_store.get(str(message['from']['id'])).get('shopping_list')
+    if shopping_list:
+        list_text = "🛒 **Your Shopping List:**\n\n"
+        for i, item in enumerate(shopping_list, 1):
+            list_text += f"{i}. {item}\n"
+        reply(message, list_text, parse_mode='HTML')
+    else:
+        reply(message, "🛒 Your shopping list is empty.\n\n💡 Generate a meal plan with `/planmeals` to add ingredients!")
+    return "OK"
+
+def handle_text_message(message):
+    """Handle general text messages"""
+    return handle_intent(message, parse_intent(message['text']))
+
+def process_update(body):
+    """Process a Telegram update once, dropping redelivered duplicates"""
+    if deduplicator is None:
+        return dispatch_update(body)
+    processed, result = deduplicator.process_once(body, dispatch_update)
+    return result
+
+def dispatch_update(body):
+    """Dispatch a single Telegram update"""
+    if 'message' in body:
+        return process_message(body['message'])
+    elif 'callback_query' in body:
+        logger.info(f"Received callback query: {body['callback_query']}")
+        return "OK"
+    else:
+        logger.warning("No message or callback_query found in webhook")
+        return "OK"
+
+def lambda_handler(event, context):
+    """
+    AWS Lambda handler for Telegram webhook
+    """
+    try:
+        body = event.get('body', event)
+        if isinstance(body, str):
+            body = json.loads(body)
+
+        if PROCESSING_MODE == 'async':
+            # Ack Telegram right away; worker_handler does the slow work
+            if is_valid_update(body):
+                update_queue.enqueue(body)
+            else:
+                logger.warning("Ignoring webhook body that is not a Telegram update")
+            result = "OK"
+        else:
+            try:
+                result = process_update(body)
+            except Exception as e:
+                # A non-200 makes Telegram redeliver and hold back later updates
+                logger.error(f"Error processing update: {e}")
+                result = "Error processing message"
+            log_metrics()
+
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps(result)
+        }
+    except Exception as e:
+        logger.error(f"Error in lambda_handler: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps(f'Error: {str(e)}')
+        }
+
+def worker_handler(event, context):
+    """Worker entry point for async mode (SQS records or a scheduled drain)"""
+    if event and 'Records' in event:
+        failures = []
+        for record in event['Records']:
+            try:
+                process_update(json.loads(record['body']))
+            except Exception as e:
+                logger.error(f"Error processing SQS record {record.get('messageId')}: {e}")
+                failures.append({'itemIdentifier': record.get('messageId')})
+        return {'batchItemFailures': failures}
+
+    return drain_queue(update_queue, process_update, concurrency=WORKER_CONCURRENCY)
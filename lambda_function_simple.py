@@ -6,13 +6,18 @@ This version avoids pydantic dependencies
 
 import json
 import os
-import requests
 import logging
+from update_dedup import create_deduplicator
+from http_pool import log_metrics
+from resilience import OPENAI, TELEGRAM, send_request, log_metrics as log_upstream_metrics
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Drops Telegram redeliveries by update_id and chat (kept across warm invocations)
+deduplicator = create_deduplicator()
+
 def lambda_handler(event, context):
     """Main Lambda handler function"""
     try:
@@ -57,7 +62,13 @@ def lambda_handler(event, context):
         # Process the Telegram update
         if telegram_update:
             logger.info("Processing Telegram update")
-            return handle_telegram_update(telegram_update, bot_token, openai_key)
+            if deduplicator is None:
+                return handle_telegram_update(telegram_update, bot_token, openai_key)
+            processed, result = deduplicator.process_once(
+                telegram_update,
+                lambda update: handle_telegram_update(update, bot_token, openai_key)
+            )
+            return result if processed else {'statusCode': 200, 'body': 'OK'}
         else:
             logger.info("Not a valid Telegram update")
             return {
@@ -103,6 +114,8 @@ def handle_telegram_update(update, bot_token, openai_key):
         
         # Send response to Telegram
         send_telegram_message(bot_token, chat_id, response_text)
+        log_metrics()
+        log_upstream_metrics()
         
         return {'statusCode': 200, 'body': 'OK'}
         
@@ -134,11 +147,10 @@ def generate_meal_plan(openai_key):
             'temperature': 0.7
         }
         
-        response = requests.post(
-            'https://api.openai.com/v1/chat/completions',
+        response = send_request(
+            OPENAI, 'post', 'https://api.openai.com/v1/chat/completions',
             headers=headers,
-            json=data,
-            timeout=30
+            json=data
         )
         
         if response.status_code == 200:
@@ -163,7 +175,7 @@ def send_telegram_message(bot_token, chat_id, text):
             'parse_mode': 'HTML'
         }
         
-        response = requests.post(url, json=data, timeout=10)
+        response = send_request(TELEGRAM, 'post', url, json=data)
         
         if response.status_code != 200:
             logger.error(f"Telegram API error: {response.status_code} - {response.text}")
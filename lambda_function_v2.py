@@ -1,147 +1,182 @@
 import json
 import logging
 import os
-import tempfile
-import requests
-import openai
-import telebot
-from telebot import types
+from lazy import LazyObject, lazy_import
+from meal_plan_cache import create_meal_plan_cache, make_cache_key
+from single_flight import create_single_flight
+from preference_index import sdk_embed
+from meal_plan_library import create_meal_plan_library
+from meal_plan_batch import weekly_command
+from meal_optimizer import create_meal_plan_optimizer
+from update_queue import create_update_queue, drain_queue, is_valid_update
+from update_dedup import create_deduplicator
+from parallel_steps import run_steps
+from user_store import create_user_store
+from shopping_list import ShoppingList
+from shopping_extractor import extract_shopping_items_locally
+from meal_plans import (
+    MEAL_PLAN_MODEL, MEAL_PLAN_TEMPERATURE, meal_plan_request, shopping_items_request, format_meal_plan,
+    generate_meal_plan_json
+)
+from meal_plan_stream import STREAM_MEAL_PLANS, ThrottledMessageEditor, stream_completion
+from voice_audio import download_voice, close_audio
+from transcription_cache import create_transcription_cache
+from stt_backends import create_transcriber
+from rate_limiter import create_rate_limiter, estimate_tokens, rate_limit_message, RateLimitExceeded
+from resilience import OPENAI, call, telebot_request_sender, log_metrics
+from intent_parser import (
+    parse_intent, PLAN_MEALS, DECLINE_PLAN, SHOW_SHOPPING, ADD_SHOPPING, REMOVE_SHOPPING, CLEAR_SHOPPING, HELP
+)
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize OpenAI client
-openai_client = openai.OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+# Heavy dependencies are imported on first use to keep cold starts short
+openai = lazy_import('openai')
+telebot = lazy_import('telebot')
+types = lazy_import('telebot.types')
 
-# Initialize Telegram bot
-bot = telebot.TeleBot(os.environ.get('TELEGRAM_BOT_TOKEN'))
+# Clients are built on first use and reused across warm invocations; retries are left to resilience.py
+openai_client = LazyObject(
+    lambda: openai.OpenAI(api_key=os.environ.get('OPENAI_API_KEY'), max_retries=0), name='openai_client'
+)
 
-# Local storage (in production, use DynamoDB)
-local_storage = {}
+def create_bot():
+    """TeleBot whose Bot API calls go through resilience.py and the shared http_pool session"""
+    telebot.apihelper.CUSTOM_REQUEST_SENDER = telebot_request_sender
+    return telebot.TeleBot(os.environ.get('TELEGRAM_BOT_TOKEN'))
 
-def transcribe_voice(voice_file_path):
-    """Transcribe voice message using OpenAI Whisper"""
+bot = LazyObject(create_bot, name='bot')
+
+# Persistent user state (meal plans and shopping lists)
+user_store = create_user_store()
+
+# Meal plan cache (persists across warm invocations); embeddings only with PREFERENCE_EMBEDDER=openai
+meal_plan_cache = create_meal_plan_cache(embed=sdk_embed(openai_client))
+
+# Coalesces identical in-flight meal plan generations (SINGLE_FLIGHT_BACKEND)
+meal_plan_flights = create_single_flight()
+
+# Precomputed plans served without a model call (None until build_meal_plan_library.py has run)
+meal_plan_library = create_meal_plan_library(user_store)
+
+# Plans with calorie/protein targets assembled locally from recipes.csv (MEAL_OPTIMIZER)
+meal_plan_optimizer = create_meal_plan_optimizer()
+
+# Transcriptions of voice notes already seen (forwards skip download and Whisper)
+transcription_cache = create_transcription_cache()
+
+# Speech-to-text: Whisper API, local model or routed by clip length (STT_BACKEND)
+transcriber = create_transcriber(openai_client)
+
+# Per-user and global OpenAI request/token budgets (RATE_LIMIT_BACKEND)
+rate_limiter = create_rate_limiter()
+
+# Processing mode: 'sync' handles updates inline, 'async' queues them for worker_handler
+PROCESSING_MODE = os.environ.get('PROCESSING_MODE', 'sync').lower()
+WORKER_CONCURRENCY = int(os.environ.get('UPDATE_QUEUE_CONCURRENCY', 4))
+update_queue = create_update_queue(shared=True) if PROCESSING_MODE == 'async' else None
+
+# Drops Telegram redeliveries by update_id and chat
+deduplicator = create_deduplicator()
+
+# Per-step timeouts (seconds) for the concurrent meal plan pipeline
+REPLY_TIMEOUT = 15
+SHOPPING_TIMEOUT = 45
+
+def limit_openai_call(user_id, request=None):
+    """Reserve rate limit capacity for one OpenAI call (raises RateLimitExceeded)"""
+    if rate_limiter is not None:
+        rate_limiter.acquire(user_id, estimate_tokens(request) if request else 0)
+
+def transcribe_voice(audio, duration=None):
+    """Transcribe voice message (bytes or a download stream) with the STT_BACKEND transcriber"""
     try:
-        with open(voice_file_path, 'rb') as audio_file:
-            transcript = openai_client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
-        return transcript.text.lower()
+        return transcriber.transcribe(audio, duration).lower()
     except Exception as e:
         logger.error(f"Error transcribing voice: {e}")
         return None
+    finally:
+        close_audio(audio)
 
-def generate_meal_plan(user_preferences="", days=1):
-    """Generate meal plan using OpenAI GPT"""
-    try:
-        prompt = f"""
-        Create a {days}-day meal plan with 3 meals (breakfast, lunch, dinner) and 1 snack per day.
-        Focus on high protein, healthy, and delicious meals.
-        
-        User preferences: {user_preferences if user_preferences else "No specific preferences"}
-        
-        Format the response as a JSON object with this structure:
-        {{
-            "days": [
-                {{
-                    "day": 1,
-                    "breakfast": {{"name": "meal name", "ingredients": ["ingredient1", "ingredient2"], "protein": "XXg", "calories": "XXX"}},
-                    "lunch": {{"name": "meal name", "ingredients": ["ingredient1", "ingredient2"], "protein": "XXg", "calories": "XXX"}},
-                    "dinner": {{"name": "meal name", "ingredients": ["ingredient1", "ingredient2"], "protein": "XXg", "calories": "XXX"}},
-                    "snack": {{"name": "snack name", "ingredients": ["ingredient1", "ingredient2"], "protein": "XXg", "calories": "XXX"}}
-                }}
-            ]
-        }}
-        
-        Make sure each meal has at least 20g of protein and is practical to cook.
-        """
-        
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a nutrition expert and meal planner. Provide healthy, protein-rich meal plans."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
+def transcribe_voice_message(voice, user_id=None):
+    """Download and transcribe a voice note (served from cache when possible)"""
+    def fetch_audio():
+        # Counted before the download so a shed request costs nothing
+        limit_openai_call(user_id)
+        logger.info("Downloading voice file...")
+        file_info = bot.get_file(voice.file_id)
+        return download_voice(bot.token, file_info.file_path, file_info.file_size)
+    transcribe = lambda audio: transcribe_voice(audio, voice.duration)
+    if transcription_cache is None:
+        return transcribe(fetch_audio())
+    return transcription_cache.transcribe(transcribe, fetch_audio, voice.file_unique_id)
+
+def generate_meal_plan(user_preferences="", days=1, on_day=None, user_id=None):
+    """Generate meal plan using OpenAI GPT (served from the library or cache when possible)
+    
+    If on_day is given the completion is streamed and on_day(day, days_so_far)
+    is called as each day of the plan arrives. Cache misses count against
+    user_id's rate limit and raise RateLimitExceeded when it is used up.
+    """
+    if meal_plan_library is not None:
+        meal_plan_json = meal_plan_library.choose(days, user_preferences, user_id)
+        if meal_plan_json:
+            return meal_plan_json
+    if meal_plan_optimizer is not None:
+        meal_plan_json = meal_plan_optimizer.plan(days, user_preferences)
+        if meal_plan_json:
+            return meal_plan_json
+    def request_plan():
+        request = meal_plan_request(user_preferences, days)
+        limit_openai_call(user_id, request)
+        if on_day is not None:
+            return stream_completion(openai_client, on_day, **request)
+        return request_meal_plan(user_preferences, days, request=request)
+    generate = lambda: generate_meal_plan_json(request_plan, days)
+    if meal_plan_flights is not None:
+        # Identical concurrent requests share one generation
+        generate = meal_plan_flights.wrap(
+            make_cache_key(days, user_preferences, MEAL_PLAN_MODEL, MEAL_PLAN_TEMPERATURE), generate
         )
+    if meal_plan_cache is None:
+        return generate()
+    return meal_plan_cache.get_or_generate(
+        generate, days, user_preferences, model=MEAL_PLAN_MODEL, temperature=MEAL_PLAN_TEMPERATURE
+    )
+
+def request_meal_plan(user_preferences="", days=1, request=None):
+    """Request a new meal plan from OpenAI GPT (request: an already built meal_plan_request)"""
+    try:
+        request = request or meal_plan_request(user_preferences, days)
+        response = call(OPENAI, lambda: openai_client.chat.completions.create(**request), hedge=True)
         
         return response.choices[0].message.content
     except Exception as e:
         logger.error(f"Error generating meal plan: {e}")
         return None
 
-def extract_shopping_items(meal_plan_text):
-    """Extract shopping list items from meal plan"""
+def extract_shopping_items(meal_plan_text, user_id=None):
+    """Extract shopping list items from meal plan (locally, GPT as fallback)"""
+    shopping_items = extract_shopping_items_locally(meal_plan_text)
+    if shopping_items:
+        return shopping_items
+    logger.info("Local shopping list extraction failed, falling back to GPT")
+    return request_shopping_items(meal_plan_text, user_id)
+
+def request_shopping_items(meal_plan_text, user_id=None):
+    """Extract shopping list items from meal plan using OpenAI GPT"""
     try:
-        prompt = f"""
-        Extract all unique ingredients needed for this meal plan. 
-        Combine similar items and provide quantities.
-        
-        Meal plan: {meal_plan_text}
-        
-        Return as a simple list of items, one per line, with quantities where appropriate.
-        Example:
-        - 2 lbs chicken breast
-        - 1 dozen eggs
-        - 1 lb spinach
-        """
-        
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that extracts shopping list items from meal plans."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3
-        )
+        request = shopping_items_request(meal_plan_text)
+        limit_openai_call(user_id, request)
+        response = call(OPENAI, lambda: openai_client.chat.completions.create(**request), hedge=True)
         
         return response.choices[0].message.content
     except Exception as e:
         logger.error(f"Error extracting shopping items: {e}")
         return None
 
-def format_meal_plan(meal_plan_json, days):
-    """Format meal plan for display"""
-    try:
-        # Parse JSON if it's a string
-        if isinstance(meal_plan_json, str):
-            # Remove markdown code blocks if present
-            if meal_plan_json.startswith('```json'):
-                meal_plan_json = meal_plan_json[7:]
-            if meal_plan_json.endswith('```'):
-                meal_plan_json = meal_plan_json[:-3]
-            
-            meal_plan = json.loads(meal_plan_json.strip())
-        else:
-            meal_plan = meal_plan_json
-        
-        formatted_text = f"🍽️ **{days}-Day Meal Plan**\n\n"
-        
-        for day_data in meal_plan.get('days', []):
-            day_num = day_data.get('day', 1)
-            formatted_text += f"**Day {day_num}**\n"
-            
-            meals = ['breakfast', 'lunch', 'dinner', 'snack']
-            for meal in meals:
-                if meal in day_data:
-                    meal_info = day_data[meal]
-                    name = meal_info.get('name', 'Unknown')
-                    protein = meal_info.get('protein', 'N/A')
-                    calories = meal_info.get('calories', 'N/A')
-                    
-                    formatted_text += f"• **{meal.title()}**: {name}\n"
-                    formatted_text += f"  Protein: {protein} | Calories: {calories}\n"
-            
-            formatted_text += "\n"
-        
-        return formatted_text
-        
-    except Exception as e:
-        logger.error(f"Error formatting meal plan: {e}")
-        return f"🍽️ **{days}-Day Meal Plan Generated!**\n\n✅ Your meal plan has been created and shopping list updated.\n\n💡 Use `/shopping` to view your ingredients list."
-
 def process_message(message_data):
     """Process incoming message"""
     try:
@@ -160,8 +195,9 @@ def process_message(message_data):
         return "OK"
         
     except Exception as e:
+        # Raised so the queue layer can retry (nack / batchItemFailures)
         logger.error(f"Error processing message: {e}")
-        return "Error processing message"
+        raise
 
 def handle_command(message):
     """Handle bot commands"""
@@ -173,6 +209,9 @@ def handle_command(message):
         return handle_meal_plan_command(message)
     elif command == '/shopping':
         return handle_shopping_list(message)
+    elif command == '/weekly':
+        bot.reply_to(message, weekly_command(user_store, str(message.from_user.id), message.chat.id, message.text))
+        return "OK"
     else:
         bot.reply_to(message, "❓ Unknown command. Use /help for available commands.")
         return "OK"
@@ -186,6 +225,7 @@ I'm your AI nutrition assistant. Here's what I can do:
 
 🍽️ **Meal Planning**
 • `/planmeals` - Generate a 1-7 day meal plan
+• `/weekly` - Get a fresh 7-day plan every week (`/weekly off` to stop)
 • Voice command: "plan meals" or "create meal plan"
 
 🛒 **Shopping Lists**
@@ -209,68 +249,34 @@ Ready to start? Try `/planmeals` or send a voice message!
 
 def handle_meal_plan_command(message):
     """Handle meal plan generation"""
+    logger.info(f"Processing meal plan command from user {message.from_user.id}")
+    intent = parse_intent(message.text)
+    return start_meal_plan(
+        message, intent.days, intent.preferences,
+        f"🍽️ Generating {intent.days}-day meal plan... Please wait."
+    )
+
+def start_meal_plan(message, days, preferences, status_text):
+    """Post a status message, generate the plan and deliver it"""
     try:
-        logger.info(f"Processing meal plan command from user {message.from_user.id}")
-        
-        # Parse days from command (default to 1 day)
-        text = message.text.lower()
-        days = 1
-        if 'day' in text or 'days' in text:
-            import re
-            day_match = re.search(r'(\d+)\s*day', text)
-            if day_match:
-                days = min(int(day_match.group(1)), 7)  # Max 7 days
-        
-        bot.reply_to(message, f"🍽️ Generating {days}-day meal plan... Please wait.")
+        status_message = bot.reply_to(message, status_text)
+        on_day, editor = plan_stream_editor(status_message, days)
         
         logger.info("Calling AI service to generate meal plan...")
-        meal_plan_json = generate_meal_plan(days=days)
+        meal_plan_json = generate_meal_plan(
+            user_preferences=preferences, days=days, on_day=on_day, user_id=str(message.from_user.id)
+        )
         
         if meal_plan_json:
             logger.info("Meal plan generated successfully")
             
-            # Save to local storage
-            user_id = str(message.from_user.id)
-            if user_id not in local_storage:
-                local_storage[user_id] = {}
-            local_storage[user_id]['meal_plan'] = meal_plan_json
-            
-            formatted_plan = format_meal_plan(meal_plan_json, days)
-            bot.reply_to(message, formatted_plan, parse_mode='HTML')
-            
-            # Generate shopping list
-            logger.info("Generating shopping list...")
-            shopping_items = extract_shopping_items(meal_plan_json)
-            if shopping_items:
-                logger.info(f"Shopping items received: {shopping_items}")
-                items_list = shopping_items.split('\n')
-                for item in items_list:
-                    item = item.strip()
-                    if item:
-                        # Remove leading dash and space if present
-                        if item.startswith('- '):
-                            item = item[2:]
-                        elif item.startswith('-'):
-                            item = item[1:].strip()
-                        
-                        # Add to user's shopping list
-                        if user_id not in local_storage:
-                            local_storage[user_id] = {}
-                        if 'shopping_list' not in local_storage[user_id]:
-                            local_storage[user_id]['shopping_list'] = []
-                        
-                        if item not in local_storage[user_id]['shopping_list']:
-                            local_storage[user_id]['shopping_list'].append(item)
-                            logger.info(f"Added to shopping list: {item}")
-                
-                bot.reply_to(message, "🛒 Shopping list updated with meal plan ingredients!")
-            else:
-                logger.info("No shopping items received")
-                bot.reply_to(message, "⚠️ Could not generate shopping list from meal plan.")
+            deliver_meal_plan(message, meal_plan_json, days, editor=editor)
         else:
             logger.info("Failed to generate meal plan")
             bot.reply_to(message, "❌ Sorry, I couldn't generate a meal plan right now. Please try again.")
             
+    except RateLimitExceeded as e:
+        bot.reply_to(message, rate_limit_message(e))
     except Exception as e:
         logger.error(f"Error generating meal plan: {e}")
         bot.reply_to(message, "❌ Sorry, there was an error generating your meal plan. Please try again.")
@@ -283,96 +289,156 @@ def handle_voice_message(message):
         logger.info(f"Processing voice message from user {message.from_user.id}")
         
         # Download and transcribe voice
-        logger.info("Downloading voice file...")
-        file_info = bot.get_file(message.voice.file_id)
-        downloaded_file = bot.download_file(file_info.file_path)
-        
-        # Save to temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.ogg') as temp_file:
-            temp_file.write(downloaded_file)
-            temp_file_path = temp_file.name
-        
-        logger.info("Transcribing voice...")
-        transcription = transcribe_voice(temp_file_path)
-        
-        # Clean up temp file
-        os.unlink(temp_file_path)
+        transcription = transcribe_voice_message(message.voice, str(message.from_user.id))
         
         if transcription:
             logger.info(f"Voice transcribed: {transcription}")
-            transcription_lower = transcription.lower()
-            
-            # Check for meal planning keywords
-            if any(keyword in transcription_lower for keyword in ['plan', 'meal', 'food', 'diet']):
-                # Extract number of days if mentioned
-                days = 1
-                import re
-                day_match = re.search(r'(\d+)\s*day', transcription_lower)
-                if day_match:
-                    days = min(int(day_match.group(1)), 7)
-                
-                bot.reply_to(message, f"🎤 Heard: '{transcription}'\n🍽️ Generating {days}-day meal plan...")
-                
-                meal_plan_json = generate_meal_plan(days=days)
-                if meal_plan_json:
-                    # Save to local storage
-                    user_id = str(message.from_user.id)
-                    if user_id not in local_storage:
-                        local_storage[user_id] = {}
-                    local_storage[user_id]['meal_plan'] = meal_plan_json
-                    
-                    formatted_plan = format_meal_plan(meal_plan_json, days)
-                    bot.reply_to(message, formatted_plan, parse_mode='HTML')
-                    
-                    # Generate shopping list
-                    logger.info("Generating shopping list from voice command...")
-                    shopping_items = extract_shopping_items(meal_plan_json)
-                    if shopping_items:
-                        logger.info(f"Shopping items received: {shopping_items}")
-                        items_list = shopping_items.split('\n')
-                        for item in items_list:
-                            item = item.strip()
-                            if item:
-                                # Remove leading dash and space if present
-                                if item.startswith('- '):
-                                    item = item[2:]
-                                elif item.startswith('-'):
-                                    item = item[1:].strip()
-                                
-                                # Add to user's shopping list
-                                if user_id not in local_storage:
-                                    local_storage[user_id] = {}
-                                if 'shopping_list' not in local_storage[user_id]:
-                                    local_storage[user_id]['shopping_list'] = []
-                                
-                                if item not in local_storage[user_id]['shopping_list']:
-                                    local_storage[user_id]['shopping_list'].append(item)
-                                    logger.info(f"Added to shopping list: {item}")
-                        
-                        bot.reply_to(message, "🛒 Shopping list updated with meal plan ingredients!")
-                    else:
-                        logger.info("No shopping items received")
-                        bot.reply_to(message, "⚠️ Could not generate shopping list from meal plan.")
-                else:
-                    bot.reply_to(message, "❌ Sorry, I couldn't generate a meal plan. Please try again.")
-            else:
-                bot.reply_to(message, f"🎤 I heard: '{transcription}'\n\n💡 Try saying 'plan meals' or 'create meal plan' to get started!")
+            return handle_intent(message, parse_intent(transcription), heard=transcription)
         else:
             logger.info("Failed to transcribe voice")
             bot.reply_to(message, "❌ Sorry, I couldn't understand your voice message. Please try again.")
             
+    except RateLimitExceeded as e:
+        bot.reply_to(message, rate_limit_message(e))
     except Exception as e:
         logger.error(f"Error transcribing voice: {e}")
         bot.reply_to(message, "❌ Sorry, there was an error processing your voice message. Please try again.")
     
     return "OK"
 
+def handle_intent(message, intent, heard=None):
+    """Route a parsed text or voice intent to its handler"""
+    heard_prefix = f"🎤 Heard: '{heard}'\n" if heard else ""
+    
+    if intent.name == PLAN_MEALS:
+        return start_meal_plan(
+            message, intent.days, intent.preferences,
+            f"{heard_prefix}🍽️ Generating {intent.days}-day meal plan..."
+        )
+    elif intent.name == DECLINE_PLAN:
+        bot.reply_to(message, f"{heard_prefix}👍 No problem, no meal plan. Say 'plan meals' whenever you want one!")
+    elif intent.name == SHOW_SHOPPING:
+        return handle_shopping_list(message)
+    elif intent.name in (ADD_SHOPPING, REMOVE_SHOPPING, CLEAR_SHOPPING):
+        bot.reply_to(message, heard_prefix + edit_shopping_list(str(message.from_user.id), intent))
+    elif intent.name == HELP:
+        return handle_start_command(message)
+    elif heard:
+        bot.reply_to(message, f"🎤 I heard: '{heard}'\n\n💡 Try saying 'plan meals' or 'create meal plan' to get started!")
+    else:
+        bot.reply_to(message, "💡 I'm here to help with your nutrition! Try:\n• `/planmeals` - Generate meal plans\n• `/shopping` - View shopping list\n• Send voice messages for hands-free operation")
+    return "OK"
+
+def plan_stream_editor(status_message, days):
+    """Return (on_day, editor) that progressively edit status_message, or (None, None)"""
+    if not STREAM_MEAL_PLANS or status_message is None:
+        return None, None
+    
+    editor = ThrottledMessageEditor(lambda text: bot.edit_message_text(
+        text, status_message.chat.id, status_message.message_id, parse_mode='HTML'
+    ))
+    
+    def on_day(day, days_so_far):
+        editor.update(format_meal_plan({'days': days_so_far}, days) + "⏳ Generating...")
+    
+    return on_day, editor
+
+def deliver_meal_plan(message, meal_plan_json, days, editor=None):
+    """Send the formatted plan and extract shopping items concurrently
+    
+    With a streaming editor the final plan replaces the progressive message
+    instead of being sent as a new reply.
+    """
+    user_id = str(message.from_user.id)
+    
+    formatted_plan = format_meal_plan(meal_plan_json, days)
+    
+    def send_plan():
+        if editor is not None:
+            editor.update(formatted_plan)
+            if editor.flush():
+                return
+            # The streamed message couldn't be replaced (bad HTML, too long): send the plan on its own
+        bot.reply_to(message, formatted_plan, parse_mode='HTML')
+    
+    logger.info("Sending meal plan and generating shopping list...")
+    results = run_steps({
+        'reply': send_plan,
+        'shopping': lambda: extract_shopping_items(meal_plan_json, user_id)
+    }, timeouts={'reply': REPLY_TIMEOUT, 'shopping': SHOPPING_TIMEOUT})
+    
+    if not results['reply'].ok:
+        logger.error(f"Error sending meal plan: {results['reply'].error}")
+    
+    shopping_items = results['shopping'].value
+    
+    # Save plan and shopping list in one write
+    with user_store.batch():
+        user_store.update(user_id, lambda state: state.update(meal_plan=meal_plan_json))
+        if shopping_items:
+            logger.info(f"Shopping items received: {shopping_items}")
+            add_shopping_items(user_id, shopping_items)
+    
+    if shopping_items:
+        bot.reply_to(message, "🛒 Shopping list updated with meal plan ingredients!")
+    else:
+        logger.info("No shopping items received")
+        bot.reply_to(message, "⚠️ Could not generate shopping list from meal plan.")
+
+def add_shopping_items(user_id, shopping_items):
+    """Add extracted shopping items (one per line) to the user's list"""
+    items = []
+    for item in shopping_items.split('\n'):
+        item = item.strip()
+        if item:
+            # Remove leading dash and space if present
+            if item.startswith('- '):
+                item = item[2:]
+            elif item.startswith('-'):
+                item = item[1:].strip()
+            items.append(item)
+    
+    def add_items(state):
+        shopping_list = ShoppingList.from_list(state.get('shopping_list', []))
+        for item in items:
+            if shopping_list.add(item):
+                logger.info(f"Added to shopping list: {item}")
+        state['shopping_list'] = shopping_list.to_list()
+    
+    user_store.update(user_id, add_items)
+
+def edit_shopping_list(user_id, intent):
+    """Apply an add/remove/clear shopping intent and return the reply text"""
+    changed = []
+
+    def edit(state):
+        del changed[:]
+        shopping_list = ShoppingList.from_list(state.get('shopping_list', []))
+        if intent.name == CLEAR_SHOPPING:
+            shopping_list = ShoppingList()
+        for item in intent.items:
+            if intent.name == ADD_SHOPPING:
+                shopping_list.add(item)
+                changed.append(item)
+            elif shopping_list.remove(item):
+                changed.append(item)
+        state['shopping_list'] = shopping_list.to_list()
+
+    user_store.update(user_id, edit)
+    if intent.name == CLEAR_SHOPPING:
+        return "🛒 Your shopping list is now empty."
+    if not changed:
+        return "🛒 I couldn't find those items on your shopping list."
+    verb = "Added to" if intent.name == ADD_SHOPPING else "Removed from"
+    return f"🛒 {verb} your shopping list: {', '.join(changed)}"
+
 def handle_shopping_list(message):
     """Handle shopping list display"""
     user_id = str(message.from_user.id)
     
-    if user_id in local_storage and 'shopping_list' in local_storage[user_id]:
-        shopping_list = local_storage[user_id]['shopping_list']
+    state = user_store.get(user_id)
+    if 'shopping_list' in state:
+        shopping_list = state['shopping_list']
         if shopping_list:
             list_text = "🛒 **Your Shopping List:**\n\n"
             for i, item in enumerate(shopping_list, 1):
@@ -387,14 +453,26 @@ def handle_shopping_list(message):
 
 def handle_text_message(message):
     """Handle general text messages"""
-    text = message.text.lower()
-    
-    if any(keyword in text for keyword in ['meal', 'food', 'plan', 'diet']):
-        bot.reply_to(message, "🍽️ To generate a meal plan, use `/planmeals` or send a voice message saying 'plan meals'!")
+    return handle_intent(message, parse_intent(message.text))
+
+def process_update(body):
+    """Process a Telegram update once, dropping redelivered duplicates"""
+    if deduplicator is None:
+        return dispatch_update(body)
+    processed, result = deduplicator.process_once(body, dispatch_update)
+    return result
+
+def dispatch_update(body):
+    """Dispatch a single Telegram update"""
+    if 'message' in body:
+        return process_message(body['message'])
+    elif 'callback_query' in body:
+        # Handle callback queries if needed
+        logger.info(f"Received callback query: {body['callback_query']}")
+        return "OK"
     else:
-        bot.reply_to(message, "💡 I'm here to help with your nutrition! Try:\n• `/planmeals` - Generate meal plans\n• `/shopping` - View shopping list\n• Send voice messages for hands-free operation")
-    
-    return "OK"
+        logger.warning("No message or callback_query found in webhook")
+        return "OK"
 
 def lambda_handler(event, context):
     """
@@ -413,16 +491,22 @@ def lambda_handler(event, context):
             
         logger.info(f"Parsed webhook body: {body}")
         
-        # Check if this is a Telegram webhook
-        if 'message' in body:
-            result = process_message(body['message'])
-        elif 'callback_query' in body:
-            # Handle callback queries if needed
-            logger.info(f"Received callback query: {body['callback_query']}")
+        if PROCESSING_MODE == 'async':
+            # Ack Telegram right away; worker_handler does the slow work
+            if is_valid_update(body):
+                update_queue.enqueue(body)
+                logger.info(f"Queued update {body['update_id']}")
+            else:
+                logger.warning("Ignoring webhook body that is not a Telegram update")
             result = "OK"
         else:
-            logger.warning("No message or callback_query found in webhook")
-            result = "OK"
+            try:
+                result = process_update(body)
+            except Exception as e:
+                # A non-200 makes Telegram redeliver and hold back later updates
+                logger.error(f"Error processing update: {e}")
+                result = "Error processing message"
+            log_metrics()
         
         return {
             'statusCode': 200,
@@ -446,4 +530,23 @@ def lambda_handler(event, context):
                 'Access-Control-Allow-Methods': 'POST, OPTIONS'
             },
             'body': json.dumps(f'Error: {str(e)}')
-        } 
\ No newline at end of file
+        }
+
+def worker_handler(event, context):
+    """
+    Worker entry point for async mode
+
+    Invoked by an SQS event source mapping (event has 'Records') or on a
+    schedule, in which case it drains the configured update queue.
+    """
+    if event and 'Records' in event:
+        failures = []
+        for record in event['Records']:
+            try:
+                process_update(json.loads(record['body']))
+            except Exception as e:
+                logger.error(f"Error processing SQS record {record.get('messageId')}: {e}")
+                failures.append({'itemIdentifier': record.get('messageId')})
+        return {'batchItemFailures': failures}
+    
+    return drain_queue(update_queue, process_update, concurrency=WORKER_CONCURRENCY)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Lazy imports and lazily constructed clients
+Heavy modules (openai, telebot) and their clients are built on first use instead of at cold start,
+then reused across warm Lambda invocations
+"""
+import importlib
+import threading
+
+class LazyObject:
+    """Proxy that calls factory() on first attribute access and forwards to the result"""
+
+    def __init__(self, factory, name=None):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_name', name or getattr(factory, '__name__', 'object'))
+        object.__setattr__(self, '_target', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _resolve(self):
+        target = object.__getattribute__(self, '_target')
+        if target is None:
+            with object.__getattribute__(self, '_lock'):
+                target = object.__getattribute__(self, '_target')
+                if target is None:
+                    target = object.__getattribute__(self, '_factory')()
+                    object.__setattr__(self, '_target', target)
+        return target
+
+    @property
+    def is_loaded(self):
+        return object.__getattribute__(self, '_target') is not None
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.is_loaded else 'not loaded'
+        return f"<lazy {object.__getattribute__(self, '_name')} ({state})>"
+
+def lazy_import(module_name):
+    """Return a proxy for module_name that imports it on first attribute access"""
+    return LazyObject(lambda: importlib.import_module(module_name), name=module_name)
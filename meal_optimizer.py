@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Local meal plan optimizer over a recipe table
+Requests with hard targets (a daily calorie goal, a protein minimum) are where the model most
+often misses and users regenerate. recipes.csv lists meals with quantified ingredients; their macros
+come from the nutrition table, and a greedy pass followed by local search picks a recipe per meal
+so every day lands in the calorie window and reaches the protein target, every main meal has at
+least 20 g of protein, no meal repeats on consecutive days and ingredients are reused across the
+plan (a shorter shopping list). It runs in milliseconds on one core; plans it can't make feasible
+fall through to generation.
+"""
+import csv
+import json
+import logging
+import os
+import random
+import time
+from collections import Counter, namedtuple
+
+from meal_plan_library import IMPLIED_TAGS, WORD_RE, exclusion_terms, parse_request, stem
+from meal_plan_schema import MEALS
+from nutrition import CALORIES, PROTEIN, CARBS, FAT, get_table
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RECIPES_PATH = os.environ.get(
+    'MEAL_OPTIMIZER_RECIPES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recipes.csv')
+)
+# Allowed distance of each day's calories from the requested target
+CALORIE_TOLERANCE = float(os.environ.get('MEAL_OPTIMIZER_CALORIE_TOLERANCE', 0.1))
+# Minimum protein of breakfast, lunch and dinner (the generation prompt asks the same)
+MIN_MEAL_PROTEIN = float(os.environ.get('MEAL_OPTIMIZER_MIN_MEAL_PROTEIN', 20))
+# Times a recipe may appear in one plan before it is penalized
+MAX_REPEATS = int(os.environ.get('MEAL_OPTIMIZER_MAX_REPEATS', 2))
+# Seconds of local search per plan
+TIME_BUDGET = float(os.environ.get('MEAL_OPTIMIZER_TIME_BUDGET', 0.05))
+MAX_ITERATIONS = 5000
+# Local search stops early after this many moves without an improvement
+PATIENCE = 1000
+
+# Penalty weights: anything >= HARD makes a plan infeasible
+HARD = 1000.0
+CALORIE_WEIGHT = 100.0
+REPEAT_WEIGHT = 10.0
+FOOD_WEIGHT = 0.5
+
+# Diets that follow from a recipe's macros (share of calories from carbs or fat)
+MACRO_DIETS = {'keto': (CARBS, 0.12), 'low carb': (CARBS, 0.26), 'low fat': (FAT, 0.30)}
+# On top of meal_plan_library's implied tags
+DIET_IMPLIES = {**IMPLIED_TAGS, 'vegetarian': {'pescatarian'}}
+
+Recipe = namedtuple('Recipe', ['name', 'meal', 'tags', 'ingredients', 'calories', 'protein', 'foods', 'terms'])
+
+def _tags(row, macros, terms):
+    tags = {tag for tag in row['tags'].split('|') if tag} | {'high protein'}
+    for tag in list(tags):
+        tags |= DIET_IMPLIES.get(tag, set())
+    energy = {CARBS: 4.0, FAT: 9.0}
+    for diet, (macro, share) in MACRO_DIETS.items():
+        if macros[CALORIES] and macros[macro] * energy[macro] <= share * macros[CALORIES]:
+            tags.add(diet)
+    if not exclusion_terms('nut') & terms:
+        tags.add('nut free')
+    return frozenset(tags)
+
+def load_recipes(path=DEFAULT_RECIPES_PATH, table=None):
+    """Recipes from the CSV with macros from the nutrition table (recipes with unknown ingredients are skipped)"""
+    table = table or get_table()
+    if table is None:
+        return []
+    recipes = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            ingredients = [item for item in row['ingredients'].split('|') if item]
+            macros = [0.0] * 4
+            foods = set()
+            for ingredient in ingredients:
+                food, grams = table.lookup(ingredient)
+                if food < 0:
+                    break
+                foods.add(food)
+                for macro in (CALORIES, PROTEIN, CARBS, FAT):
+                    macros[macro] += float(table.macros[food, macro]) * grams / 100.0
+            else:
+                if row['meal'] not in MEALS:
+                    logger.warning(f"Recipe {row['name']!r} has unknown meal {row['meal']!r}")
+                    continue
+                terms = frozenset(stem(word) for word in WORD_RE.findall(' '.join([row['name']] + ingredients).lower()))
+                recipes.append(Recipe(
+                    name=row['name'],
+                    meal=row['meal'],
+                    tags=_tags(row, macros, terms),
+                    ingredients=ingredients,
+                    calories=macros[CALORIES],
+                    protein=macros[PROTEIN],
+                    foods=frozenset(foods),
+                    terms=terms
+                ))
+                continue
+            logger.warning(f"Recipe {row['name']!r} has an ingredient missing from the nutrition table")
+    return recipes
+
+class MealPlanOptimizer:
+    """Picks recipes per meal to meet calorie/protein targets, variety and ingredient reuse
+
+    mode is 'targets' (only requests with a calorie or protein target) or
+    'always' (any request the recipe table can serve).
+    """
+
+    def __init__(self, path=DEFAULT_RECIPES_PATH, recipes=None, mode='targets', time_budget=TIME_BUDGET,
+                 calorie_tolerance=CALORIE_TOLERANCE, max_repeats=MAX_REPEATS, seed=None):
+        self.path = path
+        self.mode = mode
+        self.time_budget = time_budget
+        self.calorie_tolerance = calorie_tolerance
+        self.max_repeats = max_repeats
+        self.hits = 0
+        self.infeasible = 0
+        self.skipped = 0
+        self._recipes = recipes
+        self._random = random.Random(seed)
+
+    def recipes(self):
+        # Loaded on first use so a cold start that never plans meals doesn't pay for it
+        if self._recipes is None:
+            try:
+                self._recipes = load_recipes(self.path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Could not load recipes {self.path}: {e}")
+                self._recipes = []
+            logger.info(f"Loaded {len(self._recipes)} optimizer recipes from {self.path}")
+        return self._recipes
+
+    def candidates(self, tags=(), excluded=()):
+        """{meal: [recipe]} meeting the diets, exclusions and per-meal protein minimum"""
+        tags, excluded = set(tags), set(excluded)
+        by_meal = {meal: [] for meal in MEALS}
+        for recipe in self.recipes():
+            if not tags <= recipe.tags or excluded & recipe.terms:
+                continue
+            if recipe.meal != 'snack' and recipe.protein < MIN_MEAL_PROTEIN:
+                continue
+            by_meal[recipe.meal].append(recipe)
+        return by_meal
+
+    def score(self, plan, calories=None, protein=None):
+        """Penalty of a plan (list of days, each a list of recipes or None per meal); lower is better"""
+        penalty = 0.0
+        uses = Counter()
+        foods = set()
+        for index, day in enumerate(plan):
+            day_calories = day_protein = 0.0
+            filled = True
+            for slot, recipe in enumerate(day):
+                if recipe is None:
+                    filled = False
+                    continue
+                day_calories += recipe.calories
+                day_protein += recipe.protein
+                uses[recipe.name] += 1
+                foods |= recipe.foods
+                if index and plan[index - 1][slot] is recipe:
+                    penalty += HARD
+            if not filled:
+                # Partial day (greedy construction): only penalize overshooting
+                if calories and day_calories > calories * (1 + self.calorie_tolerance):
+                    penalty += HARD * (day_calories / calories - 1 - self.calorie_tolerance)
+                continue
+            if calories:
+                deviation = abs(day_calories - calories) / calories
+                penalty += CALORIE_WEIGHT * deviation ** 2
+                if deviation > self.calorie_tolerance:
+                    penalty += HARD * (1 + deviation - self.calorie_tolerance)
+            if protein and day_protein < protein:
+                penalty += HARD * (1 + (protein - day_protein) / protein)
+        penalty += REPEAT_WEIGHT * sum(max(0, count - self.max_repeats) for count in uses.values())
+        return penalty + FOOD_WEIGHT * len(foods)
+
+    def optimize(self, days, by_meal, calories=None, protein=None):
+        """(plan, penalty): greedy construction, then local search (replace one meal or swap two days' meals)"""
+        score = lambda plan: self.score(plan, calories, protein)
+        plan = [[None] * len(MEALS) for _ in range(days)]
+        for day in range(days):
+            for slot, meal in enumerate(MEALS):
+                options = self._random.sample(by_meal[meal], min(5, len(by_meal[meal])))
+                best = None
+                for recipe in options:
+                    plan[day][slot] = recipe
+                    penalty = score(plan)
+                    if best is None or penalty < best[0]:
+                        best = (penalty, recipe)
+                plan[day][slot] = best[1]
+
+        penalty = score(plan)
+        deadline = time.perf_counter() + self.time_budget
+        stale = 0
+        for iteration in range(MAX_ITERATIONS):
+            if stale > PATIENCE or (iteration % 100 == 0 and time.perf_counter() > deadline):
+                break
+            day, slot = self._random.randrange(days), self._random.randrange(len(MEALS))
+            if days > 1 and self._random.random() < 0.3:
+                other = self._random.randrange(days)
+                changes = [(day, plan[day][slot]), (other, plan[other][slot])]
+                plan[day][slot], plan[other][slot] = plan[other][slot], plan[day][slot]
+            else:
+                changes = [(day, plan[day][slot])]
+                plan[day][slot] = self._random.choice(by_meal[MEALS[slot]])
+            new_penalty = score(plan)
+            # Sideways moves are accepted so the search can drift across plateaus
+            if new_penalty <= penalty:
+                stale = 0 if new_penalty < penalty else stale + 1
+                penalty = new_penalty
+            else:
+                stale += 1
+                for changed, recipe in changes:
+                    plan[changed][slot] = recipe
+        return plan, penalty
+
+    def plan(self, days, user_preferences=""):
+        """Plan JSON meeting the request's targets, or None if it needs live generation"""
+        request = parse_request(user_preferences)
+        if request is None or (self.mode == 'targets' and request[2] is None and request[3] is None):
+            self.skipped += 1
+            return None
+        tags, excluded, calories, protein = request
+        by_meal = self.candidates(tags, excluded)
+        if not all(by_meal.values()):
+            self.infeasible += 1
+            logger.info(f"No recipes for every meal with preferences {user_preferences!r}")
+            return None
+
+        started = time.perf_counter()
+        plan, penalty = self.optimize(int(days), by_meal, calories, protein)
+        elapsed = (time.perf_counter() - started) * 1000
+        if penalty >= HARD:
+            self.infeasible += 1
+            logger.info(f"Optimizer found no feasible {days}-day plan for {user_preferences!r} ({elapsed:.0f}ms)")
+            return None
+        self.hits += 1
+        logger.info(f"Optimized {days}-day meal plan in {elapsed:.0f}ms (penalty {penalty:.1f})")
+        return json.dumps({'days': [
+            {'day': index + 1, **{
+                meal: {
+                    'name': recipe.name,
+                    'ingredients': list(recipe.ingredients),
+                    'protein': f"{recipe.protein:.0f}g",
+                    'calories': f"{recipe.calories:.0f}",
+                }
+                for meal, recipe in zip(MEALS, day)
+            }}
+            for index, day in enumerate(plan)
+        ]}, ensure_ascii=False)
+
+    def stats(self):
+        return {'hits': self.hits, 'infeasible': self.infeasible, 'skipped': self.skipped}
+
+def create_meal_plan_optimizer(mode=None, path=None):
+    """Optimizer from MEAL_OPTIMIZER (targets, always or off), or None when off or the recipes are missing"""
+    mode = (mode or os.environ.get('MEAL_OPTIMIZER', 'targets')).lower()
+    if mode == 'off':
+        return None
+    if mode not in ('targets', 'always'):
+        raise ValueError(f"Unknown MEAL_OPTIMIZER {mode}")
+    path = path or DEFAULT_RECIPES_PATH
+    if not os.path.exists(path):
+        return None
+    return MealPlanOptimizer(path, mode=mode)
@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+"""
+Scheduled weekly meal plans generated in batches
+Users who send /weekly get a fresh plan every week without one blocking generation per user. A
+scheduled `submit` run creates a job per subscriber, serves what the library or optimizer can
+answer locally and submits the rest as one OpenAI Batch API file (JSONL of /v1/chat/completions
+requests; BATCH_BACKEND=local runs the same file against the chat endpoint for development).
+Scheduled `poll` runs collect finished batches and deliver plans through a throttled Telegram
+sender. Job state lives in SQLite (BATCH_STORE_PATH, on a disk that outlives the runs), so every
+step can be re-run safely:
+
+    python meal_plan_batch.py submit    # Sundays
+    python meal_plan_batch.py poll      # every few minutes until everything is delivered
+"""
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+from intent_parser import parse_preferences
+from meal_plan_schema import parse_meal_plan_output
+from meal_plans import format_meal_plan, meal_plan_request
+from shopping_extractor import extract_shopping_items_locally
+from shopping_list import ShoppingList
+
+logger = logging.getLogger(__name__)
+
+WEEKLY_PLAN_DAYS = 7
+DEFAULT_STORE_PATH = os.environ.get('BATCH_STORE_PATH', '/tmp/nutritiongpt_batches.db')
+DEFAULT_LOCAL_DIR = os.environ.get('BATCH_LOCAL_DIR', '/tmp/nutritiongpt_batches')
+# OpenAI accepts up to 50,000 requests per batch file
+MAX_BATCH_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 50000))
+COMPLETION_WINDOW = '24h'
+BATCH_ENDPOINT = '/v1/chat/completions'
+# Telegram allows ~30 messages/second overall and about one per second to the same chat
+TELEGRAM_SEND_RATE = float(os.environ.get('TELEGRAM_SEND_RATE', 25))
+TELEGRAM_CHAT_INTERVAL = float(os.environ.get('TELEGRAM_CHAT_INTERVAL', 1.0))
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Seconds a poll run spends delivering before leaving the rest for the next run
+DELIVERY_SECONDS = float(os.environ.get('BATCH_DELIVERY_SECONDS', 600))
+
+# Job states: queued -> submitted -> completed -> delivered, or failed
+QUEUED, SUBMITTED, COMPLETED, DELIVERED, FAILED = 'queued', 'submitted', 'completed', 'delivered', 'failed'
+# Batch API states after which the output files are final
+FINAL_BATCH_STATES = {'completed', 'failed', 'expired', 'cancelled'}
+
+STOP_WORDS = {'off', 'stop', 'cancel', 'unsubscribe'}
+
+def subscribe(user_store, user_id, chat_id, preferences=""):
+    """Sign a user up for weekly plans"""
+    user_store.update(user_id, lambda state: state.update(weekly_plan={
+        'chat_id': chat_id, 'preferences': preferences, 'days': WEEKLY_PLAN_DAYS
+    }))
+
+def unsubscribe(user_store, user_id):
+    user_store.update(user_id, lambda state: state.pop('weekly_plan', None))
+
+def weekly_command(user_store, user_id, chat_id, text):
+    """Handle "/weekly [preferences]" or "/weekly off" and return the reply text
+
+    Subscriptions are refused unless user_store is shared: the batch job
+    reads them from its own process and would never see a memory store's.
+    """
+    argument = text.partition(' ')[2].strip()
+    if argument.lower() in STOP_WORDS:
+        unsubscribe(user_store, user_id)
+        return "📅 Weekly meal plans stopped. Send `/weekly` to start them again."
+    if not user_store.shared:
+        logger.warning("Refusing /weekly: USER_STORE_BACKEND must be dynamodb or sqlite for the batch job to see it")
+        return "⚠️ Weekly meal plans aren't available on this bot yet. Use /planmeals for a plan now."
+    preferences = parse_preferences(argument) if argument else ""
+    subscribe(user_store, user_id, chat_id, preferences)
+    details = f" ({preferences})" if preferences else ""
+    return (
+        f"📅 You're subscribed! Every week you'll get a fresh {WEEKLY_PLAN_DAYS}-day meal plan{details}.\n"
+        "Send `/weekly off` to stop."
+    )
+
+def subscribers(user_store):
+    """Iterate (user_id, subscription) over users with weekly plans"""
+    for user_id, state in user_store.scan():
+        subscription = state.get('weekly_plan')
+        if subscription and subscription.get('chat_id') is not None:
+            yield user_id, subscription
+
+def batch_line(custom_id, user_preferences="", days=WEEKLY_PLAN_DAYS):
+    """One request of a Batch API input file"""
+    return {
+        'custom_id': custom_id,
+        'method': 'POST',
+        'url': BATCH_ENDPOINT,
+        'body': meal_plan_request(user_preferences, days),
+    }
+
+def parse_output_line(line):
+    """(custom_id, content, error) from a Batch API output or error file line"""
+    custom_id = line.get('custom_id')
+    response = line.get('response') or {}
+    if line.get('error') or response.get('status_code') != 200:
+        error = line.get('error') or (response.get('body') or {}).get('error') or response.get('status_code')
+        return custom_id, None, str(error)
+    try:
+        return custom_id, response['body']['choices'][0]['message']['content'], None
+    except (KeyError, IndexError, TypeError):
+        return custom_id, None, "malformed response body"
+
+class OpenAIBatchBackend:
+    """OpenAI Batch API: upload the JSONL file, create a batch, read its output files once it ends
+
+    client is an api_clients.OpenAIClient (the pinned SDK predates the Batch API).
+    """
+
+    name = 'openai'
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, lines):
+        data = ''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in lines).encode('utf-8')
+        upload = self.client.upload_file(data, 'meal_plans.jsonl', purpose='batch')
+        batch = self.client.create_batch(
+            upload['id'], BATCH_ENDPOINT, completion_window=COMPLETION_WINDOW,
+            metadata={'kind': 'weekly_meal_plans'}
+        )
+        return batch['id']
+
+    def status(self, batch_id):
+        return self.client.retrieve_batch(batch_id)['status']
+
+    def results(self, batch_id):
+        batch = self.client.retrieve_batch(batch_id)
+        for file_id in (batch.get('output_file_id'), batch.get('error_file_id')):
+            if not file_id:
+                continue
+            for raw in self.client.file_content(file_id).splitlines():
+                if raw.strip():
+                    yield parse_output_line(json.loads(raw))
+
+class LocalBatchBackend:
+    """Stand-in for the Batch API: runs each request with complete(body) -> response dict on submit
+
+    Input and output files use the Batch API's format and are kept in
+    directory, so a batch can be inspected and polled like a real one.
+    """
+
+    name = 'local'
+
+    def __init__(self, complete, directory=DEFAULT_LOCAL_DIR, workers=4):
+        self.complete = complete
+        self.directory = directory
+        self.workers = workers
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, batch_id, kind):
+        return os.path.join(self.directory, f"{batch_id}.{kind}.jsonl")
+
+    def _run(self, line):
+        try:
+            body = self.complete(line['body'])
+            response, error = {'status_code': 200, 'body': body}, None
+        except Exception as e:
+            response, error = None, {'message': str(e)}
+        return {'id': f"response_{uuid.uuid4().hex}", 'custom_id': line['custom_id'],
+                'response': response, 'error': error}
+
+    def submit(self, lines):
+        batch_id = f"local_batch_{uuid.uuid4().hex}"
+        with open(self._path(batch_id, 'input'), 'w', encoding='utf-8') as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + '\n')
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            outputs = list(pool.map(self._run, lines))
+        tmp_path = self._path(batch_id, 'output') + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for output in outputs:
+                f.write(json.dumps(output, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self._path(batch_id, 'output'))
+        return batch_id
+
+    def status(self, batch_id):
+        return 'completed' if os.path.exists(self._path(batch_id, 'output')) else 'in_progress'
+
+    def results(self, batch_id):
+        with open(self._path(batch_id, 'output'), encoding='utf-8') as f:
+            for raw in f:
+                if raw.strip():
+                    yield parse_output_line(json.loads(raw))
+
+class BatchJobStore:
+    """SQLite record of weekly plan jobs and the batches they were submitted in"""
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "custom_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, chat_id INTEGER NOT NULL, "
+                "preferences TEXT NOT NULL, days INTEGER NOT NULL, status TEXT NOT NULL, "
+                "batch_id TEXT, plan TEXT, error TEXT, sent_chunks INTEGER NOT NULL DEFAULT 0, "
+                "updated_at REAL NOT NULL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if 'sent_chunks' not in columns:
+                # Stores created before delivery progress was tracked
+                conn.execute("ALTER TABLE jobs ADD COLUMN sent_chunks INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS batches ("
+                "batch_id TEXT PRIMARY KEY, backend TEXT NOT NULL, status TEXT NOT NULL, "
+                "requests INTEGER NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def add_job(self, custom_id, user_id, chat_id, preferences, days):
+        """Queue a job; returns False if custom_id already exists (a re-run of the same week)"""
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (custom_id, user_id, chat_id, preferences, days, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (custom_id, str(user_id), chat_id, preferences, days, QUEUED, time.time())
+            )
+            return cursor.rowcount == 1
+
+    def jobs(self, status, batch_id=None, limit=None):
+        """[(custom_id, user_id, chat_id, preferences, days, plan)] in the given state"""
+        query = "SELECT custom_id, user_id, chat_id, preferences, days, plan FROM jobs WHERE status = ?"
+        params = [status]
+        if batch_id is not None:
+            query += " AND batch_id = ?"
+            params.append(batch_id)
+        query += " ORDER BY updated_at, custom_id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._connect() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def set_status(self, custom_ids, status, batch_id=None, plan=None, error=None):
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for custom_id in custom_ids:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, batch_id = COALESCE(?, batch_id), plan = COALESCE(?, plan), "
+                        "error = ?, updated_at = ? WHERE custom_id = ?",
+                        (status, batch_id, plan, error, time.time(), custom_id)
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def sent_chunks(self, custom_id):
+        """Message chunks of a job's plan already delivered (a retried delivery resumes after them)"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT sent_chunks FROM jobs WHERE custom_id = ?", (custom_id,)).fetchone()
+        return row[0] if row else 0
+
+    def set_sent_chunks(self, custom_id, count):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET sent_chunks = ?, updated_at = ? WHERE custom_id = ?", (count, time.time(), custom_id)
+            )
+
+    def add_batch(self, batch_id, backend, requests):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO batches (batch_id, backend, status, requests, created_at, updated_at) "
+                "VALUES (?, ?, 'submitted', ?, ?, ?)",
+                (batch_id, backend, requests, now, now)
+            )
+
+    def open_batches(self):
+        """Ids of batches whose results haven't been collected"""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT batch_id FROM batches WHERE status != 'collected' ORDER BY created_at"
+            )]
+
+    def set_batch_status(self, batch_id, status):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE batches SET status = ?, updated_at = ? WHERE batch_id = ?", (status, time.time(), batch_id)
+            )
+
+    def counts(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+class ThrottledSender:
+    """Sends messages no faster than rate per second overall and chat_interval apart per chat"""
+
+    def __init__(self, send, rate=TELEGRAM_SEND_RATE, chat_interval=TELEGRAM_CHAT_INTERVAL):
+        self._send = send
+        self.interval = 1.0 / rate
+        self.chat_interval = chat_interval
+        self._next_at = 0.0
+        self._chat_next_at = {}
+
+    def send(self, chat_id, text, parse_mode=None):
+        now = time.monotonic()
+        wait = max(self._next_at, self._chat_next_at.get(chat_id, 0.0)) - now
+        if wait > 0:
+            time.sleep(wait)
+            now += wait
+        self._next_at = now + self.interval
+        self._chat_next_at[chat_id] = now + self.chat_interval
+        return self._send(chat_id, text, parse_mode=parse_mode)
+
+def split_message(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """Split text at paragraph breaks into chunks Telegram accepts"""
+    chunks, current = [], ""
+    for paragraph in text.split('\n\n'):
+        candidate = f"{current}\n\n{paragraph}" if current else paragraph
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        while len(paragraph) > limit:
+            chunks.append(paragraph[:limit])
+            paragraph = paragraph[limit:]
+        current = paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+def week_of(when=None):
+    """ISO week label, e.g. 2026-W42"""
+    year, week, _ = (when or datetime.date.today()).isocalendar()
+    return f"{year}-W{week:02d}"
+
+class WeeklyPlanRunner:
+    """Collects, submits, polls and delivers weekly plan jobs"""
+
+    def __init__(self, user_store, store, backend, sender=None, library=None, optimizer=None,
+                 max_batch_requests=MAX_BATCH_REQUESTS):
+        self.user_store = user_store
+        self.store = store
+        self.backend = backend
+        self.sender = sender
+        self.library = library
+        self.optimizer = optimizer
+        self.max_batch_requests = max_batch_requests
+
+    def collect(self, week=None):
+        """Queue one job per subscriber for the week; returns the number of new jobs"""
+        week = week or week_of()
+        added = 0
+        for user_id, subscription in subscribers(self.user_store):
+            added += self.store.add_job(
+                f"weekly-{week}-{user_id}", user_id, subscription['chat_id'],
+                subscription.get('preferences', ''), int(subscription.get('days', WEEKLY_PLAN_DAYS))
+            )
+        logger.info(f"Queued {added} weekly plan jobs for {week}")
+        return added
+
+    def _local_plan(self, user_id, preferences, days):
+        """Plan from the library or optimizer, or None if the model is needed"""
+        try:
+            if self.library is not None:
+                plan = self.library.choose(days, preferences, user_id)
+                if plan:
+                    return plan
+            if self.optimizer is not None:
+                return self.optimizer.plan(days, preferences)
+        except Exception as e:
+            logger.error(f"Local meal plan failed for user {user_id}: {e}")
+        return None
+
+    def submit(self):
+        """Complete queued jobs locally where possible and submit the rest; returns the batch ids"""
+        remote = []
+        for custom_id, user_id, _, preferences, days, _ in self.store.jobs(QUEUED):
+            plan = self._local_plan(user_id, preferences, days)
+            if plan:
+                self.store.set_status([custom_id], COMPLETED, plan=plan)
+            else:
+                remote.append(batch_line(custom_id, preferences, days))
+        batch_ids = []
+        for start in range(0, len(remote), self.max_batch_requests):
+            lines = remote[start:start + self.max_batch_requests]
+            batch_id = self.backend.submit(lines)
+            self.store.add_batch(batch_id, self.backend.name, len(lines))
+            self.store.set_status([line['custom_id'] for line in lines], SUBMITTED, batch_id=batch_id)
+            batch_ids.append(batch_id)
+        logger.info(f"Submitted {len(remote)} meal plan requests in {len(batch_ids)} batches")
+        return batch_ids
+
+    def poll(self):
+        """Store the results of batches that have finished; returns the number of plans collected"""
+        total = 0
+        for batch_id in self.store.open_batches():
+            status = self.backend.status(batch_id)
+            if status not in FINAL_BATCH_STATES:
+                self.store.set_batch_status(batch_id, status)
+                continue
+            collected = 0
+            days = {row[0]: row[4] for row in self.store.jobs(SUBMITTED, batch_id=batch_id)}
+            for custom_id, content, error in self.backend.results(batch_id):
+                plan = parse_meal_plan_output(content, days.get(custom_id)) if content else None
+                if plan is None:
+                    self.store.set_status([custom_id], FAILED, error=error or "meal plan output could not be parsed")
+                else:
+                    self.store.set_status([custom_id], COMPLETED, plan=json.dumps(plan, ensure_ascii=False))
+                    collected += 1
+            missing = [row[0] for row in self.store.jobs(SUBMITTED, batch_id=batch_id)]
+            if missing:
+                self.store.set_status(missing, FAILED, error=f"missing from the output of a {status} batch")
+            self.store.set_batch_status(batch_id, 'collected')
+            logger.info(f"Batch {batch_id} {status}: {collected} plans, {len(missing)} missing")
+            total += collected
+        return total
+
+    def _save_plan(self, user_id, plan, shopping_items):
+        def save(state):
+            state['meal_plan'] = plan
+            if shopping_items:
+                shopping_list = ShoppingList.from_list(state.get('shopping_list', []))
+                for line in shopping_items.split('\n'):
+                    item = line.strip().lstrip('-').strip()
+                    if item:
+                        shopping_list.add(item)
+                state['shopping_list'] = shopping_list.to_list()
+        self.user_store.update(user_id, save)
+
+    def deliver(self, seconds=DELIVERY_SECONDS):
+        """Send completed plans until done or out of time; returns the number delivered
+
+        A plan is saved to the user's state only once it has been sent. When
+        Telegram is unavailable (rate limited, 5xx, breaker open) the run stops
+        and the remaining plans stay completed for the next poll, which resumes
+        a long plan from its first chunk that wasn't delivered.
+        """
+        from api_clients import APIError
+        from resilience import CircuitOpen, is_retryable
+        deadline = time.monotonic() + seconds
+        delivered = 0
+        while time.monotonic() < deadline:
+            jobs = self.store.jobs(COMPLETED, limit=100)
+            if not jobs:
+                break
+            for custom_id, user_id, chat_id, _, days, plan in jobs:
+                if time.monotonic() >= deadline:
+                    break
+                shopping_items = extract_shopping_items_locally(plan)
+                try:
+                    text = format_meal_plan(plan, days)
+                    if shopping_items:
+                        text += "\n🛒 Your shopping list has this week's ingredients."
+                    chunks = split_message(f"📅 Your weekly meal plan is ready!\n\n{text}")
+                    sent = self.store.sent_chunks(custom_id)
+                    for index in range(sent, len(chunks)):
+                        self.sender.send(chat_id, chunks[index], parse_mode='HTML')
+                        self.store.set_sent_chunks(custom_id, index + 1)
+                except Exception as e:
+                    if isinstance(e, CircuitOpen) or is_retryable(e):
+                        logger.warning(f"Telegram unavailable ({e}), leaving the remaining plans for the next poll")
+                        # Ends this run: the while loop's deadline check fails too
+                        deadline = 0
+                        break
+                    if isinstance(e, APIError) and e.status_code == 403:
+                        # The user blocked the bot
+                        unsubscribe(self.user_store, user_id)
+                    logger.error(f"Error delivering weekly plan {custom_id}: {e}")
+                    self.store.set_status([custom_id], FAILED, error=str(e))
+                    continue
+                try:
+                    self._save_plan(user_id, plan, shopping_items)
+                except Exception as e:
+                    # Already sent - marking it failed would only send it again
+                    logger.error(f"Error saving weekly plan {custom_id}: {e}")
+                self.store.set_status([custom_id], DELIVERED)
+                delivered += 1
+        logger.info(f"Delivered {delivered} weekly meal plans")
+        return delivered
+
+def create_batch_backend(backend_name=None):
+    """Create a backend from BATCH_BACKEND (openai or local)"""
+    from api_clients import OpenAIClient
+    from config import OPENAI_API_KEY
+    client = OpenAIClient(OPENAI_API_KEY)
+    backend_name = (backend_name or os.environ.get('BATCH_BACKEND', 'openai')).lower()
+    if backend_name == 'local':
+        return LocalBatchBackend(lambda body: client.chat_completion(**body))
+    if backend_name != 'openai':
+        raise ValueError(f"Unknown BATCH_BACKEND {backend_name}")
+    return OpenAIBatchBackend(client)
+
+def create_runner(backend_name=None):
+    """Runner wired to the configured user store, batch backend, library, optimizer and Telegram bot"""
+    from api_clients import TelegramClient
+    from config import load_config
+    from meal_optimizer import create_meal_plan_optimizer
+    from meal_plan_library import create_meal_plan_library
+    from user_store import create_user_store
+
+    config = load_config()
+    user_store = create_user_store(table_name=config['dynamodb_table_name'], shared=True)
+    telegram = TelegramClient(config['telegram_bot_token'])
+    return WeeklyPlanRunner(
+        user_store,
+        BatchJobStore(),
+        create_batch_backend(backend_name),
+        sender=ThrottledSender(telegram.send_message),
+        library=create_meal_plan_library(user_store),
+        optimizer=create_meal_plan_optimizer()
+    )
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate and deliver weekly meal plans in batches")
+    parser.add_argument('step', choices=['submit', 'poll'],
+                        help="submit: queue and submit this week's jobs; poll: collect results and deliver")
+    parser.add_argument('--backend', help="openai or local (default BATCH_BACKEND)")
+    parser.add_argument('--week', help="week label for the jobs (default: this ISO week)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    runner = create_runner(args.backend)
+    if args.step == 'submit':
+        runner.collect(args.week)
+        runner.submit()
+    else:
+        runner.poll()
+        runner.deliver()
+    print(f"📊 Jobs: {runner.store.counts()}")
+
+if __name__ == "__main__":
+    main()
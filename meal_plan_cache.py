@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Meal plan response cache for NutritionGPT
+Avoids re-generating plans for identical (days, preferences, model, temperature) requests, and with a
+preference index (preference_index.py) for requests whose preferences are worded differently
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from preference_index import create_preference_index
+from rate_limiter import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+# Defaults (override with environment variables)
+DEFAULT_TTL_SECONDS = int(os.environ.get('MEAL_PLAN_CACHE_TTL', 7 * 24 * 3600))
+DEFAULT_MAX_ENTRIES = int(os.environ.get('MEAL_PLAN_CACHE_MAX_ENTRIES', 512))
+DEFAULT_FRESHNESS = float(os.environ.get('MEAL_PLAN_CACHE_FRESHNESS', 0.1))
+DEFAULT_MAX_VARIANTS = int(os.environ.get('MEAL_PLAN_CACHE_MAX_VARIANTS', 5))
+DEFAULT_CACHE_DIR = os.environ.get('MEAL_PLAN_CACHE_DIR', '/tmp/nutritiongpt_meal_plans')
+
+def normalize_preferences(user_preferences):
+    """Normalize free-text preferences so equivalent requests share a key"""
+    if not user_preferences:
+        return ""
+    parts = []
+    for part in str(user_preferences).replace(';', ',').replace('\n', ',').split(','):
+        part = ' '.join(part.lower().split())
+        if part and part not in parts:
+            parts.append(part)
+    return ', '.join(sorted(parts))
+
+def make_cache_key(days, user_preferences="", model="gpt-3.5-turbo", temperature=0.7):
+    """Build a stable cache key for a meal plan request"""
+    payload = json.dumps({
+        'days': int(days),
+        'preferences': normalize_preferences(user_preferences),
+        'model': model,
+        'temperature': round(float(temperature), 2)
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class MemoryCacheBackend:
+    """In-process LRU backend (survives warm Lambda invocations only)"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class DiskCacheBackend:
+    """Disk backend storing one JSON file per key, LRU by file mtime"""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            # Touch the file so it counts as recently used
+            os.utime(path, None)
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, entry):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._lock:
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(entry, f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.error(f"Error writing meal plan cache entry: {e}")
+                return
+            self._evict()
+
+    def _evict(self):
+        try:
+            files = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if name.endswith('.json')]
+        except OSError:
+            return
+        if len(files) <= self.max_entries:
+            return
+        files.sort(key=lambda path: os.path.getmtime(path))
+        for path in files[:len(files) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def __len__(self):
+        return len([name for name in os.listdir(self.directory) if name.endswith('.json')])
+
+class MealPlanCache:
+    """TTL + LRU cache of generated meal plans with hit/miss counters
+
+    Each key holds up to ``max_variants`` plans. ``freshness`` is the probability
+    that a cache hit still triggers a new generation, which is then mixed into
+    the stored variants so repeat users don't always get the same plan.
+    On an exact miss, ``preference_index`` can point at the key of a similar
+    earlier request.
+    """
+
+    def __init__(self, backend=None, ttl=DEFAULT_TTL_SECONDS, freshness=DEFAULT_FRESHNESS,
+                 max_variants=DEFAULT_MAX_VARIANTS, preference_index=None):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl
+        self.freshness = freshness
+        self.max_variants = max_variants
+        self.preference_index = preference_index
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.fresh_generations = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _fresh(self, entry):
+        """[(plan, added_at)] of an entry's unexpired variants
+
+        Each variant keeps the time it was added, so a plan from a freshness
+        re-roll lives its own TTL rather than expiring with the first one.
+        """
+        plans = entry.get('plans') or []
+        added = entry.get('added_at') or [entry.get('created_at', 0)] * len(plans)
+        now = time.time()
+        return [(plan, at) for plan, at in zip(plans, added) if not self.ttl or now - at <= self.ttl]
+
+    def get(self, key):
+        """Return a cached plan for key, or None if missing/expired"""
+        entry = self.backend.get(key)
+        if not entry:
+            return None
+        fresh = self._fresh(entry)
+        if not fresh:
+            self.backend.delete(key)
+            return None
+        return random.choice(fresh)[0]
+
+    def put(self, key, plan):
+        """Add a plan to the variants stored under key"""
+        entry = self.backend.get(key)
+        now = time.time()
+        variants = [(old, at) for old, at in (self._fresh(entry) if entry else []) if old != plan]
+        variants = (variants + [(plan, now)])[-self.max_variants:]
+        self.backend.set(key, {
+            'created_at': now,
+            'plans': [variant for variant, _ in variants],
+            'added_at': [at for _, at in variants],
+        })
+
+    def get_or_generate(self, generate, days, user_preferences="", model="gpt-3.5-turbo",
+                        temperature=0.7):
+        """Return a cached plan, calling generate() on a miss or freshness roll"""
+        key = make_cache_key(days, user_preferences, model, temperature)
+        cached = self.get(key)
+
+        if cached is not None and random.random() >= self.freshness:
+            self._count('hits')
+            logger.info(f"Meal plan cache hit ({days} days)")
+            self._index(key, days, user_preferences, model, temperature)
+            return cached
+
+        if cached is None:
+            similar = self._get_similar(days, user_preferences, model, temperature)
+            if similar is not None:
+                return similar
+            self._count('misses')
+        else:
+            self._count('fresh_generations')
+
+        try:
+            plan = generate()
+        except RateLimitExceeded:
+            if cached is None:
+                raise
+            # Only a freshness re-roll was turned away - the cached plan is still a good answer
+            logger.info(f"Rate limited on a freshness re-roll, serving the cached plan ({days} days)")
+            return cached
+        if plan:
+            self.put(key, plan)
+            self._index(key, days, user_preferences, model, temperature)
+            return plan
+
+        # Generation failed - a stale-but-valid cached plan beats an error
+        return cached
+
+    def _get_similar(self, days, user_preferences, model, temperature):
+        """A plan cached for similar preferences, or None"""
+        if self.preference_index is None:
+            return None
+        try:
+            match = self.preference_index.lookup(days, user_preferences, model, temperature)
+        except Exception as e:
+            logger.error(f"Preference index lookup failed: {e}")
+            return None
+        if match is None:
+            return None
+        key, similarity = match
+        cached = self.get(key)
+        if cached is not None:
+            self._count('similar_hits')
+            logger.info(f"Meal plan cache hit for similar preferences ({days} days, similarity {similarity:.2f})")
+        return cached
+
+    def _index(self, key, days, user_preferences, model, temperature):
+        if self.preference_index is None:
+            return
+        try:
+            self.preference_index.add(key, days, user_preferences, model, temperature)
+        except Exception as e:
+            logger.error(f"Could not index meal plan preferences: {e}")
+
+    def stats(self):
+        """Return hit/miss counters"""
+        lookups = self.hits + self.similar_hits + self.misses + self.fresh_generations
+        return {
+            'hits': self.hits,
+            'similar_hits': self.similar_hits,
+            'misses': self.misses,
+            'fresh_generations': self.fresh_generations,
+            'entries': len(self.backend),
+            'hit_rate': round((self.hits + self.similar_hits) / lookups, 3) if lookups else 0.0
+        }
+
+def create_meal_plan_cache(backend_name=None, embed=None):
+    """Create a cache from MEAL_PLAN_CACHE_BACKEND (memory, disk or none)
+
+    embed(texts) is used when PREFERENCE_EMBEDDER=openai.
+    """
+    backend_name = (backend_name or os.environ.get('MEAL_PLAN_CACHE_BACKEND', 'memory')).lower()
+    if backend_name == 'none':
+        return None
+    backend = DiskCacheBackend() if backend_name == 'disk' else MemoryCacheBackend()
+    return MealPlanCache(backend=backend, preference_index=create_preference_index(embed))
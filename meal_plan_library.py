@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Precomputed meal plan library served by local retrieval
+build_meal_plan_library.py generates and validates plans for common requests offline and writes
+them to one gzipped, pre-indexed JSON file. Requests whose preferences the library understands
+(diets, exclusions, calorie and protein targets) are answered from it in milliseconds, rotating
+plans per user so they don't repeat; anything unusual falls through to live generation.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+from collections import namedtuple
+
+from intent_parser import DIETS
+from meal_plan_cache import normalize_preferences
+from meal_plan_schema import MEALS, parse_meal_plan_output
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_VERSION = 1
+DEFAULT_LIBRARY_PATH = os.environ.get(
+    'MEAL_PLAN_LIBRARY_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'meal_plan_library.json.gz')
+)
+# How far a plan's average daily calories may be from the requested target
+CALORIE_TOLERANCE = float(os.environ.get('MEAL_PLAN_LIBRARY_CALORIE_TOLERANCE', 0.15))
+# Plans remembered per user so rotation doesn't repeat them
+ROTATION_MEMORY = int(os.environ.get('MEAL_PLAN_LIBRARY_ROTATION', 50))
+
+LibraryPlan = namedtuple('LibraryPlan', ['id', 'days', 'tags', 'calories', 'protein', 'terms', 'plan'])
+FIELDS = list(LibraryPlan._fields)
+
+DIET_TAGS = set(DIETS.values())
+# Every plan is generated high-protein; a vegan plan also satisfies these diets
+ALWAYS_TAGS = {'high protein'}
+IMPLIED_TAGS = {'vegan': {'vegetarian', 'dairy free'}}
+
+# Words an exclusion also rules out (an ingredient list rarely says "nuts" or "dairy")
+EXCLUSION_TERMS = {
+    'nut': ['almond', 'walnut', 'peanut', 'cashew', 'pecan', 'pistachio', 'hazelnut', 'macadamia'],
+    'dairy': ['milk', 'cheese', 'yogurt', 'yoghurt', 'butter', 'cream', 'whey', 'feta', 'parmesan',
+              'mozzarella', 'cheddar', 'ricotta', 'kefir'],
+    'lactose': ['milk', 'cheese', 'yogurt', 'yoghurt', 'cream', 'whey'],
+    'gluten': ['wheat', 'bread', 'pasta', 'barley', 'rye', 'couscous', 'tortilla', 'flour', 'bagel',
+               'noodle', 'cracker', 'seitan', 'oat'],
+    'meat': ['beef', 'pork', 'chicken', 'turkey', 'lamb', 'bacon', 'ham', 'sausage', 'steak', 'veal'],
+    'red meat': ['beef', 'pork', 'lamb', 'steak', 'veal', 'bacon', 'ham'],
+    'pork': ['bacon', 'ham', 'sausage', 'prosciutto'],
+    'fish': ['salmon', 'tuna', 'cod', 'tilapia', 'sardine', 'mackerel', 'trout', 'anchovy'],
+    'seafood': ['fish', 'salmon', 'tuna', 'cod', 'tilapia', 'shrimp', 'prawn', 'crab', 'lobster',
+                'scallop', 'mussel', 'sardine', 'mackerel', 'trout'],
+    'shellfish': ['shrimp', 'prawn', 'crab', 'lobster', 'scallop', 'mussel', 'oyster', 'clam'],
+    'egg': ['omelet', 'omelette', 'frittata', 'mayonnaise'],
+    'soy': ['tofu', 'tempeh', 'edamame', 'miso'],
+}
+STOP_WORDS = {'and', 'or', 'of', 'the', 'a', 'an', 'any', 'food', 'foods', 'product', 'products'}
+
+WORD_RE = re.compile(r"[a-z]+")
+NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+EXCLUDE_RE = re.compile(r"^no (.+)$")
+CALORIES_RE = re.compile(r"^(\d{3,4}) calories$")
+PROTEIN_RE = re.compile(r"^(\d{2,3})g protein$")
+
+def stem(word):
+    """Crude singular form so "eggs"/"egg" and "berries"/"berry" match"""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('oes', 'ches', 'shes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+def _terms(text):
+    return {stem(word) for word in WORD_RE.findall(text.lower())}
+
+def exclusion_terms(food):
+    """Stemmed words whose presence in a plan rules it out for "no <food>" (errs on the strict side)"""
+    words = [stem(word) for word in WORD_RE.findall(food.lower()) if word not in STOP_WORDS]
+    terms = set(words)
+    for key in {' '.join(words)} | terms:
+        terms.update(stem(term) for term in EXCLUSION_TERMS.get(key, []))
+    return terms
+
+def parse_request(user_preferences):
+    """(tags, excluded_terms, calories, protein) for preferences the library can serve, or None"""
+    tags, excluded, calories, protein = set(), set(), None, None
+    for part in filter(None, normalize_preferences(user_preferences).split(', ')):
+        if part in DIET_TAGS:
+            tags.add(part)
+        elif EXCLUDE_RE.match(part):
+            excluded |= exclusion_terms(EXCLUDE_RE.match(part).group(1))
+        elif CALORIES_RE.match(part):
+            calories = int(CALORIES_RE.match(part).group(1))
+        elif PROTEIN_RE.match(part):
+            protein = int(PROTEIN_RE.match(part).group(1))
+        else:
+            return None
+    return tags - ALWAYS_TAGS, excluded, calories, protein
+
+def _amount(value):
+    match = NUMBER_RE.search(str(value))
+    return float(match.group(0)) if match else 0.0
+
+def make_plan(plan_json, tags=(), days=None):
+    """Index a validated plan for the library (None if it doesn't parse or hasn't the expected days)"""
+    plan = parse_meal_plan_output(plan_json, days, record=False)
+    if plan is None:
+        return None
+    days = plan['days']
+    meals = [day[meal] for day in days for meal in MEALS]
+    text = ' '.join([meal['name'] for meal in meals] + [item for meal in meals for item in meal['ingredients']])
+    canonical = json.dumps(plan, ensure_ascii=False)
+    return LibraryPlan(
+        id=hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16],
+        days=len(days),
+        tags=frozenset(tags),
+        calories=round(sum(_amount(meal['calories']) for meal in meals) / len(days)),
+        protein=round(sum(_amount(meal['protein']) for meal in meals) / len(days)),
+        terms=frozenset(_terms(text)),
+        plan=canonical
+    )
+
+def write_library(path, plans):
+    """Write plans as one gzipped JSON document of rows (ids, tags and terms pre-computed)"""
+    rows = [
+        [plan.id, plan.days, sorted(plan.tags), plan.calories, plan.protein, sorted(plan.terms), plan.plan]
+        for plan in plans
+    ]
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump({'version': LIBRARY_VERSION, 'fields': FIELDS, 'plans': rows}, f,
+                  ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def read_library(path):
+    """Plans stored by write_library()"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        document = json.load(f)
+    if document.get('version') != LIBRARY_VERSION:
+        raise ValueError(f"Unsupported meal plan library version {document.get('version')}")
+    positions = [document['fields'].index(field) for field in FIELDS]
+    plans = []
+    for row in document['plans']:
+        values = dict(zip(FIELDS, (row[position] for position in positions)))
+        values['tags'] = frozenset(values['tags'])
+        values['terms'] = frozenset(values['terms'])
+        plans.append(LibraryPlan(**values))
+    return plans
+
+class MealPlanLibrary:
+    """Retrieval over precomputed plans with per-user rotation
+
+    Rotation state lives in user_store (under 'library_seen') when given,
+    otherwise in this container's memory.
+    """
+
+    def __init__(self, path=DEFAULT_LIBRARY_PATH, user_store=None, plans=None,
+                 calorie_tolerance=CALORIE_TOLERANCE, rotation_memory=ROTATION_MEMORY):
+        self.path = path
+        self.user_store = user_store
+        self.calorie_tolerance = calorie_tolerance
+        self.rotation_memory = rotation_memory
+        self.hits = 0
+        self.misses = 0
+        self.unusual = 0
+        self._by_days = None
+        self._seen = {}
+        self._lock = threading.Lock()
+        if plans is not None:
+            self._by_days = self._index(plans)
+
+    @staticmethod
+    def _index(plans):
+        by_days = {}
+        for plan in plans:
+            tags = set(plan.tags)
+            for tag in plan.tags:
+                tags |= IMPLIED_TAGS.get(tag, set())
+            by_days.setdefault(plan.days, []).append(plan._replace(tags=frozenset(tags)))
+        return by_days
+
+    def _plans(self, days):
+        # Loaded on first use so a cold start that never plans meals doesn't pay for it
+        with self._lock:
+            if self._by_days is None:
+                try:
+                    plans = read_library(self.path)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Could not load meal plan library {self.path}: {e}")
+                    plans = []
+                self._by_days = self._index(plans)
+                logger.info(f"Loaded {len(plans)} library meal plans from {self.path}")
+            return self._by_days.get(int(days), [])
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def candidates(self, days, tags=(), excluded=(), calories=None, protein=None):
+        """Library plans of the given length that meet the diet, exclusion and nutrition filters"""
+        tags, excluded = set(tags), set(excluded)
+        return [
+            plan for plan in self._plans(days)
+            if tags <= plan.tags
+            and not excluded & plan.terms
+            and (calories is None or abs(plan.calories - calories) <= calories * self.calorie_tolerance)
+            and (protein is None or plan.protein >= protein)
+        ]
+
+    def _seen_ids(self, user_id):
+        if user_id is None:
+            return []
+        if self.user_store is not None:
+            return self.user_store.get(user_id).get('library_seen', [])
+        with self._lock:
+            return list(self._seen.get(str(user_id), []))
+
+    def _remember(self, user_id, plan_id):
+        if user_id is None:
+            return
+        if self.user_store is not None:
+            def add_seen(state):
+                state['library_seen'] = (state.get('library_seen', []) + [plan_id])[-self.rotation_memory:]
+            self.user_store.update(user_id, add_seen)
+            return
+        with self._lock:
+            seen = self._seen.setdefault(str(user_id), [])
+            seen.append(plan_id)
+            del seen[:-self.rotation_memory]
+
+    def choose(self, days, user_preferences="", user_id=None):
+        """Plan JSON for the request from the library, or None if it needs live generation
+
+        Among the plans closest to the requested diets, ones the user hasn't
+        been served recently come first; once every match has been served,
+        the one served longest ago is reused.
+        """
+        request = parse_request(user_preferences)
+        if request is None:
+            self._count('unusual')
+            return None
+        matches = self.candidates(days, *request)
+        if not matches:
+            self._count('misses')
+            return None
+        # Closest diet first: a request with no diet gets plain plans before keto ones
+        fewest_extra = min(len(plan.tags - request[0]) for plan in matches)
+        matches = [plan for plan in matches if len(plan.tags - request[0]) == fewest_extra]
+
+        seen = self._seen_ids(user_id)
+        seen_order = {plan_id: position for position, plan_id in enumerate(seen)}
+        fresh = [plan for plan in matches if plan.id not in seen_order]
+        plan = random.choice(fresh) if fresh else min(matches, key=lambda plan: seen_order[plan.id])
+        try:
+            self._remember(user_id, plan.id)
+        except Exception as e:
+            # Rotation is best effort; still serve the plan
+            logger.error(f"Could not record library plan for user {user_id}: {e}")
+        self._count('hits')
+        logger.info(f"Serving library meal plan {plan.id} ({len(matches)} matches, {len(fresh)} unseen)")
+        return plan.plan
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'unusual': self.unusual}
+
+def create_meal_plan_library(user_store=None, path=None):
+    """Library at MEAL_PLAN_LIBRARY_PATH, or None when it hasn't been built (or the path is "none")"""
+    path = path or DEFAULT_LIBRARY_PATH
+    if path.lower() == 'none' or not os.path.exists(path):
+        return None
+    return MealPlanLibrary(path, user_store=user_store)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Meal plan JSON schema, validation and tolerant repair
+Model output is parsed, repaired locally when it is malformed (code fences, prose around the JSON,
+trailing commas, smart quotes, output cut off at max_tokens) and validated against the schema -
+with fastjsonschema when installed, otherwise a hand-written check. Only output that still fails
+is worth a second generation. Parse outcomes are counted so the failure rate can be tracked.
+"""
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MEALS = ['breakfast', 'lunch', 'dinner', 'snack']
+
+MEAL_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'name': {'type': 'string'},
+        'ingredients': {'type': 'array', 'items': {'type': 'string'}},
+        'protein': {'type': 'string'},
+        'calories': {'type': 'string'},
+    },
+    'required': ['name', 'ingredients', 'protein', 'calories'],
+    'additionalProperties': False,
+}
+
+DAY_SCHEMA = {
+    'type': 'object',
+    'properties': {'day': {'type': 'integer'}, **{meal: MEAL_SCHEMA for meal in MEALS}},
+    'required': ['day'] + MEALS,
+    'additionalProperties': False,
+}
+
+MEAL_PLAN_SCHEMA = {
+    'type': 'object',
+    'properties': {'days': {'type': 'array', 'items': DAY_SCHEMA}},
+    'required': ['days'],
+    'additionalProperties': False,
+}
+
+def _compile_validator():
+    """fastjsonschema validator, or None to use validate_day()"""
+    try:
+        import fastjsonschema
+    except ImportError:
+        return None
+    validate = fastjsonschema.compile(DAY_SCHEMA)
+
+    def validator(day):
+        try:
+            validate(day)
+            return None
+        except fastjsonschema.JsonSchemaException as e:
+            return e.message
+    return validator
+
+def validate_day(day):
+    """Error message for a day that doesn't match DAY_SCHEMA, or None"""
+    if not isinstance(day, dict):
+        return "day is not an object"
+    if not isinstance(day.get('day'), int) or isinstance(day.get('day'), bool):
+        return "day number missing"
+    for meal in MEALS:
+        info = day.get(meal)
+        if not isinstance(info, dict):
+            return f"{meal} missing"
+        if not isinstance(info.get('name'), str):
+            return f"{meal} name missing"
+        ingredients = info.get('ingredients')
+        if not isinstance(ingredients, list) or not all(isinstance(item, str) for item in ingredients):
+            return f"{meal} ingredients are not a list of strings"
+        if not isinstance(info.get('protein'), str) or not isinstance(info.get('calories'), str):
+            return f"{meal} protein/calories missing"
+    return None
+
+_day_validator = _compile_validator() or validate_day
+
+class ParseStats:
+    """Thread-safe counters of how model output parsed"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.valid = 0
+        self.repaired = 0
+        self.failed = 0
+
+    def record(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self):
+        with self._lock:
+            total = self.valid + self.repaired + self.failed
+            return {
+                'valid': self.valid,
+                'repaired': self.repaired,
+                'failed': self.failed,
+                'failure_rate': round(self.failed / total, 3) if total else 0.0,
+                'repair_rate': round(self.repaired / total, 3) if total else 0.0,
+            }
+
+stats = ParseStats()
+
+SMART_QUOTES = str.maketrans({'“': '"', '”': '"', '„': '"'})
+
+def repair_json(text):
+    """Best-effort fix of malformed or truncated JSON text (one pass, no model call)
+
+    Strips code fences and prose around the object, smart quotes and trailing
+    commas. Output cut off mid-way is rolled back to the last complete
+    object and its open brackets are closed.
+    """
+    text = text.translate(SMART_QUOTES)
+    start = text.find('{')
+    if start < 0:
+        return None
+    out = []
+    stack = []
+    checkpoint = None
+    in_string = escape = False
+    for char in text[start:]:
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]':
+            if not stack:
+                break
+            # Drop a trailing comma before the closing bracket
+            while out and out[-1] in ' \t\r\n,':
+                out.pop()
+            out.append(stack.pop())
+            if not stack:
+                return ''.join(out)
+            if stack[-1] == ']' or char == '}':
+                checkpoint = (len(out), list(stack))
+            continue
+        out.append(char)
+
+    # Cut off: roll back to the last complete object and close what is still open
+    if checkpoint is None:
+        return None
+    length, stack = checkpoint
+    out = out[:length]
+    while out and out[-1] in ' \t\r\n,':
+        out.pop()
+    return ''.join(out) + ''.join(reversed(stack))
+
+def _normalize_day(day, number):
+    """Coerce common near-misses (numeric calories, missing day number) in place"""
+    if not isinstance(day, dict):
+        return day
+    if not isinstance(day.get('day'), int):
+        try:
+            day['day'] = int(day.get('day'))
+        except (TypeError, ValueError):
+            day['day'] = number
+    for meal in MEALS:
+        info = day.get(meal)
+        if isinstance(info, dict):
+            for field in ('protein', 'calories'):
+                if isinstance(info.get(field), (int, float)) and not isinstance(info.get(field), bool):
+                    info[field] = f"{info[field]:g}" + ('g' if field == 'protein' else '')
+            if isinstance(info.get('ingredients'), str):
+                info['ingredients'] = [info['ingredients']]
+            info.setdefault('ingredients', [])
+            for extra in set(info) - set(MEAL_SCHEMA['properties']):
+                del info[extra]
+    for extra in set(day) - set(DAY_SCHEMA['properties']):
+        del day[extra]
+    return day
+
+def _load(text):
+    if isinstance(text, dict):
+        return text
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+    if text.endswith('```'):
+        text = text[:-3]
+    return json.loads(text)
+
+def parse_meal_plan_output(text, days=None, record=True):
+    """Return the validated plan dict for model output, repairing it if needed (None if hopeless)
+
+    Days that still don't match the schema are dropped; a plan with no
+    valid days, or with other than the expected number of days, is a failure.
+    """
+    if not text:
+        return None
+    repaired = False
+    try:
+        plan = _load(text)
+    except (ValueError, TypeError):
+        fixed = repair_json(text) if isinstance(text, str) else None
+        try:
+            plan = json.loads(fixed) if fixed else None
+        except ValueError:
+            plan = None
+        repaired = True
+
+    # Re-parsing cached output shouldn't repeat the warnings
+    log = logger.warning if record else logger.debug
+    output_days = plan.get('days') if isinstance(plan, dict) else None
+    valid_days = []
+    if isinstance(output_days, list):
+        for number, day in enumerate(output_days, 1):
+            day = _normalize_day(day, number)
+            error = _day_validator(day)
+            if error is None:
+                valid_days.append(day)
+            else:
+                repaired = True
+                log(f"Dropping invalid meal plan day {number}: {error}")
+
+    if not valid_days or (days is not None and len(valid_days) != int(days)):
+        if record:
+            stats.record('failed')
+        found = f"{len(valid_days)} of {days} days" if valid_days else "no valid days"
+        log(f"Meal plan output failed to parse: {found} ({stats.stats()})")
+        return None
+    if record:
+        stats.record('repaired' if repaired else 'valid')
+    return {'days': valid_days}
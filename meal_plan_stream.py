@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Streaming meal plan generation for NutritionGPT
+Pushes each day to the chat as soon as its JSON object is complete
+"""
+import json
+import logging
+import os
+import time
+
+from resilience import OPENAI, call
+
+logger = logging.getLogger(__name__)
+
+STREAM_MEAL_PLANS = os.environ.get('STREAM_MEAL_PLANS', 'false').lower() == 'true'
+# Telegram allows roughly one message edit per second per chat
+EDIT_MIN_INTERVAL = float(os.environ.get('STREAM_EDIT_MIN_INTERVAL', 1.5))
+
+class IncrementalDayParser:
+    """Incremental parser that emits each object of the top-level "days" array once it closes"""
+
+    def __init__(self):
+        self.buffer = ''
+        self.days = []
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._day_start = None
+
+    def feed(self, chunk):
+        """Add streamed text and return the list of newly completed day dicts"""
+        self.buffer += chunk
+        completed = []
+        text = self.buffer
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if char == '{' and self._stack == ['{', '[']:
+                    self._day_start = i
+                self._stack.append(char)
+            elif char in '}]':
+                if self._stack:
+                    self._stack.pop()
+                if char == '}' and self._day_start is not None and self._stack == ['{', '[']:
+                    try:
+                        day = json.loads(text[self._day_start:i + 1])
+                        self.days.append(day)
+                        completed.append(day)
+                    except ValueError as e:
+                        logger.warning(f"Skipping malformed streamed day: {e}")
+                    self._day_start = None
+        self._pos = len(text)
+        return completed
+
+class ThrottledMessageEditor:
+    """Edits one Telegram message, at most once per min_interval seconds"""
+
+    def __init__(self, edit_func, min_interval=EDIT_MIN_INTERVAL):
+        self.edit_func = edit_func
+        self.min_interval = min_interval
+        self.edits = 0
+        self._last_edit = 0.0
+        self._last_text = None
+        self._latest = None
+        self._pending = None
+
+    def update(self, text):
+        """Queue new text; it is sent now if the throttle allows, otherwise on a later update/flush"""
+        self._pending = self._latest = text
+        if time.monotonic() - self._last_edit >= self.min_interval:
+            self._send()
+
+    def flush(self):
+        """Send any pending text, waiting out the throttle if needed
+
+        Returns True if the message now shows the latest text, False if that edit failed.
+        """
+        if self._pending is not None:
+            wait = self.min_interval - (time.monotonic() - self._last_edit)
+            if wait > 0:
+                time.sleep(wait)
+            self._send()
+        return self._latest is None or self._latest == self._last_text
+
+    def _send(self):
+        text, self._pending = self._pending, None
+        if text is None or text == self._last_text:
+            return
+        try:
+            self.edit_func(text)
+            self.edits += 1
+            self._last_text = text
+        except Exception as e:
+            logger.error(f"Error editing streamed message: {e}")
+        self._last_edit = time.monotonic()
+
+def stream_completion(client, on_day, **request):
+    """Run a streaming chat completion, calling on_day(day, days_so_far) per completed day
+
+    Returns the full completion text, or None on error.
+    """
+    parser = IncrementalDayParser()
+    try:
+        # Only opening the stream is retried; days already shown can't be taken back
+        stream = call(OPENAI, lambda: client.chat.completions.create(stream=True, **request))
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            for day in parser.feed(delta):
+                on_day(day, list(parser.days))
+    except Exception as e:
+        logger.error(f"Error streaming meal plan: {e}")
+        return None
+    return parser.buffer or None
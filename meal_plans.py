@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Meal plan prompts and formatting shared by the bot and the Lambda handlers
+"""
+import json
+import logging
+import os
+import re
+
+from prompt_templates import PromptTemplate, compact
+from shopping_extractor import parse_meal_plan, meal_plan_ingredients
+from meal_plan_schema import MEAL_PLAN_SCHEMA, parse_meal_plan_output
+from nutrition import CALORIES, PROTEIN, CARBS, FAT, plan_macros
+
+logger = logging.getLogger(__name__)
+
+MEAL_PLAN_MODEL = "gpt-3.5-turbo"
+MEAL_PLAN_TEMPERATURE = 0.7
+SHOPPING_MODEL = "gpt-3.5-turbo"
+SHOPPING_TEMPERATURE = 0.3
+# json_object (JSON mode), json_schema (structured outputs; needs gpt-4o-mini or newer) or text
+MEAL_PLAN_RESPONSE_FORMAT = os.environ.get('MEAL_PLAN_RESPONSE_FORMAT', 'json_object').lower()
+# Generations per request when the output can't be parsed even after local repair
+MEAL_PLAN_ATTEMPTS = int(os.environ.get('MEAL_PLAN_ATTEMPTS', 2))
+
+# Completion budgets: one day of plan JSON is ~300-400 tokens, one shopping line ~10
+MEAL_PLAN_TOKENS_PER_DAY = int(os.environ.get('MEAL_PLAN_TOKENS_PER_DAY', 450))
+MEAL_PLAN_BASE_TOKENS = 50
+SHOPPING_TOKENS_PER_ITEM = 12
+SHOPPING_BASE_TOKENS = 50
+SHOPPING_MAX_TOKENS = 1000
+
+MEAL_PLAN_PROMPT = PromptTemplate(
+    'meal_plan',
+    system="You are a nutrition expert and meal planner. Provide healthy, protein-rich meal plans.",
+    user="""
+    Create a {days}-day meal plan with 3 meals (breakfast, lunch, dinner) and 1 snack per day.
+    Focus on high protein, healthy, and delicious meals.
+    
+    User preferences: {preferences}
+    
+    Format the response as a JSON object with this structure:
+    {{
+        "days": [
+            {{
+                "day": 1,
+                "breakfast": {{"name": "meal name", "ingredients": ["150g ingredient1", "1 cup ingredient2"], "protein": "XXg", "calories": "XXX"}},
+                "lunch": {{"name": "meal name", "ingredients": ["150g ingredient1", "1 cup ingredient2"], "protein": "XXg", "calories": "XXX"}},
+                "dinner": {{"name": "meal name", "ingredients": ["150g ingredient1", "1 cup ingredient2"], "protein": "XXg", "calories": "XXX"}},
+                "snack": {{"name": "snack name", "ingredients": ["150g ingredient1", "1 cup ingredient2"], "protein": "XXg", "calories": "XXX"}}
+            }}
+        ]
+    }}
+    
+    Make sure each meal has at least 20g of protein and is practical to cook.
+    """,
+    budget=int(os.environ.get('MEAL_PLAN_PROMPT_BUDGET', 400)),
+    trim_field='preferences',
+    model=MEAL_PLAN_MODEL
+)
+
+SHOPPING_PROMPT = PromptTemplate(
+    'shopping_items',
+    system="You are a helpful assistant that extracts shopping list items from meal plans.",
+    user="""
+    Combine these meal plan ingredients into a shopping list.
+    Combine similar items and provide quantities.
+    
+    Ingredients:
+    {ingredients}
+    
+    Return as a simple list of items, one per line, with quantities where appropriate.
+    Example:
+    - 2 lbs chicken breast
+    - 1 dozen eggs
+    """,
+    budget=int(os.environ.get('SHOPPING_PROMPT_BUDGET', 1500)),
+    trim_field='ingredients',
+    model=SHOPPING_MODEL
+)
+
+INGREDIENTS_RE = re.compile(r'"ingredients"\s*:\s*\[([^\]]*)\]')
+QUOTED_RE = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+def meal_plan_max_tokens(days):
+    """Completion budget for a plan of the given length"""
+    return MEAL_PLAN_BASE_TOKENS + MEAL_PLAN_TOKENS_PER_DAY * max(int(days), 1)
+
+def meal_plan_response_format():
+    """response_format for MEAL_PLAN_RESPONSE_FORMAT (None for plain text)"""
+    if MEAL_PLAN_RESPONSE_FORMAT == 'json_schema':
+        return {
+            'type': 'json_schema',
+            'json_schema': {'name': 'meal_plan', 'schema': MEAL_PLAN_SCHEMA, 'strict': True}
+        }
+    if MEAL_PLAN_RESPONSE_FORMAT == 'json_object':
+        return {'type': 'json_object'}
+    return None
+
+def meal_plan_request(user_preferences="", days=1):
+    """Build the chat completion arguments for a meal plan"""
+    request = {
+        'model': MEAL_PLAN_MODEL,
+        'messages': MEAL_PLAN_PROMPT.render(
+            days=days, preferences=user_preferences if user_preferences else "No specific preferences"
+        ),
+        'temperature': MEAL_PLAN_TEMPERATURE,
+        'max_tokens': meal_plan_max_tokens(days)
+    }
+    response_format = meal_plan_response_format()
+    if response_format is not None:
+        request['response_format'] = response_format
+    return request
+
+def generate_meal_plan_json(generate, days=None, attempts=MEAL_PLAN_ATTEMPTS):
+    """Call generate() until its output is a valid plan and return the plan as JSON (None on failure)
+
+    Malformed output is repaired locally first, so a second generation only
+    happens when repair can't save it. With days, a plan missing days (or
+    with extra ones) is regenerated rather than returned short.
+    """
+    for attempt in range(1, attempts + 1):
+        output = generate()
+        if output is None:
+            # The API call itself failed (and was already retried)
+            return None
+        plan = parse_meal_plan_output(output, days)
+        if plan is not None:
+            return json.dumps(plan, ensure_ascii=False)
+        logger.warning(f"Unusable meal plan output (attempt {attempt}/{attempts})")
+    return None
+
+def plan_ingredients(meal_plan_text):
+    """Unique ingredient strings of a plan; salvaged from the raw text when it isn't valid JSON"""
+    plan = parse_meal_plan(meal_plan_text)
+    if plan is not None:
+        ingredients = [str(item) for item in meal_plan_ingredients(plan)]
+    else:
+        arrays = ' '.join(INGREDIENTS_RE.findall(str(meal_plan_text or '')))
+        ingredients = QUOTED_RE.findall(arrays)
+    return list(dict.fromkeys(item.strip() for item in ingredients if item.strip()))
+
+def shopping_items_request(meal_plan_text):
+    """Build the chat completion arguments for shopping list extraction
+
+    Only the plan's ingredients are sent; a plan with no recognizable
+    ingredients arrays is sent whole (compacted and trimmed to the budget).
+    """
+    ingredients = plan_ingredients(meal_plan_text)
+    ingredients_text = '\n'.join(ingredients) if ingredients else compact(str(meal_plan_text or ''))
+    line_count = len(ingredients) or ingredients_text.count('\n') + 1
+    return {
+        'model': SHOPPING_MODEL,
+        'messages': SHOPPING_PROMPT.render(
+            ingredients=ingredients_text, baseline_values={'ingredients': meal_plan_text}
+        ),
+        'temperature': SHOPPING_TEMPERATURE,
+        'max_tokens': min(SHOPPING_BASE_TOKENS + SHOPPING_TOKENS_PER_ITEM * line_count, SHOPPING_MAX_TOKENS)
+    }
+
+def meal_plan_macros(meal_plan):
+    """Macros computed from the plan's ingredients (None when the nutrition table is unavailable)"""
+    try:
+        return plan_macros(meal_plan)
+    except Exception as e:
+        logger.error(f"Error computing meal plan macros: {e}")
+        return None
+
+def format_meal_plan(meal_plan_json, days):
+    """Format meal plan for display"""
+    try:
+        # Validated plans parse directly; older cached output may still need repair
+        meal_plan = parse_meal_plan_output(meal_plan_json, record=False)
+        if meal_plan is None:
+            raise ValueError("meal plan output could not be parsed")
+        
+        macros = meal_plan_macros(meal_plan)
+        formatted_text = f"🍽️ **{days}-Day Meal Plan**\n\n"
+        
+        for day_index, day_data in enumerate(meal_plan.get('days', [])):
+            day_num = day_data.get('day', 1)
+            formatted_text += f"**Day {day_num}**\n"
+            
+            meals = ['breakfast', 'lunch', 'dinner', 'snack']
+            for meal_index, meal in enumerate(meals):
+                if meal in day_data:
+                    meal_info = day_data[meal]
+                    name = meal_info.get('name', 'Unknown')
+                    protein = meal_info.get('protein', 'N/A')
+                    calories = meal_info.get('calories', 'N/A')
+                    if macros is not None and macros.complete[day_index, meal_index]:
+                        # Computed from the ingredients rather than the model's estimate
+                        meal_macros = macros.meals[day_index, meal_index]
+                        protein = f"{meal_macros[PROTEIN]:.0f}g"
+                        calories = f"{meal_macros[CALORIES]:.0f}"
+                    
+                    formatted_text += f"• **{meal.title()}**: {name}\n"
+                    formatted_text += f"  Protein: {protein} | Calories: {calories}\n"
+            
+            if macros is not None and macros.complete[day_index].all():
+                day_macros = macros.days[day_index]
+                formatted_text += (
+                    f"📊 Day total: {day_macros[CALORIES]:.0f} kcal | Protein {day_macros[PROTEIN]:.0f}g | "
+                    f"Carbs {day_macros[CARBS]:.0f}g | Fat {day_macros[FAT]:.0f}g\n"
+                )
+            
+            formatted_text += "\n"
+        
+        return formatted_text
+        
+    except Exception as e:
+        logger.error(f"Error formatting meal plan: {e}")
+        return f"🍽️ **{days}-Day Meal Plan Generated!**\n\n✅ Your meal plan has been created and shopping list updated.\n\n💡 Use `/shopping` to view your ingredients list."
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Local nutrition table and vectorized macro calculator
+nutrition_table.csv lists per-100 g macros and typical portion weights for common ingredients. It
+is compiled once to a .npy file and memory-mapped, so warm invocations and concurrent processes
+share the pages. Ingredient strings ("150g chicken breast", "1 cup brown rice") are matched to
+table rows by their longest known name, and a plan's meal, day and plan totals are computed in one
+batched NumPy pass - no extra API calls. Without NumPy the calculator is off and the model's own
+numbers are shown.
+"""
+import csv
+import importlib.util
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import namedtuple
+
+from lazy import lazy_import
+from meal_plan_schema import MEALS
+from shopping_list import DESCRIPTORS, UNITS, normalize_name, parse_ingredient, singularize
+
+# NumPy is only imported when the table is first used
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TABLE_PATH = os.environ.get(
+    'NUTRITION_TABLE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nutrition_table.csv')
+)
+CACHE_DIR = os.environ.get('NUTRITION_CACHE_DIR', '/tmp')
+
+MACROS = ('calories', 'protein', 'carbs', 'fat')
+PORTIONS = ('piece_g', 'cup_g', 'serving_g')
+CALORIES, PROTEIN, CARBS, FAT = range(len(MACROS))
+PIECE, CUP, SERVING = range(len(MACROS), len(MACROS) + len(PORTIONS))
+
+# Units shopping_list doesn't know, in grams; a count with no unit is pieces of the food
+EXTRA_UNITS = {'pinch': 0.5, 'dash': 0.5, 'handful': 30.0, 'can': 240.0}
+# Words that don't change which food an ingredient is (on top of shopping_list's)
+EXTRA_DESCRIPTORS = {
+    'grilled', 'baked', 'roasted', 'steamed', 'boiled', 'sauteed', 'mashed', 'toasted', 'frozen', 'hard',
+    'soft', 'low', 'fat', 'reduced', 'light', 'extra', 'virgin', 'natural', 'unsweetened', 'of', 'and', 'or',
+    'to', 'taste', 'optional', 'some', 'the', 'a', 'an',
+}
+ML_PER_CUP = 236.588
+
+TRAILING_GRAMS_RE = re.compile(r"\(?\s*(?P<quantity>\d+(?:\.\d+)?)\s*(?P<unit>g|grams|ml|oz|kg)\s*\)?\s*$")
+LEADING_UNIT_RE = re.compile(r"^(?P<unit>[a-z]+)s?\s+(?:of\s+)?(?P<name>.+)$")
+
+def name_key(name):
+    """Singular words of an ingredient name without descriptors ("Sliced Almonds" -> ('almond',))"""
+    return tuple(
+        singularize(word) for word in normalize_name(name).replace('-', ' ').split()
+        if word not in EXTRA_DESCRIPTORS and word not in DESCRIPTORS
+    )
+
+def parse_amount(ingredient):
+    """(quantity, unit, name) like shopping_list.parse_ingredient, plus "name (150g)" and pinch/handful/can"""
+    quantity, unit, name = parse_ingredient(ingredient)
+    if quantity is None:
+        match = TRAILING_GRAMS_RE.search(name.lower())
+        if match:
+            return float(match.group('quantity')), match.group('unit'), name[:match.start()]
+    elif unit is None:
+        match = LEADING_UNIT_RE.match(name.lower())
+        if match and match.group('unit') in EXTRA_UNITS:
+            return quantity, match.group('unit'), match.group('name')
+    return quantity, unit, name
+
+def compile_table(csv_path, npy_path):
+    """Write the numeric columns of the CSV table to npy_path"""
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    values = np.array(
+        [[float(row[column]) if row[column] else np.nan for column in MACROS + PORTIONS] for row in rows],
+        dtype=np.float32
+    )
+    tmp_path = f"{npy_path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, values)
+    os.replace(tmp_path, npy_path)
+
+class NutritionTable:
+    """Per-100 g macros and portion weights, with a longest-name ingredient matcher"""
+
+    def __init__(self, names, aliases, values):
+        self.names = names
+        self.aliases = aliases
+        self.values = values
+        self.macros = values[:, :len(MACROS)]
+        self.max_words = max((len(key) for key in aliases), default=1)
+        self._matches = {}
+        self._lookups = {}
+
+    @classmethod
+    def load(cls, path=DEFAULT_TABLE_PATH, cache_dir=CACHE_DIR):
+        """Load the CSV's names and memory-map its numbers (compiled to cache_dir on first use)"""
+        with open(path, 'rb') as f:
+            checksum = zlib.crc32(f.read())
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        npy_path = os.path.join(cache_dir, f"nutrition_table_{checksum:08x}.npy")
+        if not os.path.exists(npy_path):
+            compile_table(path, npy_path)
+        values = np.load(npy_path, mmap_mode='r')
+
+        names, aliases = [], {}
+        for index, row in enumerate(rows):
+            names.append(row['name'])
+            for alias in [row['name']] + [alias for alias in row['aliases'].split('|') if alias]:
+                key = name_key(alias)
+                if key and aliases.setdefault(key, index) != index:
+                    logger.warning(f"Nutrition alias {alias!r} of {row['name']} already means {names[aliases[key]]}")
+        return cls(names, aliases, values)
+
+    def match(self, name):
+        """Row of the food an ingredient name refers to, or -1
+
+        The longest known name wins; among equally long ones the last in the
+        string (its head noun: "almond milk", "turkey bacon") is used.
+        """
+        key = name_key(name)
+        row = self._matches.get(key)
+        if row is None:
+            row = -1
+            for size in range(min(self.max_words, len(key)), 0, -1):
+                for start in range(len(key) - size, -1, -1):
+                    row = self.aliases.get(key[start:start + size], -1)
+                    if row >= 0:
+                        break
+                if row >= 0:
+                    break
+            if len(self._matches) < 10000:
+                self._matches[key] = row
+        return row
+
+    def grams(self, row, quantity, unit):
+        """Weight in grams of quantity x unit of the row's food"""
+        piece, cup, serving = (float(self.values[row, column]) for column in (PIECE, CUP, SERVING))
+        serving = serving if serving == serving else 100.0
+        if quantity is None:
+            return serving
+        if unit in UNITS:
+            dimension, factor, _ = UNITS[unit]
+            if dimension == 'mass':
+                return quantity * factor
+            if dimension == 'volume':
+                # Unknown densities count as water (240 g per cup)
+                return quantity * factor / ML_PER_CUP * (cup if cup == cup else 240.0)
+            quantity *= factor
+        elif unit in EXTRA_UNITS:
+            return quantity * EXTRA_UNITS[unit]
+        return quantity * (piece if piece == piece else serving)
+
+    def lookup(self, ingredient):
+        """(row, grams) for an ingredient string; row is -1 when the food is unknown"""
+        result = self._lookups.get(ingredient)
+        if result is None:
+            quantity, unit, name = parse_amount(ingredient)
+            row = self.match(name)
+            result = (row, self.grams(row, quantity, unit)) if row >= 0 else (-1, 0.0)
+            if len(self._lookups) < 10000:
+                self._lookups[ingredient] = result
+        return result
+
+PlanMacros = namedtuple('PlanMacros', ['meals', 'days', 'total', 'complete', 'unmatched'])
+PlanMacros.__doc__ = """Macros (calories, protein, carbs, fat) of a plan
+
+meals is (days, meals, 4), days (days, 4) and total (4,). complete[d, m] is
+True when every ingredient of that meal was recognized.
+"""
+
+_table = None
+_table_lock = threading.Lock()
+
+def get_table():
+    """The shared NutritionTable, or None without NumPy or the table file"""
+    global _table
+    with _table_lock:
+        if _table is None:
+            if importlib.util.find_spec('numpy') is None:
+                logger.info("NumPy not installed, meal macros come from the model")
+                _table = False
+            else:
+                try:
+                    _table = NutritionTable.load()
+                except (OSError, ValueError, KeyError) as e:
+                    logger.error(f"Could not load nutrition table: {e}")
+                    _table = False
+        return _table or None
+
+def plan_macros(plan, table=None):
+    """PlanMacros of a validated plan dict in one vectorized pass (None if the table is unavailable)"""
+    table = table or get_table()
+    if table is None:
+        return None
+    days = plan.get('days', [])
+    slots, rows, grams, unmatched = [], [], [], []
+    for day_index, day in enumerate(days):
+        for meal_index, meal in enumerate(MEALS):
+            for ingredient in (day.get(meal) or {}).get('ingredients', []):
+                row, weight = table.lookup(ingredient)
+                slots.append(day_index * len(MEALS) + meal_index)
+                rows.append(row)
+                grams.append(weight)
+                if row < 0:
+                    unmatched.append(ingredient)
+
+    slot_count = len(days) * len(MEALS)
+    slots = np.asarray(slots, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.int64)
+    matched = rows >= 0
+    scale = np.where(matched, np.asarray(grams, dtype=np.float64), 0.0) / 100.0
+    per_item = table.macros[np.where(matched, rows, 0)] * scale[:, None]
+    meals = np.zeros((slot_count, len(MACROS)))
+    np.add.at(meals, slots, per_item)
+    counts = np.bincount(slots, minlength=slot_count)
+    matched_counts = np.bincount(slots, weights=matched, minlength=slot_count)
+    meals = meals.reshape(len(days), len(MEALS), len(MACROS))
+    return PlanMacros(
+        meals=meals,
+        days=meals.sum(axis=1),
+        total=meals.sum(axis=(0, 1)),
+        complete=((counts > 0) & (matched_counts == counts)).reshape(len(days), len(MEALS)),
+        unmatched=unmatched
+    )
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Concurrent step runner for the meal plan pipeline
+Runs independent steps (Telegram sends, GPT calls) together so latency is the max, not the sum
+"""
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# 'concurrent' overlaps steps on a thread pool, 'sequential' runs them one by one
+PIPELINE_MODE = os.environ.get('PIPELINE_MODE', 'concurrent').lower()
+PIPELINE_MAX_WORKERS = int(os.environ.get('PIPELINE_MAX_WORKERS', 8))
+DEFAULT_STEP_TIMEOUT = float(os.environ.get('PIPELINE_STEP_TIMEOUT', 60))
+
+StepResult = namedtuple('StepResult', ['ok', 'value', 'error', 'elapsed'])
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Shared thread pool, created on first use and reused across warm invocations"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PIPELINE_MAX_WORKERS,
+                                               thread_name_prefix='pipeline')
+    return _executor
+
+def _timed(func):
+    start = time.perf_counter()
+    value = func()
+    return value, time.perf_counter() - start
+
+def run_steps(steps, timeouts=None, default_timeout=DEFAULT_STEP_TIMEOUT):
+    """Run named callables concurrently and collect their results
+
+    steps maps a step name to a zero-argument callable. Each step gets its
+    own timeout, measured from when all steps were started. Returns a dict of
+    step name -> StepResult; a step that raised or timed out has ok=False.
+    """
+    timeouts = timeouts or {}
+    if PIPELINE_MODE == 'sequential':
+        return _run_sequential(steps)
+
+    executor = get_executor()
+    started = time.perf_counter()
+    futures = {name: executor.submit(_timed, func) for name, func in steps.items()}
+
+    results = {}
+    for name, future in futures.items():
+        remaining = max(0.0, timeouts.get(name, default_timeout) - (time.perf_counter() - started))
+        try:
+            value, elapsed = future.result(timeout=remaining)
+            results[name] = StepResult(True, value, None, elapsed)
+        except FutureTimeoutError as e:
+            future.cancel()
+            logger.error(f"Pipeline step '{name}' timed out after {timeouts.get(name, default_timeout)}s")
+            results[name] = StepResult(False, None, e, time.perf_counter() - started)
+        except Exception as e:
+            logger.error(f"Pipeline step '{name}' failed: {e}")
+            results[name] = StepResult(False, None, e, time.perf_counter() - started)
+
+    logger.info(
+        "Pipeline finished in %.2fs (%s)",
+        time.perf_counter() - started,
+        ', '.join(f"{name}={result.elapsed:.2f}s" for name, result in results.items())
+    )
+    return results
+
+def _run_sequential(steps):
+    results = {}
+    for name, func in steps.items():
+        start = time.perf_counter()
+        try:
+            results[name] = StepResult(True, func(), None, time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"Pipeline step '{name}' failed: {e}")
+            results[name] = StepResult(False, None, e, time.perf_counter() - start)
+    return results
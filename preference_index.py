@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Nearest-neighbour index over past meal plan preferences
+Free-text preferences that mean the same thing ("vegetarian, no nuts" / "veggie, nut-free") never
+share an exact cache key. Preferences are embedded (locally with hashed word and character
+features, or with the OpenAI embeddings API) and searched with NumPy - brute force, or
+random-hyperplane LSH for large indexes. A stored request above the similarity threshold lends its
+cache key to the new one. Diets, exclusions and calorie/protein targets are hard constraints: a
+neighbour is only used when it satisfies all of the new request's.
+"""
+import importlib.util
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict, namedtuple
+
+from lazy import lazy_import
+
+# NumPy is only imported once an index is built
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_THRESHOLD = float(os.environ.get('PREFERENCE_SIMILARITY_THRESHOLD', 0.9))
+MAX_ENTRIES = int(os.environ.get('PREFERENCE_INDEX_MAX_ENTRIES', 20000))
+LOCAL_DIMENSIONS = int(os.environ.get('PREFERENCE_LOCAL_DIMENSIONS', 256))
+EMBEDDING_MODEL = os.environ.get('PREFERENCE_EMBEDDING_MODEL', 'text-embedding-3-small')
+EMBEDDING_CACHE_SIZE = 1024
+LSH_TABLES = int(os.environ.get('PREFERENCE_LSH_TABLES', 8))
+LSH_BITS = int(os.environ.get('PREFERENCE_LSH_BITS', 12))
+# Relative distance allowed between a stored request's calorie/protein target and the new one's
+TARGET_TOLERANCE = float(os.environ.get('PREFERENCE_TARGET_TOLERANCE', 0.05))
+
+DIET_ALIASES = {'veggie': 'vegetarian', 'ketogenic': 'keto', 'plant based': 'vegan'}
+FREE_RE = re.compile(r"^(.+?) free$")
+NO_RE = re.compile(r"^(?:no|without) (.+)$")
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+def _stem(word):
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+def canonical_parts(preferences):
+    """Preferences split into canonical parts: "Veggie, nut-free" -> ['vegetarian', 'no nut']"""
+    parts = []
+    for part in str(preferences or '').lower().replace(';', ',').replace('\n', ',').split(','):
+        part = ' '.join(WORD_RE.findall(part))
+        part = DIET_ALIASES.get(part, part)
+        match = FREE_RE.match(part) or NO_RE.match(part)
+        if match:
+            part = 'no ' + ' '.join(_stem(word) for word in match.group(1).split())
+        if part and part not in parts:
+            parts.append(part)
+    return sorted(parts)
+
+Constraints = namedtuple('Constraints', ['parts', 'calories', 'protein'])
+
+def constraints(preferences):
+    """Diets, exclusions and calorie/protein targets a served plan must respect"""
+    from intent_parser import DIETS
+    from meal_plan_library import CALORIES_RE, PROTEIN_RE
+    diets = set(DIETS.values())
+    parts, calories, protein = set(), None, None
+    for part in canonical_parts(preferences):
+        if part in diets or part.startswith('no '):
+            parts.add(part)
+        elif CALORIES_RE.match(part):
+            calories = int(CALORIES_RE.match(part).group(1))
+        elif PROTEIN_RE.match(part):
+            protein = int(PROTEIN_RE.match(part).group(1))
+    return Constraints(frozenset(parts), calories, protein)
+
+def _near(stored, target, tolerance):
+    return stored is not None and abs(stored - target) <= tolerance * target
+
+def satisfies(stored, required, tolerance=TARGET_TOLERANCE):
+    """True if a plan made for stored constraints meets required ones
+
+    Every required diet and exclusion must be present, and each required
+    target must have been requested within tolerance.
+    """
+    if not required.parts <= stored.parts:
+        return False
+    if required.calories is not None and not _near(stored.calories, required.calories, tolerance):
+        return False
+    return required.protein is None or _near(stored.protein, required.protein, tolerance)
+
+def _bucket(feature, dimensions):
+    """Deterministic (index, sign) for a feature (Python's hash() is salted per process)"""
+    value = zlib.crc32(feature.encode('utf-8'))
+    return value % dimensions, 1.0 if value & 0x80000000 else -1.0
+
+class LocalEmbedder:
+    """Hashed bag of canonical parts, words and character trigrams - no API call, microseconds"""
+
+    def __init__(self, dimensions=LOCAL_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def embed(self, texts):
+        vectors = []
+        for text in texts:
+            vector = np.zeros(self.dimensions, dtype=np.float32)
+            for part in canonical_parts(text):
+                features = [(f"part:{part}", 1.0)]
+                features += [(f"word:{word}", 0.5) for word in part.split()]
+                padded = f" {part} "
+                features += [(f"tri:{padded[i:i + 3]}", 0.25) for i in range(len(padded) - 2)]
+                for feature, weight in features:
+                    index, sign = _bucket(feature, self.dimensions)
+                    vector[index] += sign * weight
+            vectors.append(vector)
+        return vectors
+
+class OpenAIEmbedder:
+    """Embeddings from embed(texts) -> list of vectors (see sdk_embed and api_clients.OpenAIClient.embed)"""
+
+    def __init__(self, embed):
+        self._embed = embed
+
+    def embed(self, texts):
+        return [np.asarray(vector, dtype=np.float32) for vector in self._embed(texts)]
+
+def sdk_embed(client, model=EMBEDDING_MODEL):
+    """embed(texts) for an openai SDK client, through resilience.py's OpenAI upstream"""
+    from resilience import OPENAI, call
+
+    def embed(texts):
+        response = call(OPENAI, lambda: client.embeddings.create(model=model, input=list(texts)))
+        return [item.embedding for item in response.data]
+    return embed
+
+class BruteForceIndex:
+    """Exact cosine search: one matrix-vector product over every stored (unit) vector"""
+
+    def __init__(self, dimensions):
+        self.dimensions = dimensions
+        self._vectors = np.zeros((64, dimensions), dtype=np.float32)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, vector):
+        """Store a unit vector; returns its position"""
+        if self._size == len(self._vectors):
+            grown = np.zeros((len(self._vectors) * 2, self.dimensions), dtype=np.float32)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+        self._vectors[self._size] = vector
+        self._size += 1
+        return self._size - 1
+
+    def vectors(self):
+        """Stored vectors in insertion order"""
+        return self._vectors[:self._size]
+
+    @staticmethod
+    def _top(scores, positions, k):
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best])]
+        return [(float(scores[i]), int(positions[i]) if positions is not None else int(i)) for i in best]
+
+    def search(self, vector, k=1):
+        """[(similarity, position)] of the k nearest stored vectors, best first"""
+        if not self._size:
+            return []
+        return self._top(self.vectors() @ vector, None, k)
+
+class LSHIndex(BruteForceIndex):
+    """Approximate cosine search: random-hyperplane LSH buckets, exact re-rank of the candidates
+
+    Each of `tables` hash tables buckets vectors by the signs of `bits` random
+    projections; a query only scores vectors sharing a bucket with it in some
+    table, so near-duplicates are found without scanning everything.
+    """
+
+    def __init__(self, dimensions, tables=LSH_TABLES, bits=LSH_BITS, seed=0):
+        super().__init__(dimensions)
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((tables * bits, dimensions)).astype(np.float32)
+        self._tables = tables
+        self._bits = bits
+        self._weights = (1 << np.arange(bits)).astype(np.int64)
+        self._buckets = [{} for _ in range(tables)]
+
+    def _codes(self, vector):
+        signs = (self._planes @ vector > 0).reshape(self._tables, self._bits)
+        return signs.astype(np.int64) @ self._weights
+
+    def add(self, vector):
+        position = super().add(vector)
+        for table, code in zip(self._buckets, self._codes(vector).tolist()):
+            table.setdefault(code, []).append(position)
+        return position
+
+    def search(self, vector, k=1):
+        candidates = set()
+        for table, code in zip(self._buckets, self._codes(vector).tolist()):
+            candidates.update(table.get(code, ()))
+        if not candidates:
+            return []
+        positions = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        return self._top(self._vectors[positions] @ vector, positions, k)
+
+INDEXES = {'brute': BruteForceIndex, 'lsh': LSHIndex}
+
+class _Partition:
+    def __init__(self, index):
+        self.index = index
+        self.keys = []
+        self.constraints = []
+        self.known = set()
+
+class PreferenceIndex:
+    """Past (preferences -> cache key) pairs searchable by similarity, per (days, model, temperature)"""
+
+    def __init__(self, embedder, index_type='brute', threshold=SIMILARITY_THRESHOLD, max_entries=MAX_ENTRIES):
+        self.embedder = embedder
+        self.index_type = index_type
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._partitions = {}
+        self._embeddings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _embed(self, preferences):
+        """Unit vector for preferences (memoized, since the same texts recur)"""
+        text = ', '.join(canonical_parts(preferences))
+        with self._lock:
+            vector = self._embeddings.get(text)
+            if vector is not None:
+                self._embeddings.move_to_end(text)
+                return vector
+        vector = self.embedder.embed([text or 'no preferences'])[0]
+        norm = float(np.linalg.norm(vector))
+        vector = vector / norm if norm else vector
+        with self._lock:
+            self._embeddings[text] = vector
+            while len(self._embeddings) > EMBEDDING_CACHE_SIZE:
+                self._embeddings.popitem(last=False)
+        return vector
+
+    def _partition(self, days, model, temperature, dimensions=None):
+        name = (int(days), model, round(float(temperature), 2))
+        partition = self._partitions.get(name)
+        if partition is None and dimensions is not None:
+            partition = self._partitions[name] = _Partition(INDEXES[self.index_type](dimensions))
+        return partition
+
+    def add(self, key, days, preferences, model, temperature):
+        """Remember that preferences were served by cache key"""
+        with self._lock:
+            partition = self._partition(days, model, temperature)
+            if partition is not None and key in partition.known:
+                return
+        vector = self._embed(preferences)
+        with self._lock:
+            partition = self._partition(days, model, temperature, dimensions=len(vector))
+            if key in partition.known:
+                return
+            if len(partition.keys) >= self.max_entries:
+                self._compact(partition)
+            partition.index.add(vector)
+            partition.keys.append(key)
+            partition.constraints.append(constraints(preferences))
+            partition.known.add(key)
+
+    def _compact(self, partition):
+        """Keep the newer half of a full partition"""
+        keep = len(partition.keys) // 2
+        vectors = partition.index.vectors()[-keep:].copy()
+        fresh = _Partition(INDEXES[self.index_type](partition.index.dimensions))
+        for vector, key, required in zip(vectors, partition.keys[-keep:], partition.constraints[-keep:]):
+            fresh.index.add(vector)
+            fresh.keys.append(key)
+            fresh.constraints.append(required)
+            fresh.known.add(key)
+        partition.__dict__.update(fresh.__dict__)
+        logger.info(f"Preference index partition full, kept the newest {keep} entries")
+
+    def lookup(self, days, preferences, model, temperature, k=5):
+        """(cache_key, similarity) of the most similar stored request meeting the constraints, or None"""
+        with self._lock:
+            partition = self._partition(days, model, temperature)
+            if partition is None or not partition.keys:
+                self.misses += 1
+                return None
+        vector = self._embed(preferences)
+        required = constraints(preferences)
+        with self._lock:
+            matches = partition.index.search(vector, k)
+            for similarity, position in matches:
+                if similarity < self.threshold:
+                    break
+                if satisfies(partition.constraints[position], required):
+                    self.hits += 1
+                    return partition.keys[position], similarity
+                self.rejected += 1
+            self.misses += 1
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'rejected': self.rejected,
+                'entries': sum(len(partition.keys) for partition in self._partitions.values()),
+            }
+
+def create_preference_index(embed=None, index_type=None, embedder_name=None):
+    """Create an index from PREFERENCE_INDEX (brute, lsh or none) and PREFERENCE_EMBEDDER (local or openai)
+
+    embed(texts) is the OpenAI embeddings call for the openai embedder.
+    Returns None when disabled or NumPy isn't installed.
+    """
+    index_type = (index_type or os.environ.get('PREFERENCE_INDEX', 'brute')).lower()
+    if index_type == 'none':
+        return None
+    if index_type not in INDEXES:
+        raise ValueError(f"Unknown PREFERENCE_INDEX {index_type}")
+    if importlib.util.find_spec('numpy') is None:
+        logger.info("NumPy not installed, similar-preference cache hits are off")
+        return None
+    embedder_name = (embedder_name or os.environ.get('PREFERENCE_EMBEDDER', 'local')).lower()
+    if embedder_name == 'openai' and embed is not None:
+        return PreferenceIndex(OpenAIEmbedder(embed), index_type)
+    if embedder_name == 'openai':
+        logger.warning("No OpenAI embed function given, using the local preference embedder")
+    return PreferenceIndex(LocalEmbedder(), index_type)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Compact prompt templates with local token counting and per-request budgets
+Templates are written readably in code and compacted once at import (indentation, blank lines and
+JSON examples squeezed out). Tokens are counted with tiktoken when installed, otherwise estimated
+at ~4 characters per token. Every render reports how many tokens the compaction saved.
+tiktoken downloads its BPE files on first use; deploy_to_aws.py bundles them (tiktoken_cache/) so a
+Lambda cold start never does, and a failed load falls back to the estimate.
+"""
+import json
+import logging
+import os
+import re
+import string
+import textwrap
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Tokens the chat format adds per message and per reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+DEFAULT_ENCODING = 'cl100k_base'
+# Encodings shipped with the deployment package (see deploy_to_aws.py)
+BUNDLED_TIKTOKEN_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tiktoken_cache')
+
+_encodings = {}
+_encoding_lock = threading.Lock()
+
+def _load_encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    if not os.environ.get('TIKTOKEN_CACHE_DIR'):
+        if os.path.isdir(BUNDLED_TIKTOKEN_CACHE):
+            os.environ['TIKTOKEN_CACHE_DIR'] = BUNDLED_TIKTOKEN_CACHE
+        elif os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+            # Fetching the BPE file would stall the cold start (or fail without internet access)
+            logger.info("No bundled tiktoken encodings, estimating prompt tokens")
+            return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        logger.warning(f"Could not load tiktoken encoding for {model}, estimating prompt tokens: {e}")
+        return None
+
+def _encoding(model):
+    """tiktoken encoding for model, or None if tiktoken isn't installed or its encoding can't be loaded"""
+    with _encoding_lock:
+        if model not in _encodings:
+            _encodings[model] = _load_encoding(model)
+        return _encodings[model]
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    """Token count of text (estimated at ~4 characters per token without tiktoken)"""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+def count_message_tokens(messages, model="gpt-3.5-turbo"):
+    """Prompt tokens of a chat messages list, including the chat format overhead"""
+    return sum(
+        MESSAGE_OVERHEAD_TOKENS + count_tokens(message.get('content') or '', model) for message in messages
+    ) + REPLY_OVERHEAD_TOKENS
+
+def truncate_tokens(text, max_tokens, model="gpt-3.5-turbo"):
+    """Cut text to at most max_tokens tokens"""
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[:max(max_tokens, 0) * 4]
+    tokens = encoding.encode(text)
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max(max_tokens, 0)])
+
+_JSON_BLOCK_RE = re.compile(r"^\{.*?^\}+[ \t]*$", re.M | re.S)
+
+def _compact_json(match):
+    text = match.group(0)
+    try:
+        return json.dumps(json.loads(text.replace('{{', '{').replace('}}', '}')), separators=(',', ':')) \
+            .replace('{', '{{').replace('}', '}}')
+    except ValueError:
+        return ' '.join(text.split())
+
+def compact(text):
+    """Dedent, squeeze JSON examples onto one line and drop blank lines and trailing spaces"""
+    text = _JSON_BLOCK_RE.sub(_compact_json, textwrap.dedent(text).strip())
+    lines = (' '.join(line.split()) for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+class PromptStats:
+    """Thread-safe per-template counters for prompt tokens and tokens saved by compaction"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._templates = {}
+
+    def record(self, name, tokens, saved, trimmed):
+        with self._lock:
+            counters = self._templates.setdefault(name, {'calls': 0, 'tokens': 0, 'saved': 0, 'trimmed': 0})
+            counters['calls'] += 1
+            counters['tokens'] += tokens
+            counters['saved'] += saved
+            counters['trimmed'] += trimmed
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(counters) for name, counters in self._templates.items()}
+
+    def reset(self):
+        with self._lock:
+            self._templates.clear()
+
+stats = PromptStats()
+
+class PromptTemplate:
+    """System + user prompt pair rendered as chat messages
+
+    budget caps the prompt tokens; when a render would exceed it the
+    `trim_field` value is cut down to fit.
+    """
+
+    def __init__(self, name, system, user, budget=None, trim_field=None, model="gpt-3.5-turbo"):
+        self.name = name
+        self.source_system, self.source_user = system, user
+        self.system, self.user = compact(system), compact(user)
+        self.budget = budget
+        self.trim_field = trim_field
+        self.model = model
+        fields = {name for _, name, _, _ in string.Formatter().parse(self.user) if name}
+        if trim_field is not None and trim_field not in fields:
+            raise ValueError(f"Template {name} has no field {trim_field}")
+
+    def _messages(self, system, user, values):
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user.format(**values)},
+        ]
+
+    def render(self, baseline_values=None, **values):
+        """Return the messages for values, trimmed to the budget
+
+        baseline_values (defaults to values) fill the uncompacted template for
+        the tokens-saved figure, e.g. the full plan that used to be sent.
+        """
+        baseline_values = baseline_values or values
+        messages = self._messages(self.system, self.user, values)
+        tokens = count_message_tokens(messages, self.model)
+        trimmed = 0
+        if self.budget and tokens > self.budget and self.trim_field is not None:
+            value = str(values[self.trim_field])
+            value_tokens = count_tokens(value, self.model)
+            keep = max(value_tokens - (tokens - self.budget), 0)
+            values = dict(values, **{self.trim_field: truncate_tokens(value, keep, self.model)})
+            messages = self._messages(self.system, self.user, values)
+            untrimmed, tokens = tokens, count_message_tokens(messages, self.model)
+            trimmed = untrimmed - tokens
+            logger.warning(f"Prompt {self.name} over its {self.budget}-token budget, trimmed {self.trim_field} by {trimmed} tokens")
+        elif self.budget and tokens > self.budget:
+            logger.warning(f"Prompt {self.name} is {tokens} tokens, over its {self.budget}-token budget")
+
+        baseline = count_message_tokens(
+            self._messages(self.source_system, self.source_user, baseline_values), self.model
+        )
+        saved = max(baseline - tokens - trimmed, 0)
+        stats.record(self.name, tokens, saved, trimmed)
+        logger.info(f"Prompt {self.name}: {tokens} tokens ({saved} saved)")
+        return messages
@@ -9,6 +9,13 @@ import zipfile
 import boto3
 import subprocess
 
+# Helper modules imported by lambda_function_simple.py
+LAMBDA_MODULES = [
+    'update_dedup.py',
+    'http_pool.py',
+    'resilience.py',
+]
+
 def quick_deploy():
     """Quickly deploy the updated Lambda function"""
     print("🚀 Quick Deploy - Updated Lambda Function")
@@ -21,6 +28,8 @@ def quick_deploy():
     
     # Copy updated function
     shutil.copy('lambda_function_simple.py', 'lambda_package/lambda_function.py')
+    for module in LAMBDA_MODULES:
+        shutil.copy(module, os.path.join('lambda_package', module))
     
     # Install dependencies
     print("📥 Installing dependencies...")
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Token-bucket rate limiting for OpenAI calls
+Buckets per user and global, counted in requests and estimated tokens. State lives in a shared
+backend (SQLite on EFS or DynamoDB) so every Lambda container sees the same limits. A user over
+their limit is turned away with a friendly reply; a global burst waits briefly, then is shed.
+"""
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from prompt_templates import count_message_tokens
+
+logger = logging.getLogger(__name__)
+
+# Limits per minute (override with environment variables)
+USER_REQUESTS_PER_MINUTE = float(os.environ.get('RATE_LIMIT_USER_RPM', 4))
+USER_TOKENS_PER_MINUTE = float(os.environ.get('RATE_LIMIT_USER_TPM', 12000))
+GLOBAL_REQUESTS_PER_MINUTE = float(os.environ.get('RATE_LIMIT_GLOBAL_RPM', 300))
+GLOBAL_TOKENS_PER_MINUTE = float(os.environ.get('RATE_LIMIT_GLOBAL_TPM', 80000))
+# How long a request may queue for global capacity before it is shed
+MAX_WAIT_SECONDS = float(os.environ.get('RATE_LIMIT_MAX_WAIT', 5))
+DEFAULT_SQLITE_PATH = os.environ.get('RATE_LIMIT_SQLITE_PATH', '/tmp/nutritiongpt_rate_limits.db')
+# Completion size assumed when a request doesn't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 1500
+
+USER = 'user'
+GLOBAL = 'global'
+
+def estimate_tokens(request):
+    """Token count for a chat completion request: prompt tokens plus the completion budget"""
+    prompt_tokens = count_message_tokens(request.get('messages', []), request.get('model', 'gpt-3.5-turbo'))
+    return prompt_tokens + (request.get('max_tokens') or DEFAULT_COMPLETION_TOKENS)
+
+class RateLimitExceeded(Exception):
+    """Raised when a request is shed; scope is USER or GLOBAL"""
+
+    def __init__(self, scope, retry_after):
+        super().__init__(f"{scope} rate limit exceeded, retry after {retry_after:.0f}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+def rate_limit_message(error):
+    """Friendly Telegram reply for a shed request"""
+    seconds = max(1, int(math.ceil(error.retry_after)))
+    if error.scope == USER:
+        return f"⏳ You're going a bit fast! Please try again in {seconds} seconds."
+    return f"🚦 I'm handling a lot of requests right now. Please try again in {seconds} seconds."
+
+def _refill(tokens, updated_at, capacity, rate, now):
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+def _take(tokens, cost, capacity, rate):
+    """Return (new_tokens, wait_seconds); wait is 0 when cost was taken"""
+    cost = min(cost, capacity)
+    if cost <= tokens:
+        # Negative costs are refunds
+        return min(tokens - cost, capacity), 0.0
+    return tokens, (cost - tokens) / rate if rate > 0 else float('inf')
+
+class MemoryLimiterBackend:
+    """In-process buckets (per container only)"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, cost, capacity, rate):
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens, wait = _take(_refill(tokens, updated_at, capacity, rate, now), cost, capacity, rate)
+            self._buckets[key] = (tokens, now)
+            return wait
+
+class SQLiteLimiterBackend:
+    """SQLite buckets (put the file on EFS to share between containers)"""
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def take(self, key, cost, capacity, rate):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens, updated_at = row if row else (capacity, now)
+                tokens, wait = _take(_refill(tokens, updated_at, capacity, rate, now), cost, capacity, rate)
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now)
+                )
+                conn.execute("COMMIT")
+                return wait
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+class DynamoDBLimiterBackend:
+    """DynamoDB buckets with optimistic concurrency; idle buckets expire via DynamoDB TTL on expires_at"""
+
+    def __init__(self, table_name, region_name=None, endpoint_url=None, max_retries=5):
+        import boto3
+        self.max_retries = max_retries
+        self.table = boto3.resource(
+            'dynamodb',
+            region_name=region_name or os.environ.get('AWS_REGION', 'us-east-1'),
+            endpoint_url=endpoint_url
+        ).Table(table_name)
+
+    def take(self, key, cost, capacity, rate):
+        from botocore.exceptions import ClientError
+        pk = f"bucket#{key}"
+        for _ in range(self.max_retries):
+            now = time.time()
+            item = self.table.get_item(Key={'pk': pk}, ConsistentRead=True).get('Item')
+            if item:
+                state = json.loads(item['state'])
+                tokens = _refill(state['tokens'], state['updated_at'], capacity, rate, now)
+                version = int(item['version'])
+            else:
+                tokens, version = capacity, 0
+            tokens, wait = _take(tokens, cost, capacity, rate)
+            new_item = {
+                'pk': pk,
+                'state': json.dumps({'tokens': tokens, 'updated_at': now}),
+                'version': version + 1,
+                # A bucket left alone this long is full again anyway
+                'expires_at': int(now + capacity / rate) + 60 if rate > 0 else int(now) + 86400,
+            }
+            try:
+                if version == 0:
+                    self.table.put_item(Item=new_item, ConditionExpression='attribute_not_exists(pk)')
+                else:
+                    self.table.put_item(
+                        Item=new_item,
+                        ConditionExpression='version = :expected',
+                        ExpressionAttributeValues={':expected': version}
+                    )
+                return wait
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        logger.warning(f"Rate limit bucket {key} is contended, letting the request through")
+        return 0.0
+
+class RateLimiter:
+    """Per-user and global request/token buckets
+
+    acquire() takes from all four buckets or none: if a later bucket refuses,
+    the ones already taken from are refunded.
+    """
+
+    def __init__(self, backend=None, user_rpm=USER_REQUESTS_PER_MINUTE, user_tpm=USER_TOKENS_PER_MINUTE,
+                 global_rpm=GLOBAL_REQUESTS_PER_MINUTE, global_tpm=GLOBAL_TOKENS_PER_MINUTE,
+                 max_wait=MAX_WAIT_SECONDS):
+        self.backend = backend if backend is not None else MemoryLimiterBackend()
+        self.limits = {
+            (USER, 'requests'): user_rpm,
+            (USER, 'tokens'): user_tpm,
+            (GLOBAL, 'requests'): global_rpm,
+            (GLOBAL, 'tokens'): global_tpm,
+        }
+        self.max_wait = max_wait
+        self.allowed = 0
+        self.shed = 0
+        self.queued = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _try(self, user_id, tokens):
+        """Take from every bucket; returns (scope, wait) of the first refusal or None"""
+        taken = []
+        for (scope, unit), per_minute in self.limits.items():
+            if not per_minute or (scope == USER and user_id is None):
+                continue
+            cost = 1 if unit == 'requests' else tokens
+            if not cost:
+                continue
+            key = f"{scope}:{unit}:{user_id}" if scope == USER else f"{scope}:{unit}"
+            wait = self.backend.take(key, cost, per_minute, per_minute / 60.0)
+            if wait:
+                for taken_key, taken_cost, taken_limit in taken:
+                    self.backend.take(taken_key, -taken_cost, taken_limit, taken_limit / 60.0)
+                return scope, wait
+            taken.append((key, cost, per_minute))
+        return None
+
+    def acquire(self, user_id=None, tokens=0):
+        """Reserve capacity for one OpenAI call or raise RateLimitExceeded
+
+        Over the user's limit fails right away; over the global limit waits up
+        to max_wait seconds for capacity first.
+        """
+        deadline = time.time() + self.max_wait
+        while True:
+            try:
+                refused = self._try(user_id, tokens)
+            except Exception as e:
+                # Fail open: a broken limiter store must not stop the bot
+                self._count('errors')
+                logger.error(f"Rate limiter backend error, allowing the request: {e}")
+                return
+            if refused is None:
+                self._count('allowed')
+                return
+            scope, wait = refused
+            if scope == USER or time.time() + wait > deadline:
+                self._count('shed')
+                logger.warning(f"Shedding request for user {user_id}: {scope} limit, retry in {wait:.1f}s")
+                raise RateLimitExceeded(scope, wait)
+            self._count('queued')
+            time.sleep(wait)
+
+    def stats(self):
+        return {'allowed': self.allowed, 'queued': self.queued, 'shed': self.shed, 'errors': self.errors}
+
+def create_rate_limiter(backend_name=None, table_name=None):
+    """Create a limiter from RATE_LIMIT_BACKEND (memory, sqlite, dynamodb or none)"""
+    backend_name = (backend_name or os.environ.get('RATE_LIMIT_BACKEND', 'memory')).lower()
+    if backend_name == 'none':
+        return None
+    if backend_name == 'sqlite':
+        return RateLimiter(SQLiteLimiterBackend())
+    if backend_name == 'dynamodb':
+        return RateLimiter(DynamoDBLimiterBackend(
+            table_name or os.environ.get('DYNAMODB_TABLE_NAME', 'nutrition_tracker'),
+            endpoint_url=os.environ.get('DYNAMODB_ENDPOINT')
+        ))
+    return RateLimiter(MemoryLimiterBackend())
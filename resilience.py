@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Retries, circuit breakers and hedged requests for OpenAI and Telegram
+Transient failures (429, 5xx, timeouts, dropped connections) are retried with jittered exponential
+backoff that honors Retry-After. After repeated failures an upstream's breaker opens and calls fail
+fast instead of waiting out timeouts. Slow idempotent reads can be hedged with a second request.
+Every outcome is counted per upstream (see metrics.stats()).
+"""
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+OPENAI = 'openai'
+TELEGRAM = 'telegram'
+
+MAX_ATTEMPTS = int(os.environ.get('RESILIENCE_MAX_ATTEMPTS', 3))
+BASE_DELAY = float(os.environ.get('RESILIENCE_BASE_DELAY', 0.5))
+# Longest wait between attempts; a longer Retry-After fails the call instead of sleeping
+MAX_DELAY = float(os.environ.get('RESILIENCE_MAX_DELAY', 8))
+BREAKER_FAILURES = int(os.environ.get('RESILIENCE_BREAKER_FAILURES', 5))
+BREAKER_RESET_SECONDS = float(os.environ.get('RESILIENCE_BREAKER_RESET', 30))
+# Seconds before a hedged call sends a second request (0 disables hedging). Off for OpenAI by
+# default since a hedge is a second paid generation.
+HEDGE_AFTER = {
+    OPENAI: float(os.environ.get('RESILIENCE_OPENAI_HEDGE_AFTER', 0)),
+    TELEGRAM: float(os.environ.get('RESILIENCE_TELEGRAM_HEDGE_AFTER', 1.5)),
+}
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# requests, urllib3, httpx and openai names for timeouts and dropped connections
+TRANSIENT_ERRORS = {
+    'ConnectionError', 'TimeoutError', 'Timeout', 'ReadTimeout', 'ConnectTimeout', 'ChunkedEncodingError',
+    'ProtocolError', 'RemoteDisconnected', 'APIConnectionError', 'APITimeoutError', 'TransportError',
+}
+
+class CircuitOpen(Exception):
+    """Raised without calling the upstream while its breaker is open"""
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"{upstream} circuit open, retry after {retry_after:.0f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+class RetryableStatus(Exception):
+    """An HTTP response worth retrying (429/5xx); response is the last one received
+
+    body is the parsed JSON body (Telegram's 429 carries parameters.retry_after there), or None.
+    """
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+        self.status_code = response.status_code
+        try:
+            self.body = response.json()
+        except ValueError:
+            self.body = None
+
+def status_code_of(error):
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status if isinstance(status, int) else None
+
+def retry_after_of(error):
+    """Seconds the upstream asked us to wait (Retry-After header or Telegram's retry_after), or None"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    # RetryableStatus and the OpenAI SDK carry the JSON body as .body, telebot's errors as .result_json
+    body = getattr(error, 'body', None) or getattr(error, 'result_json', None)
+    if isinstance(body, dict):
+        retry_after = (body.get('parameters') or {}).get('retry_after')
+        if retry_after is not None:
+            return float(retry_after)
+    return None
+
+def is_retryable(error):
+    """True for rate limits, server errors, timeouts and dropped connections"""
+    if isinstance(error, (CircuitOpen, TypeError, ValueError, KeyError)):
+        return False
+    if getattr(error, 'code', None) == 'insufficient_quota':
+        # A 429 that waiting won't fix
+        return False
+    status = status_code_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+def backoff_delay(attempt, retry_after=None, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+    """Full-jitter exponential backoff, never shorter than the upstream's Retry-After"""
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = retry_after + random.uniform(0, base_delay)
+    return delay
+
+class ResilienceMetrics:
+    """Thread-safe per-upstream outcome counters"""
+
+    FIELDS = ('calls', 'successes', 'failures', 'retries', 'short_circuits', 'hedges', 'hedge_wins')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._upstreams = {}
+
+    def record(self, upstream, outcome):
+        with self._lock:
+            counters = self._upstreams.setdefault(upstream, dict.fromkeys(self.FIELDS, 0))
+            counters[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            return {upstream: dict(counters) for upstream, counters in self._upstreams.items()}
+
+    def reset(self):
+        with self._lock:
+            self._upstreams.clear()
+
+metrics = ResilienceMetrics()
+
+class CircuitBreaker:
+    """Closed -> open after `failures` consecutive failures -> half-open after reset_seconds
+
+    Half-open lets a single probe through; its success closes the breaker,
+    its failure opens it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failures
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raise CircuitOpen unless a call may go through now"""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.reset_seconds - time.time()
+                if remaining > 0:
+                    raise CircuitOpen(self.name, remaining)
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpen(self.name, self.reset_seconds)
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit {self.name} open for {self.reset_seconds:.0f}s after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+# Threads for hedged requests (shared across upstreams and warm invocations)
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='hedge')
+
+class Upstream:
+    """Retry policy, circuit breaker and hedging for one upstream service"""
+
+    def __init__(self, name, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY,
+                 hedge_after=0.0, breaker=None):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker(name)
+
+    def call(self, fn, attempts=None, hedge=False):
+        """Return fn() with retries; fn must be safe to repeat (use attempts=1 if not)
+
+        hedge=True sends a second fn() if the first hasn't answered after
+        hedge_after seconds and takes whichever succeeds first.
+        """
+        attempts = attempts or self.max_attempts
+        metrics.record(self.name, 'calls')
+        for attempt in range(1, attempts + 1):
+            try:
+                self.breaker.allow()
+            except CircuitOpen:
+                metrics.record(self.name, 'short_circuits')
+                raise
+            try:
+                result = self._hedged(fn) if hedge and self.hedge_after > 0 else fn()
+            except Exception as e:
+                if not is_retryable(e):
+                    # The upstream answered; the request itself was bad
+                    self.breaker.record_success()
+                    metrics.record(self.name, 'failures')
+                    raise
+                self.breaker.record_failure()
+                retry_after = retry_after_of(e)
+                if attempt == attempts or (retry_after is not None and retry_after > self.max_delay):
+                    metrics.record(self.name, 'failures')
+                    logger.error(f"{self.name} call failed after {attempt} attempt(s): {e}")
+                    raise
+                delay = backoff_delay(attempt, retry_after, self.base_delay, self.max_delay)
+                metrics.record(self.name, 'retries')
+                logger.warning(f"{self.name} call failed ({e}), retry {attempt}/{attempts - 1} in {delay:.2f}s")
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                metrics.record(self.name, 'successes')
+                return result
+
+    def _hedged(self, fn):
+        first = _hedge_pool.submit(fn)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+        metrics.record(self.name, 'hedges')
+        second = _hedge_pool.submit(fn)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        metrics.record(self.name, 'hedge_wins')
+                    # The slower request finishes in the background and is ignored
+                    return future.result()
+                error = future.exception()
+        raise error
+
+upstreams = {name: Upstream(name, hedge_after=hedge_after) for name, hedge_after in HEDGE_AFTER.items()}
+
+def call(upstream, fn, attempts=None, hedge=False):
+    """Run fn() through the named upstream's retries, breaker and hedging"""
+    return upstreams[upstream].call(fn, attempts=attempts, hedge=hedge)
+
+def send_request(upstream, method, url, session=None, attempts=None, hedge=False, **kwargs):
+    """session.request() with retries on 429/5xx; returns the last response like a plain request"""
+    if session is None:
+        from http_pool import get_session
+        session = get_session()
+
+    def attempt():
+        response = session.request(method, url, **kwargs)
+        if response.status_code in RETRYABLE_STATUS:
+            raise RetryableStatus(response)
+        return response
+
+    try:
+        return call(upstream, attempt, attempts=attempts, hedge=hedge)
+    except RetryableStatus as e:
+        return e.response
+
+def telebot_request_sender(method, url, **kwargs):
+    """apihelper.CUSTOM_REQUEST_SENDER that routes telebot's Bot API calls through the Telegram upstream"""
+    return send_request(TELEGRAM, method, url, hedge=url.endswith('/getFile'), **kwargs)
+
+def log_metrics():
+    """Log outcome counters and breaker states (handy at the end of an invocation)"""
+    for name, stats in metrics.stats().items():
+        logger.info(f"Upstream {name}: {stats} circuit={upstreams[name].breaker.state}")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Local shopping list extraction for NutritionGPT
+Aggregates the ingredients arrays of a meal plan without a second GPT call
+"""
+import json
+
+from shopping_list import ShoppingList
+from meal_plan_schema import repair_json
+
+MEALS = ['breakfast', 'lunch', 'dinner', 'snack']
+
+def parse_meal_plan(meal_plan_json):
+    """Parse the meal plan JSON returned by the model (None if it isn't valid)"""
+    if isinstance(meal_plan_json, dict):
+        return meal_plan_json
+    if not isinstance(meal_plan_json, str):
+        return None
+    text = meal_plan_json.strip()
+    # Remove markdown code blocks if present
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+    if text.endswith('```'):
+        text = text[:-3]
+    try:
+        plan = json.loads(text.strip())
+    except ValueError:
+        fixed = repair_json(text)
+        try:
+            plan = json.loads(fixed) if fixed else None
+        except ValueError:
+            return None
+    return plan if isinstance(plan, dict) and isinstance(plan.get('days'), list) else None
+
+def meal_plan_ingredients(plan):
+    """Yield every ingredient string in a parsed meal plan"""
+    for day in plan.get('days', []):
+        if not isinstance(day, dict):
+            continue
+        for meal in MEALS:
+            meal_info = day.get(meal)
+            if isinstance(meal_info, dict):
+                for ingredient in meal_info.get('ingredients') or []:
+                    yield ingredient
+
+def extract_shopping_items_locally(meal_plan_json):
+    """Build the shopping list text from the plan JSON (None if it can't be parsed)
+
+    Returns the same "- item" per line format as the GPT extraction.
+    """
+    plan = parse_meal_plan(meal_plan_json)
+    if plan is None:
+        return None
+    shopping_list = ShoppingList(
+        ingredient for ingredient in meal_plan_ingredients(plan)
+        if isinstance(ingredient, str) and ingredient.strip()
+    )
+    if not shopping_list:
+        return None
+    return '\n'.join(f"- {item}" for item in shopping_list.to_list())
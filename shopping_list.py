@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Shopping list data structure for NutritionGPT
+Insertion-ordered items indexed by normalized ingredient name, merging quantities of equivalent items
+"""
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# unit alias -> (dimension, factor to base unit, display unit)
+# base units: grams for mass, millilitres for volume, pieces for count
+UNITS = {
+    'g': ('mass', 1.0, 'g'), 'gram': ('mass', 1.0, 'g'), 'grams': ('mass', 1.0, 'g'),
+    'kg': ('mass', 1000.0, 'kg'), 'kilogram': ('mass', 1000.0, 'kg'), 'kilograms': ('mass', 1000.0, 'kg'),
+    'oz': ('mass', 28.3495, 'oz'), 'ounce': ('mass', 28.3495, 'oz'), 'ounces': ('mass', 28.3495, 'oz'),
+    'lb': ('mass', 453.592, 'lbs'), 'lbs': ('mass', 453.592, 'lbs'), 'pound': ('mass', 453.592, 'lbs'),
+    'pounds': ('mass', 453.592, 'lbs'),
+    'ml': ('volume', 1.0, 'ml'), 'millilitre': ('volume', 1.0, 'ml'), 'milliliter': ('volume', 1.0, 'ml'),
+    'l': ('volume', 1000.0, 'l'), 'litre': ('volume', 1000.0, 'l'), 'liter': ('volume', 1000.0, 'l'),
+    'tsp': ('volume', 4.92892, 'tsp'), 'teaspoon': ('volume', 4.92892, 'tsp'),
+    'teaspoons': ('volume', 4.92892, 'tsp'),
+    'tbsp': ('volume', 14.7868, 'tbsp'), 'tablespoon': ('volume', 14.7868, 'tbsp'),
+    'tablespoons': ('volume', 14.7868, 'tbsp'),
+    'cup': ('volume', 236.588, 'cups'), 'cups': ('volume', 236.588, 'cups'),
+    'dozen': ('count', 12.0, ''),
+}
+
+# Normalized (singular) name -> canonical name
+SYNONYMS = {
+    'scallion': 'green onion',
+    'spring onion': 'green onion',
+    'garbanzo bean': 'chickpea',
+    'garbanzo': 'chickpea',
+    'coriander leaf': 'cilantro',
+    'courgette': 'zucchini',
+    'aubergine': 'eggplant',
+    'capsicum': 'bell pepper',
+    'greek-style yogurt': 'greek yogurt',
+    'greek yoghurt': 'greek yogurt',
+    'yoghurt': 'yogurt',
+    'rolled oat': 'oat',
+    'oatmeal': 'oat',
+    'chicken breast fillet': 'chicken breast',
+    'boneless skinless chicken breast': 'chicken breast',
+    'extra virgin olive oil': 'olive oil',
+    'extra-virgin olive oil': 'olive oil',
+}
+
+# Preparation words that don't change what you buy
+DESCRIPTORS = {
+    'fresh', 'chopped', 'diced', 'sliced', 'minced', 'grated', 'shredded', 'cooked',
+    'raw', 'large', 'medium', 'small', 'boneless', 'skinless', 'lean', 'whole',
+    'finely', 'roughly', 'thinly', 'organic', 'low-fat', 'nonfat', 'plain',
+}
+
+UNICODE_FRACTIONS = {'½': 0.5, '⅓': 1 / 3, '⅔': 2 / 3, '¼': 0.25, '¾': 0.75, '⅛': 0.125}
+
+_QUANTITY_RE = re.compile(
+    r'^\s*(?P<qty>\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?|[½⅓⅔¼¾⅛])\s*'
+    r'(?P<frac>[½⅓⅔¼¾⅛])?\s*(?P<rest>.*)$'
+)
+_UNIT_RE = re.compile(r'^(?P<unit>[a-zA-Z]+)\.?\s+(?:of\s+)?(?P<name>.+)$')
+_PARENS_RE = re.compile(r'\([^)]*\)')
+_NON_WORD_RE = re.compile(r"[^a-z0-9\s\-']")
+
+def _parse_quantity(text):
+    text = text.strip()
+    if text in UNICODE_FRACTIONS:
+        return UNICODE_FRACTIONS[text]
+    if ' ' in text:
+        whole, frac = text.split()
+        return float(whole) + _parse_quantity(frac)
+    if '/' in text:
+        num, den = text.split('/')
+        return float(num) / float(den) if float(den) else 0.0
+    return float(text)
+
+def singularize(word):
+    """Very small English singularizer for ingredient nouns"""
+    if len(word) <= 3 or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith('oes'):
+        return word[:-2]
+    if word.endswith(('ches', 'shes', 'xes')):
+        return word[:-2]
+    if word.endswith('ves') and word not in ('chives', 'olives'):
+        return word[:-3] + 'f'
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+def normalize_name(name):
+    """Normalize an ingredient name (casing, plurals, descriptors, synonyms)"""
+    name = _PARENS_RE.sub(' ', name.lower())
+    name = name.split(',')[0]
+    name = _NON_WORD_RE.sub(' ', name)
+    words = [w for w in name.split() if w not in DESCRIPTORS]
+    if not words:
+        return ''
+    words[-1] = singularize(words[-1])
+    name = ' '.join(words)
+    return SYNONYMS.get(name, name)
+
+def parse_ingredient(text):
+    """Split an ingredient string into (quantity, unit, name); quantity/unit may be None"""
+    text = ' '.join(str(text).split())
+    quantity = None
+    unit = None
+    match = _QUANTITY_RE.match(text)
+    if match and match.group('rest'):
+        quantity = _parse_quantity(match.group('qty'))
+        if match.group('frac'):
+            quantity += UNICODE_FRACTIONS[match.group('frac')]
+        text = match.group('rest')
+        unit_match = _UNIT_RE.match(text)
+        if unit_match and unit_match.group('unit').lower() in UNITS:
+            unit = unit_match.group('unit').lower()
+            text = unit_match.group('name')
+    return quantity, unit, text.strip()
+
+def _format_quantity(value):
+    value = round(value, 2)
+    return str(int(value)) if value == int(value) else f"{value:g}"
+
+class ShoppingItem:
+    """One shopping list entry; total is kept in the base unit of its dimension"""
+    __slots__ = ('key', 'display', 'dimension', 'unit', 'total')
+
+    def __init__(self, key, display):
+        self.key = key
+        self.display = display
+        self.dimension = None
+        self.unit = None
+        self.total = 0.0
+
+    def merge(self, quantity, unit):
+        """Add a quantity to this item; returns False if the units can't be combined"""
+        if quantity is None:
+            return True
+        dimension, factor, _ = UNITS.get(unit, ('count', 1.0, ''))
+        if self.dimension is None:
+            self.dimension = dimension
+            self.unit = unit or ''
+        elif self.dimension != dimension:
+            # Can't add grams to pieces; keep the first measurement
+            return False
+        self.total += quantity * factor
+        return True
+
+    def __str__(self):
+        if not self.total:
+            return self.display
+        if self.dimension == 'count':
+            return f"{_format_quantity(self.total)} {self.display}"
+        _, factor, display_unit = UNITS[self.unit]
+        return f"{_format_quantity(self.total / factor)} {display_unit} {self.display}"
+
+class ShoppingList:
+    """Insertion-ordered shopping list with O(1) lookup by normalized ingredient name
+
+    "2 Eggs" and "1 egg" are the same entry ("3 eggs"). Serializes to a plain
+    list of display strings, the format stored in user state.
+    """
+
+    def __init__(self, items=None):
+        self._items = {}
+        for item in items or []:
+            self.add(item)
+
+    def add(self, text):
+        """Add an item string; returns True if it created a new entry, False if merged"""
+        quantity, unit, name = parse_ingredient(text)
+        key = normalize_name(name)
+        if not key:
+            return False
+        item = self._items.get(key)
+        if item is None:
+            item = self._items[key] = ShoppingItem(key, name.split(',')[0].strip().lower())
+            item.merge(quantity, unit)
+            return True
+        if not item.merge(quantity, unit):
+            logger.info(f"Not merging '{text}' into '{item}': incompatible units")
+        return False
+
+    def remove(self, text):
+        """Remove the entry matching text; returns True if one was removed"""
+        return self._items.pop(normalize_name(parse_ingredient(text)[2]), None) is not None
+
+    def get(self, text):
+        return self._items.get(normalize_name(parse_ingredient(text)[2]))
+
+    def __contains__(self, text):
+        return self.get(text) is not None
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def to_list(self):
+        """Serialize to a list of display strings"""
+        return [str(item) for item in self._items.values()]
+
+    @classmethod
+    def from_list(cls, items):
+        """Rebuild a list serialized with to_list()"""
+        return cls(items)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Single-flight coalescing of identical concurrent calls
+When many users ask for the same meal plan at once, one caller (the leader) makes the OpenAI
+request and every concurrent identical caller gets its result. Inside a container callers wait on
+the leader's thread; across containers a lock record in SQLite (on EFS) or DynamoDB marks the
+leader and carries the result back to the waiting containers.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+# A lock must outlive the slowest generation; a published result only needs to reach the waiters
+LOCK_TTL = int(os.environ.get('SINGLE_FLIGHT_LOCK_TTL', 120))
+RESULT_TTL = int(os.environ.get('SINGLE_FLIGHT_RESULT_TTL', 60))
+POLL_INTERVAL = float(os.environ.get('SINGLE_FLIGHT_POLL_INTERVAL', 0.25))
+# How long another container's leader is waited for before generating anyway
+MAX_WAIT_SECONDS = float(os.environ.get('SINGLE_FLIGHT_MAX_WAIT', 60))
+DEFAULT_SQLITE_PATH = os.environ.get('SINGLE_FLIGHT_SQLITE_PATH', '/tmp/nutritiongpt_flights.db')
+
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+
+class SQLiteFlightBackend:
+    """Flight locks and results in SQLite (put the file on EFS to share between containers)"""
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS flights ("
+                "key TEXT PRIMARY KEY, state TEXT NOT NULL, result TEXT, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def acquire(self, key, ttl):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM flights WHERE expires_at <= ?", (now,))
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO flights (key, state, expires_at) VALUES (?, ?, ?)",
+                    (key, IN_FLIGHT, now + ttl)
+                )
+                conn.execute("COMMIT")
+                return cursor.rowcount == 1
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def publish(self, key, result, ttl):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE flights SET state = ?, result = ?, expires_at = ? WHERE key = ?",
+                (DONE, json.dumps(result), time.time() + ttl, key)
+            )
+
+    def peek(self, key):
+        """(state, result) of a live flight, or None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT state, result FROM flights WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]) if row[1] is not None else None
+
+    def release(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM flights WHERE key = ?", (key,))
+
+class DynamoDBFlightBackend:
+    """Flight locks and results in DynamoDB (enable TTL on the expires_at attribute)"""
+
+    def __init__(self, table_name, region_name=None, endpoint_url=None):
+        import boto3
+        self.table = boto3.resource(
+            'dynamodb',
+            region_name=region_name or os.environ.get('AWS_REGION', 'us-east-1'),
+            endpoint_url=endpoint_url
+        ).Table(table_name)
+
+    def acquire(self, key, ttl):
+        from botocore.exceptions import ClientError
+        now = int(time.time())
+        try:
+            self.table.put_item(
+                Item={'pk': f"flight#{key}", 'state': IN_FLIGHT, 'expires_at': now + ttl},
+                ConditionExpression='attribute_not_exists(pk) OR expires_at <= :now',
+                ExpressionAttributeValues={':now': now}
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def publish(self, key, result, ttl):
+        self.table.update_item(
+            Key={'pk': f"flight#{key}"},
+            UpdateExpression='SET #s = :state, #r = :result, expires_at = :expires',
+            ExpressionAttributeNames={'#s': 'state', '#r': 'result'},
+            ExpressionAttributeValues={
+                ':state': DONE, ':result': json.dumps(result), ':expires': int(time.time()) + ttl
+            }
+        )
+
+    def peek(self, key):
+        item = self.table.get_item(Key={'pk': f"flight#{key}"}, ConsistentRead=True).get('Item')
+        if not item or int(item['expires_at']) <= time.time():
+            return None
+        result = item.get('result')
+        return item['state'], json.loads(result) if result is not None else None
+
+    def release(self, key):
+        self.table.delete_item(Key={'pk': f"flight#{key}"})
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Coalesce concurrent do(key, fn) calls so fn runs once per key at a time
+
+    With a backend the coalescing also spans containers. Results shared
+    across containers must be JSON-serializable.
+    """
+
+    def __init__(self, backend=None, lock_ttl=LOCK_TTL, result_ttl=RESULT_TTL, poll_interval=POLL_INTERVAL,
+                 max_wait=MAX_WAIT_SECONDS):
+        self.backend = backend
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.leaders = 0
+        self.coalesced = 0
+        self.remote_hits = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def do(self, key, fn):
+        """Return fn(), or the result of an identical call already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self._count('coalesced')
+            call.done.wait()
+            if call.error is not None:
+                # The leader's error is its own (e.g. its user's rate limit), so try for ourselves
+                return self.do(key, fn)
+            return call.result
+
+        try:
+            call.result = self._run_shared(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def do_async(self, key, fn):
+        """do() for coroutines; fn is a plain callable run on the default executor"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.do, key, fn)
+
+    def wrap(self, key, fn):
+        """Callable that runs fn through do(key, fn)"""
+        return lambda: self.do(key, fn)
+
+    def _run_shared(self, key, fn):
+        """Run fn as this container's leader, coordinating with other containers via the backend"""
+        if self.backend is None:
+            self._count('leaders')
+            return fn()
+
+        deadline = time.time() + self.max_wait
+        while True:
+            try:
+                acquired = self.backend.acquire(key, self.lock_ttl)
+            except Exception as e:
+                # Fail open: a broken lock store must not stop generation
+                logger.error(f"Single-flight backend error, running anyway: {e}")
+                self._count('leaders')
+                return fn()
+
+            if acquired:
+                self._count('leaders')
+                try:
+                    result = fn()
+                except Exception:
+                    self.backend.release(key)
+                    raise
+                if result is None:
+                    # Nothing to share; let a waiting container try itself
+                    self.backend.release(key)
+                else:
+                    self.backend.publish(key, result, self.result_ttl)
+                return result
+
+            while time.time() < deadline:
+                time.sleep(self.poll_interval)
+                flight = self.backend.peek(key)
+                if flight is None:
+                    # The leader failed or its lock expired - race for the lock again
+                    break
+                state, result = flight
+                if state == DONE:
+                    self._count('remote_hits')
+                    return result
+            else:
+                logger.warning(f"Gave up waiting for flight {key[:12]} after {self.max_wait:.0f}s, running anyway")
+                self._count('leaders')
+                return fn()
+
+    def stats(self):
+        return {'leaders': self.leaders, 'coalesced': self.coalesced, 'remote_hits': self.remote_hits}
+
+def create_single_flight(backend_name=None):
+    """Create a SingleFlight from SINGLE_FLIGHT_BACKEND (memory, sqlite, dynamodb or none)
+
+    memory coalesces within a container only.
+    """
+    backend_name = (backend_name or os.environ.get('SINGLE_FLIGHT_BACKEND', 'memory')).lower()
+    if backend_name == 'none':
+        return None
+    if backend_name == 'sqlite':
+        return SingleFlight(SQLiteFlightBackend())
+    if backend_name == 'dynamodb':
+        return SingleFlight(DynamoDBFlightBackend(
+            os.environ.get('DYNAMODB_TABLE_NAME', 'nutrition_tracker'),
+            endpoint_url=os.environ.get('DYNAMODB_ENDPOINT')
+        ))
+    return SingleFlight()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Speech-to-text backends for voice commands
+Short clips ("plan meals for 3 days") go to a local CPU Whisper model running in a process pool;
+long or streamed notes, and anything the local engine fails on, go to the OpenAI Whisper API.
+The local engine needs the optional faster-whisper package (pip install faster-whisper).
+"""
+import importlib.util
+import io
+import logging
+import os
+import threading
+import time
+
+from voice_audio import whisper_file, is_streamed
+from resilience import OPENAI, call
+
+logger = logging.getLogger(__name__)
+
+# api (default), local or auto (route by clip length)
+STT_BACKEND = os.environ.get('STT_BACKEND', 'api').lower()
+LOCAL_STT_MODEL = os.environ.get('LOCAL_STT_MODEL', 'tiny.en')
+LOCAL_STT_COMPUTE_TYPE = os.environ.get('LOCAL_STT_COMPUTE_TYPE', 'int8')
+# 0 runs the model in-process (e.g. on Lambda, which has no /dev/shm for multiprocessing)
+LOCAL_STT_WORKERS = int(os.environ.get('LOCAL_STT_WORKERS', 1))
+LOCAL_STT_TIMEOUT = float(os.environ.get('LOCAL_STT_TIMEOUT', 10))
+# Routing limits for auto mode
+LOCAL_MAX_DURATION = float(os.environ.get('LOCAL_STT_MAX_DURATION', 15))
+LOCAL_MAX_BYTES = int(os.environ.get('LOCAL_STT_MAX_BYTES', 256 * 1024))
+
+class WhisperAPIBackend:
+    """OpenAI Whisper API (accepts bytes or a download stream)"""
+    name = 'api'
+
+    def __init__(self, client, model='whisper-1'):
+        self.client = client
+        self.model = model
+
+    def transcribe(self, audio):
+        # A stream can only be sent once, so neither the SDK nor resilience may retry it
+        streamed = is_streamed(audio)
+        client = self.client.with_options(max_retries=0) if streamed else self.client
+        return call(
+            OPENAI, lambda: client.audio.transcriptions.create(model=self.model, file=whisper_file(audio)).text,
+            attempts=1 if streamed else None
+        )
+
+# Model loaded once per worker process (or once in-process when workers=0)
+_local_model = None
+_local_model_lock = threading.Lock()
+
+def _load_local_model(model_size, compute_type):
+    global _local_model
+    with _local_model_lock:
+        if _local_model is None:
+            from faster_whisper import WhisperModel
+            _local_model = WhisperModel(model_size, device='cpu', compute_type=compute_type, cpu_threads=1)
+    return _local_model
+
+def _transcribe_locally(audio, model_size, compute_type, language):
+    model = _load_local_model(model_size, compute_type)
+    segments, _ = model.transcribe(io.BytesIO(audio), language=language, beam_size=1, vad_filter=True)
+    return ' '.join(segment.text.strip() for segment in segments).strip()
+
+class LocalWhisperBackend:
+    """CPU-only faster-whisper model, run in a process pool so decoding doesn't hold the GIL"""
+    name = 'local'
+
+    def __init__(self, model_size=LOCAL_STT_MODEL, compute_type=LOCAL_STT_COMPUTE_TYPE,
+                 workers=LOCAL_STT_WORKERS, timeout=LOCAL_STT_TIMEOUT, language='en'):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.workers = workers
+        self.timeout = timeout
+        self.language = language
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        if self.workers <= 0:
+            return None
+        with self._lock:
+            if self._pool is None:
+                from concurrent.futures import ProcessPoolExecutor
+                try:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        initializer=_load_local_model,
+                        initargs=(self.model_size, self.compute_type)
+                    )
+                except OSError as e:
+                    # No working multiprocessing here (AWS Lambda); run in-process instead
+                    logger.warning(f"Process pool unavailable ({e}), running local STT in-process")
+                    self.workers = 0
+            return self._pool
+
+    def transcribe(self, audio):
+        if is_streamed(audio):
+            audio = audio.read()
+        args = (bytes(audio), self.model_size, self.compute_type, self.language)
+        pool = self._get_pool()
+        if pool is None:
+            return _transcribe_locally(*args)
+        from concurrent.futures.process import BrokenProcessPool
+        try:
+            return pool.submit(_transcribe_locally, *args).result(timeout=self.timeout)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool next time
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False)
+            raise
+
+    def warm_up(self):
+        """Start the pool and load the model ahead of the first request"""
+        pool = self._get_pool()
+        if pool is None:
+            _load_local_model(self.model_size, self.compute_type)
+        else:
+            pool.submit(_load_local_model, self.model_size, self.compute_type).result()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+class RoutingTranscriber:
+    """Sends short clips to the local backend and everything else to the API
+
+    A clip is short when its Telegram duration (seconds) and size are under the
+    limits. Local failures or empty results fall back to the API.
+    """
+
+    def __init__(self, api=None, local=None, max_local_duration=LOCAL_MAX_DURATION,
+                 max_local_bytes=LOCAL_MAX_BYTES):
+        self.api = api
+        self.local = local
+        self.max_local_duration = max_local_duration
+        self.max_local_bytes = max_local_bytes
+        self.counts = {'api': 0, 'local': 0, 'fallback': 0}
+        self.elapsed = {'api': 0.0, 'local': 0.0}
+        self._lock = threading.Lock()
+
+    def _record(self, backend, elapsed=None, counter=None):
+        with self._lock:
+            self.counts[counter or backend.name] += 1
+            if elapsed is not None:
+                self.elapsed[backend.name] += elapsed
+
+    def choose(self, audio, duration=None):
+        """Backend to try first for this clip"""
+        if self.local is None:
+            return self.api
+        if self.api is None:
+            return self.local
+        if is_streamed(audio):
+            return self.api
+        if duration is not None and duration > self.max_local_duration:
+            return self.api
+        if len(audio) > self.max_local_bytes:
+            return self.api
+        return self.local
+
+    def transcribe(self, audio, duration=None):
+        """Transcribe audio (bytes or stream); duration is the voice note length if known"""
+        backend = self.choose(audio, duration)
+        start = time.perf_counter()
+        try:
+            text = backend.transcribe(audio)
+            self._record(backend, time.perf_counter() - start)
+            if text or backend is not self.local or self.api is None:
+                return text
+            logger.info("Local transcription was empty, retrying with the API")
+        except Exception as e:
+            if backend is not self.local or self.api is None:
+                raise
+            logger.warning(f"Local transcription failed ({e}), retrying with the API")
+
+        self._record(self.api, counter='fallback')
+        start = time.perf_counter()
+        text = self.api.transcribe(audio)
+        self._record(self.api, time.perf_counter() - start)
+        return text
+
+    def stats(self):
+        """Per-backend call counts and average latency (ms)"""
+        with self._lock:
+            return {
+                **self.counts,
+                **{f"{name}_avg_ms": round(self.elapsed[name] / self.counts[name] * 1000, 1)
+                   for name in ('api', 'local') if self.counts[name]}
+            }
+
+def create_transcriber(client, backend_name=None):
+    """Create a transcriber from STT_BACKEND (api, local or auto)"""
+    backend_name = (backend_name or STT_BACKEND).lower()
+    api = WhisperAPIBackend(client)
+    if backend_name in ('local', 'auto') and importlib.util.find_spec('faster_whisper') is None:
+        logger.warning(f"STT_BACKEND={backend_name} needs faster-whisper, which isn't installed; using the Whisper API")
+        backend_name = 'api'
+    if backend_name == 'local':
+        return RoutingTranscriber(api=None, local=LocalWhisperBackend())
+    if backend_name == 'auto':
+        return RoutingTranscriber(api=api, local=LocalWhisperBackend())
+    return RoutingTranscriber(api=api)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Tests for preference_index.PreferenceIndex with a stub embedder
+Vectors are fixed per canonical preference text, so similarities are exact and the
+threshold, constraint and index behaviour can be checked without the local hashing embedder.
+"""
+import math
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from preference_index import BruteForceIndex, LocalEmbedder, LSHIndex, PreferenceIndex
+
+MODEL = 'gpt-3.5-turbo'
+TEMPERATURE = 0.7
+
+class StubEmbedder:
+    """Vectors looked up by canonical preference text; unknown texts get a fixed orthogonal vector"""
+
+    def __init__(self, vectors, dimensions=3):
+        self.vectors = {text: np.asarray(vector, dtype=np.float32) for text, vector in vectors.items()}
+        self.dimensions = dimensions
+        self.calls = 0
+
+    def embed(self, texts):
+        self.calls += 1
+        fallback = np.zeros(self.dimensions, dtype=np.float32)
+        fallback[-1] = 1.0
+        return [self.vectors.get(text, fallback) for text in texts]
+
+def unit_at(cosine):
+    """3-d unit vector whose cosine with [1, 0, 0] is cosine"""
+    return [cosine, math.sqrt(1 - cosine ** 2), 0.0]
+
+def add(index, key, preferences, days=3):
+    index.add(key, days, preferences, MODEL, TEMPERATURE)
+
+def lookup(index, preferences, days=3):
+    return index.lookup(days, preferences, MODEL, TEMPERATURE)
+
+def test_threshold():
+    embedder = StubEmbedder({
+        'keto': [1.0, 0.0, 0.0],
+        'ketogenic diet': unit_at(0.95),
+        'low sugar': unit_at(0.8),
+    })
+    index = PreferenceIndex(embedder, threshold=0.9)
+    add(index, 'key-keto', 'keto')
+
+    key, similarity = lookup(index, 'ketogenic diet')
+    assert key == 'key-keto'
+    assert similarity == pytest.approx(0.95, abs=1e-6)
+    assert lookup(index, 'low sugar') is None
+    assert index.stats()['hits'] == 1
+    assert index.stats()['misses'] == 1
+
+def test_threshold_is_per_partition():
+    embedder = StubEmbedder({'keto': [1.0, 0.0, 0.0]})
+    index = PreferenceIndex(embedder, threshold=0.9)
+    add(index, 'key-keto', 'keto', days=3)
+
+    assert lookup(index, 'keto', days=5) is None
+    assert index.lookup(3, 'keto', MODEL, 0.2) is None
+    assert lookup(index, 'keto', days=3) == ('key-keto', pytest.approx(1.0))
+
+def test_constraints_reject_close_neighbours():
+    # Same vector for both: only the hard constraints tell them apart
+    same = [1.0, 0.0, 0.0]
+    embedder = StubEmbedder({'vegetarian': same, 'no nut, vegetarian': same})
+    index = PreferenceIndex(embedder, threshold=0.9)
+    add(index, 'key-vegetarian', 'vegetarian')
+
+    # A plain vegetarian plan may contain nuts
+    assert lookup(index, 'vegetarian, no nuts') is None
+    assert index.stats()['rejected'] == 1
+
+    add(index, 'key-nut-free', 'Vegetarian, nut-free')
+    assert lookup(index, 'vegetarian, no nuts')[0] == 'key-nut-free'
+    # The stricter plan satisfies the looser request too
+    assert lookup(index, 'veggie')[0] in ('key-vegetarian', 'key-nut-free')
+
+def test_protein_target_is_a_constraint():
+    index = PreferenceIndex(LocalEmbedder(), threshold=0.9)
+    low = 'vegetarian, no nuts, gluten free, 60g protein'
+    high = 'vegetarian, no nuts, gluten free, 150g protein'
+    # Near-identical text: the local embedder alone would serve one for the other
+    assert float(index._embed(low) @ index._embed(high)) > 0.9
+    add(index, 'key-60g', low)
+
+    assert lookup(index, high) is None
+    assert index.stats()['rejected'] == 1
+
+    add(index, 'key-150g', high)
+    assert lookup(index, high)[0] == 'key-150g'
+
+def test_calorie_target_is_a_constraint():
+    same = [1.0, 0.0, 0.0]
+    embedder = StubEmbedder({
+        '1800 calories, keto': same, '1850 calories, keto': same, '1200 calories, keto': same, 'keto': same
+    })
+    index = PreferenceIndex(embedder, threshold=0.9)
+    add(index, 'key-1800', 'keto, 1800 calories')
+
+    assert lookup(index, 'keto, 1200 calories') is None
+    # Within the tolerance of the stored target
+    assert lookup(index, 'keto, 1850 calories')[0] == 'key-1800'
+    # A request without a target can use a plan that had one
+    assert lookup(index, 'keto')[0] == 'key-1800'
+
+    add(index, 'key-keto', 'keto')
+    assert lookup(index, 'keto, 1800 calories')[0] == 'key-1800'
+
+def test_embeddings_are_memoized():
+    embedder = StubEmbedder({'vegan': [1.0, 0.0, 0.0]})
+    index = PreferenceIndex(embedder)
+    add(index, 'key-vegan', 'vegan')
+    lookup(index, 'Vegan')
+    lookup(index, 'vegan')
+    assert embedder.calls == 1
+
+def test_brute_force_and_lsh_agree():
+    rng = np.random.default_rng(7)
+    dimensions = 32
+    stored = rng.standard_normal((200, dimensions)).astype(np.float32)
+    noisy = stored + 0.02 * rng.standard_normal(stored.shape).astype(np.float32)
+    vectors = {f'stored {i}': vector for i, vector in enumerate(stored)}
+    vectors.update({f'query {i}': vector for i, vector in enumerate(noisy)})
+    embedder = StubEmbedder(vectors, dimensions)
+
+    brute = PreferenceIndex(embedder, 'brute', threshold=0.9)
+    lsh = PreferenceIndex(embedder, 'lsh', threshold=0.9)
+    for i in range(len(stored)):
+        add(brute, f'key-{i}', f'stored {i}')
+        add(lsh, f'key-{i}', f'stored {i}')
+
+    for i in range(len(stored)):
+        expected = lookup(brute, f'query {i}')
+        assert expected[0] == f'key-{i}'
+        # Same neighbour; the similarity only differs by float32 rounding of the re-rank
+        assert lookup(lsh, f'query {i}') == (expected[0], pytest.approx(expected[1]))
+
+def test_lsh_search_matches_brute_force_top_k():
+    rng = np.random.default_rng(11)
+    vectors = rng.standard_normal((500, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    brute, lsh = BruteForceIndex(16), LSHIndex(16)
+    for vector in vectors:
+        brute.add(vector)
+        lsh.add(vector)
+
+    for vector in vectors[:50]:
+        assert lsh.search(vector, k=1)[0][1] == brute.search(vector, k=1)[0][1]
+
+def test_compact_keeps_newest_half():
+    embedder = StubEmbedder({f'diet {i}': np.eye(8, dtype=np.float32)[i] for i in range(8)}, dimensions=8)
+    index = PreferenceIndex(embedder, threshold=0.9, max_entries=4)
+    for i in range(5):
+        add(index, f'key-{i}', f'diet {i}')
+
+    # Full at 4: the newest 2 were kept, then the fifth added
+    assert index.stats()['entries'] == 3
+    for i in range(2):
+        assert lookup(index, f'diet {i}') is None
+    for i in range(2, 5):
+        assert lookup(index, f'diet {i}') == (f'key-{i}', pytest.approx(1.0))
+
+    # Dropped keys are forgotten, so they can be indexed again
+    add(index, 'key-0', 'diet 0')
+    assert lookup(index, 'diet 0')[0] == 'key-0'
+
+def test_compact_keeps_constraints_aligned():
+    same = [1.0, 0.0, 0.0]
+    embedder = StubEmbedder({'vegan': same, 'keto': same, 'no dairy': same, 'paleo': same})
+    index = PreferenceIndex(embedder, threshold=0.9, max_entries=2)
+    add(index, 'key-vegan', 'vegan')
+    add(index, 'key-keto', 'keto')
+    add(index, 'key-no-dairy', 'no dairy')
+
+    assert lookup(index, 'vegan') is None
+    assert lookup(index, 'keto')[0] == 'key-keto'
+    assert lookup(index, 'no dairy')[0] == 'key-no-dairy'
+    assert lookup(index, 'paleo') is None
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Voice transcription cache for NutritionGPT
+Forwarded voice notes keep their Telegram file_unique_id, so a repeat skips both the download
+and the Whisper call. Re-uploads of the same audio are caught by a content hash after download.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from meal_plan_cache import MemoryCacheBackend, DiskCacheBackend
+
+logger = logging.getLogger(__name__)
+
+# Defaults (override with environment variables)
+DEFAULT_TTL_SECONDS = int(os.environ.get('TRANSCRIPTION_CACHE_TTL', 30 * 24 * 3600))
+DEFAULT_MAX_ENTRIES = int(os.environ.get('TRANSCRIPTION_CACHE_MAX_ENTRIES', 2048))
+DEFAULT_CACHE_DIR = os.environ.get('TRANSCRIPTION_CACHE_DIR', '/tmp/nutritiongpt_transcriptions')
+
+def file_key(file_unique_id):
+    """Cache key for a Telegram file_unique_id"""
+    return f"file-{file_unique_id}"
+
+def audio_key(audio):
+    """Cache key for the audio bytes themselves"""
+    return f"sha256-{hashlib.sha256(audio).hexdigest()}"
+
+class DynamoDBTranscriptionBackend:
+    """DynamoDB backend shared by all containers; expired items are removed by DynamoDB TTL on expires_at"""
+
+    def __init__(self, table_name, ttl=DEFAULT_TTL_SECONDS, region_name=None, endpoint_url=None):
+        import boto3
+        self.ttl = ttl
+        self.table = boto3.resource(
+            'dynamodb',
+            region_name=region_name or os.environ.get('AWS_REGION', 'us-east-1'),
+            endpoint_url=endpoint_url
+        ).Table(table_name)
+
+    def get(self, key):
+        item = self.table.get_item(Key={'pk': f"transcript#{key}"}).get('Item')
+        return json.loads(item['entry']) if item else None
+
+    def set(self, key, entry):
+        item = {'pk': f"transcript#{key}", 'entry': json.dumps(entry)}
+        if self.ttl:
+            item['expires_at'] = int(entry['created_at'] + self.ttl)
+        self.table.put_item(Item=item)
+
+    def delete(self, key):
+        self.table.delete_item(Key={'pk': f"transcript#{key}"})
+
+    def __len__(self):
+        return 0
+
+class TranscriptionCache:
+    """TTL-bounded transcription cache keyed on file_unique_id with an audio hash fallback"""
+
+    def __init__(self, backend=None, ttl=DEFAULT_TTL_SECONDS):
+        self.backend = backend if backend is not None else MemoryCacheBackend(DEFAULT_MAX_ENTRIES)
+        self.ttl = ttl
+        self.hits = 0
+        self.hash_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key):
+        """Return the cached text for key, or None if missing/expired"""
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            logger.error(f"Error reading transcription cache: {e}")
+            return None
+        if not entry:
+            return None
+        if self.ttl and time.time() - entry.get('created_at', 0) > self.ttl:
+            self.backend.delete(key)
+            return None
+        return entry.get('text')
+
+    def put(self, keys, text):
+        """Store text under every key in keys"""
+        entry = {'created_at': time.time(), 'text': text}
+        for key in keys:
+            try:
+                self.backend.set(key, entry)
+            except Exception as e:
+                logger.error(f"Error writing transcription cache: {e}")
+
+    def transcribe(self, transcribe, fetch_audio, file_unique_id=None):
+        """Return a cached transcription or fetch_audio() and transcribe(audio) on a miss
+
+        Only audio returned as bytes can be hashed; streamed notes are cached by
+        file_unique_id alone.
+        """
+        keys = [file_key(file_unique_id)] if file_unique_id else []
+        if keys:
+            text = self.get(keys[0])
+            if text is not None:
+                self._count('hits')
+                logger.info("Transcription cache hit (file_unique_id)")
+                return text
+
+        audio = fetch_audio()
+        if isinstance(audio, (bytes, bytearray)):
+            keys.append(audio_key(audio))
+            text = self.get(keys[-1])
+            if text is not None:
+                self._count('hash_hits')
+                logger.info("Transcription cache hit (audio hash)")
+                self.put(keys[:-1], text)
+                return text
+
+        self._count('misses')
+        text = transcribe(audio)
+        if text:
+            self.put(keys, text)
+        return text
+
+    def stats(self):
+        """Return hit/miss counters"""
+        lookups = self.hits + self.hash_hits + self.misses
+        return {
+            'hits': self.hits,
+            'hash_hits': self.hash_hits,
+            'misses': self.misses,
+            'entries': len(self.backend),
+            'hit_rate': round((self.hits + self.hash_hits) / lookups, 3) if lookups else 0.0
+        }
+
+def create_transcription_cache(backend_name=None, table_name=None):
+    """Create a cache from TRANSCRIPTION_CACHE_BACKEND (memory, disk, dynamodb or none)"""
+    backend_name = (backend_name or os.environ.get('TRANSCRIPTION_CACHE_BACKEND', 'memory')).lower()
+    if backend_name == 'none':
+        return None
+    if backend_name == 'disk':
+        return TranscriptionCache(DiskCacheBackend(DEFAULT_CACHE_DIR, DEFAULT_MAX_ENTRIES))
+    if backend_name == 'dynamodb':
+        return TranscriptionCache(DynamoDBTranscriptionBackend(
+            table_name or os.environ.get('DYNAMODB_TABLE_NAME', 'nutrition_tracker'),
+            endpoint_url=os.environ.get('DYNAMODB_ENDPOINT')
+        ))
+    return TranscriptionCache(MemoryCacheBackend(DEFAULT_MAX_ENTRIES))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Idempotent processing of Telegram updates
+Telegram redelivers an update when the webhook is slow; this drops duplicates by update_id and chat
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+# An in-flight marker must outlive the slowest invocation, a done marker Telegram's retry window
+IN_FLIGHT_TTL = int(os.environ.get('DEDUP_IN_FLIGHT_TTL', 300))
+DONE_TTL = int(os.environ.get('DEDUP_DONE_TTL', 24 * 3600))
+DEFAULT_WINDOW_SIZE = int(os.environ.get('DEDUP_WINDOW_SIZE', 10000))
+DEFAULT_SQLITE_PATH = os.environ.get('DEDUP_SQLITE_PATH', '/tmp/nutritiongpt_dedup.db')
+
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+
+def update_key(update):
+    """Build the idempotency key for a Telegram update (None if it has no update_id)"""
+    update_id = update.get('update_id') if isinstance(update, dict) else None
+    if update_id is None:
+        return None
+    message = update.get('message') or update.get('callback_query', {}).get('message') or {}
+    chat_id = message.get('chat', {}).get('id', '')
+    return f"{chat_id}:{update_id}"
+
+class MemoryDedupBackend:
+    """Bounded sliding window of recently seen keys (per container)"""
+
+    def __init__(self, window_size=DEFAULT_WINDOW_SIZE):
+        self.window_size = window_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key, ttl):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return False
+            self._entries[key] = (IN_FLIGHT, now + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.window_size:
+                self._entries.popitem(last=False)
+            return True
+
+    def mark_done(self, key, ttl):
+        with self._lock:
+            self._entries[key] = (DONE, time.time() + ttl)
+            self._entries.move_to_end(key)
+
+    def release(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class SQLiteDedupBackend:
+    """SQLite backend (survives warm restarts; put it on EFS to share between containers)"""
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, window_size=DEFAULT_WINDOW_SIZE):
+        self.path = path
+        self.window_size = window_size
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS processed_updates ("
+                "key TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def claim(self, key, ttl):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM processed_updates WHERE key = ? AND expires_at <= ?", (key, now))
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO processed_updates (key, state, expires_at) VALUES (?, ?, ?)",
+                    (key, IN_FLIGHT, now + ttl)
+                )
+                claimed = cursor.rowcount == 1
+                if claimed:
+                    # Keep the window bounded
+                    conn.execute(
+                        "DELETE FROM processed_updates WHERE expires_at <= ? OR rowid <= "
+                        "(SELECT MAX(rowid) FROM processed_updates) - ?",
+                        (now, self.window_size)
+                    )
+                conn.execute("COMMIT")
+                return claimed
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def mark_done(self, key, ttl):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE processed_updates SET state = ?, expires_at = ? WHERE key = ?",
+                (DONE, time.time() + ttl, key)
+            )
+
+    def release(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM processed_updates WHERE key = ?", (key,))
+
+class DynamoDBDedupBackend:
+    """DynamoDB backend shared by all containers (enable TTL on the expires_at attribute)"""
+
+    def __init__(self, table_name, region_name=None, endpoint_url=None):
+        import boto3
+        self.table = boto3.resource(
+            'dynamodb',
+            region_name=region_name or os.environ.get('AWS_REGION', 'us-east-1'),
+            endpoint_url=endpoint_url
+        ).Table(table_name)
+
+    def claim(self, key, ttl):
+        from botocore.exceptions import ClientError
+        now = int(time.time())
+        try:
+            self.table.put_item(
+                Item={'pk': f"update#{key}", 'state': IN_FLIGHT, 'expires_at': now + ttl},
+                ConditionExpression='attribute_not_exists(pk) OR expires_at <= :now',
+                ExpressionAttributeValues={':now': now}
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def mark_done(self, key, ttl):
+        self.table.update_item(
+            Key={'pk': f"update#{key}"},
+            UpdateExpression='SET #s = :state, expires_at = :expires',
+            ExpressionAttributeNames={'#s': 'state'},
+            ExpressionAttributeValues={':state': DONE, ':expires': int(time.time()) + ttl}
+        )
+
+    def release(self, key):
+        self.table.delete_item(Key={'pk': f"update#{key}"})
+
+class UpdateDeduplicator:
+    """Claim an update before processing it; duplicates (done or in flight) are dropped"""
+
+    def __init__(self, backend=None, in_flight_ttl=IN_FLIGHT_TTL, done_ttl=DONE_TTL):
+        self.backend = backend if backend is not None else MemoryDedupBackend()
+        self.in_flight_ttl = in_flight_ttl
+        self.done_ttl = done_ttl
+        self.duplicates = 0
+
+    def process_once(self, update, handler):
+        """Run handler(update) unless this update was already processed or is in flight
+
+        Returns (processed, result). On failure the claim is released so a
+        Telegram retry can process the update again.
+        """
+        key = update_key(update)
+        if key is None:
+            return True, handler(update)
+
+        try:
+            claimed = self.backend.claim(key, self.in_flight_ttl)
+        except Exception as e:
+            # Fail open: a broken dedup store must not stop the bot
+            logger.error(f"Dedup backend error, processing anyway: {e}")
+            return True, handler(update)
+
+        if not claimed:
+            self.duplicates += 1
+            logger.info(f"Skipping duplicate update {key}")
+            return False, "OK"
+
+        try:
+            result = handler(update)
+        except Exception:
+            self.backend.release(key)
+            raise
+        self.backend.mark_done(key, self.done_ttl)
+        return True, result
+
+def create_deduplicator(backend_name=None):
+    """Create a deduplicator from DEDUP_BACKEND (memory, sqlite, dynamodb or none)"""
+    backend_name = (backend_name or os.environ.get('DEDUP_BACKEND', 'memory')).lower()
+    if backend_name == 'none':
+        return None
+    if backend_name == 'sqlite':
+        return UpdateDeduplicator(SQLiteDedupBackend())
+    if backend_name == 'dynamodb':
+        return UpdateDeduplicator(DynamoDBDedupBackend(
+            os.environ.get('DYNAMODB_TABLE_NAME', 'nutrition_tracker'),
+            endpoint_url=os.environ.get('DYNAMODB_ENDPOINT')
+        ))
+    return UpdateDeduplicator(MemoryDedupBackend())
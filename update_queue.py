@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Update queue for the asynchronous webhook pipeline
+The webhook enqueues Telegram updates and returns immediately; a worker drains the queue
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VISIBILITY_TIMEOUT = int(os.environ.get('UPDATE_QUEUE_VISIBILITY_TIMEOUT', 120))
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get('UPDATE_QUEUE_MAX_ATTEMPTS', 3))
+DEFAULT_WORKER_CONCURRENCY = int(os.environ.get('UPDATE_QUEUE_CONCURRENCY', 4))
+DEFAULT_SQLITE_PATH = os.environ.get('UPDATE_QUEUE_SQLITE_PATH', '/tmp/nutritiongpt_updates.db')
+
+def is_valid_update(update):
+    """Check that a webhook body looks like a Telegram update we handle"""
+    return (
+        isinstance(update, dict)
+        and 'update_id' in update
+        and ('message' in update or 'callback_query' in update)
+    )
+
+class MemoryUpdateQueue:
+    """In-process queue (local development and tests)"""
+
+    def __init__(self, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self._pending = deque()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, update):
+        with self._lock:
+            self._pending.append({'update': update, 'attempts': 0})
+
+    def receive(self, max_messages=10):
+        """Return up to max_messages (receipt, update) pairs and hide them from other receivers"""
+        now = time.time()
+        messages = []
+        with self._lock:
+            # Requeue messages whose visibility timeout expired
+            for receipt, (item, deadline) in list(self._in_flight.items()):
+                if deadline <= now:
+                    del self._in_flight[receipt]
+                    self._pending.append(item)
+            while self._pending and len(messages) < max_messages:
+                item = self._pending.popleft()
+                item['attempts'] += 1
+                receipt = uuid.uuid4().hex
+                self._in_flight[receipt] = (item, now + self.visibility_timeout)
+                messages.append((receipt, item['update']))
+        return messages
+
+    def ack(self, receipt):
+        with self._lock:
+            self._in_flight.pop(receipt, None)
+
+    def nack(self, receipt):
+        """Make a failed message visible again (dropped after max_attempts)"""
+        with self._lock:
+            entry = self._in_flight.pop(receipt, None)
+            if entry is None:
+                return
+            item = entry[0]
+            if item['attempts'] < self.max_attempts:
+                self._pending.append(item)
+            else:
+                logger.error(f"Dropping update {item['update'].get('update_id')} after {item['attempts']} attempts")
+
+    def __len__(self):
+        return len(self._pending) + len(self._in_flight)
+
+class SQLiteUpdateQueue:
+    """SQLite-backed queue shared by processes on the same host or volume"""
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS updates ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "body TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "visible_at REAL NOT NULL DEFAULT 0, "
+                "receipt TEXT)"
+            )
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def enqueue(self, update):
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT INTO updates (body) VALUES (?)", (json.dumps(update),))
+
+    def receive(self, max_messages=10):
+        now = time.time()
+        messages = []
+        with self._lock:
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    rows = conn.execute(
+                        "SELECT id, body FROM updates WHERE visible_at <= ? AND attempts < ? "
+                        "ORDER BY id LIMIT ?",
+                        (now, self.max_attempts, max_messages)
+                    ).fetchall()
+                    for row_id, body in rows:
+                        receipt = f"{row_id}:{uuid.uuid4().hex}"
+                        conn.execute(
+                            "UPDATE updates SET attempts = attempts + 1, visible_at = ?, receipt = ? WHERE id = ?",
+                            (now + self.visibility_timeout, receipt, row_id)
+                        )
+                        messages.append((receipt, json.loads(body)))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        return messages
+
+    def ack(self, receipt):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM updates WHERE receipt = ?", (receipt,))
+
+    def nack(self, receipt):
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE updates SET visible_at = 0 WHERE receipt = ?", (receipt,))
+            conn.execute("DELETE FROM updates WHERE receipt = ? AND attempts >= ?", (receipt, self.max_attempts))
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM updates WHERE attempts < ?", (self.max_attempts,)
+            ).fetchone()[0]
+
+class SQSUpdateQueue:
+    """Amazon SQS queue; set endpoint_url to use a local stand-in such as ElasticMQ"""
+
+    def __init__(self, queue_url, endpoint_url=None, region_name=None,
+                 visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        import boto3
+        self.queue_url = queue_url
+        self.visibility_timeout = visibility_timeout
+        self.client = boto3.client(
+            'sqs',
+            endpoint_url=endpoint_url,
+            region_name=region_name or os.environ.get('AWS_REGION', 'us-east-1')
+        )
+
+    def enqueue(self, update):
+        self.client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(update))
+
+    def receive(self, max_messages=10):
+        response = self.client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_messages, 10),
+            VisibilityTimeout=self.visibility_timeout,
+            WaitTimeSeconds=1
+        )
+        return [(m['ReceiptHandle'], json.loads(m['Body'])) for m in response.get('Messages', [])]
+
+    def ack(self, receipt):
+        self.client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+
+    def nack(self, receipt):
+        self.client.change_message_visibility(
+            QueueUrl=self.queue_url, ReceiptHandle=receipt, VisibilityTimeout=0
+        )
+
+def create_update_queue(backend_name=None, shared=False):
+    """Create a queue from UPDATE_QUEUE_BACKEND (memory, sqlite or sqs)
+
+    shared=True is for a queue another invocation drains (async webhook
+    mode): only SQS is reachable from a separate worker Lambda, so any other
+    backend raises ValueError instead of silently losing acknowledged updates.
+    """
+    backend_name = (backend_name or os.environ.get('UPDATE_QUEUE_BACKEND', 'memory')).lower()
+    if shared and backend_name != 'sqs':
+        raise ValueError(f"PROCESSING_MODE=async needs UPDATE_QUEUE_BACKEND=sqs, not {backend_name}")
+    if backend_name == 'sqlite':
+        return SQLiteUpdateQueue()
+    if backend_name == 'sqs':
+        return SQSUpdateQueue(
+            os.environ['UPDATE_QUEUE_SQS_URL'],
+            endpoint_url=os.environ.get('UPDATE_QUEUE_SQS_ENDPOINT')
+        )
+    return MemoryUpdateQueue()
+
+def drain_queue(queue, handler, concurrency=DEFAULT_WORKER_CONCURRENCY, max_messages=None,
+                batch_size=10):
+    """Process queued updates with at most `concurrency` handlers running at once
+
+    Stops when the queue is empty or max_messages have been processed.
+    Returns a dict with processed/failed counts.
+    """
+    processed = 0
+    failed = 0
+
+    def run(receipt, update):
+        try:
+            handler(update)
+            queue.ack(receipt)
+            return True
+        except Exception as e:
+            logger.error(f"Error processing queued update {update.get('update_id')}: {e}")
+            queue.nack(receipt)
+            return False
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while max_messages is None or processed + failed < max_messages:
+            limit = batch_size if max_messages is None else min(batch_size, max_messages - processed - failed)
+            messages = queue.receive(limit)
+            if not messages:
+                break
+            for ok in executor.map(lambda m: run(*m), messages):
+                if ok:
+                    processed += 1
+                else:
+                    failed += 1
+
+    logger.info(f"Drained update queue: {processed} processed, {failed} failed")
+    return {'processed': processed, 'failed': failed}
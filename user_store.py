@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Persistent user state store for NutritionGPT
+Replaces the process-local storage dict so state survives cold starts and is shared between containers
+"""
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_TTL = float(os.environ.get('USER_STORE_CACHE_TTL', 30))
+DEFAULT_MAX_RETRIES = int(os.environ.get('USER_STORE_MAX_RETRIES', 5))
+DEFAULT_SQLITE_PATH = os.environ.get('USER_STORE_SQLITE_PATH', '/tmp/nutritiongpt_users.db')
+
+class MemoryUserBackend:
+    """Process-local backend (local development and tests)"""
+
+    # Other processes (the weekly batch job, other containers) can't see this state
+    shared = False
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def load(self, user_id):
+        with self._lock:
+            state, version = self._items.get(user_id, ({}, 0))
+            return copy.deepcopy(state), version
+
+    def save(self, user_id, state, expected_version):
+        return not self.save_many([(user_id, state, expected_version)])
+
+    def save_many(self, writes):
+        """Conditionally write (user_id, state, expected_version) tuples; return ids that conflicted"""
+        conflicts = []
+        with self._lock:
+            for user_id, state, expected_version in writes:
+                if self._items.get(user_id, ({}, 0))[1] != expected_version:
+                    conflicts.append(user_id)
+                    continue
+                self._items[user_id] = (copy.deepcopy(state), expected_version + 1)
+        return conflicts
+
+    def scan(self):
+        with self._lock:
+            items = [(user_id, copy.deepcopy(state)) for user_id, (state, _) in self._items.items()]
+        return iter(items)
+
+class SQLiteUserBackend:
+    """SQLite backend with version-checked writes"""
+
+    # Shared by every process that opens the same file (put it on EFS for Lambda)
+    shared = True
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_state ("
+                "user_id TEXT PRIMARY KEY, state TEXT NOT NULL, version INTEGER NOT NULL)"
+            )
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def load(self, user_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT state, version FROM user_state WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return {}, 0
+        return json.loads(row[0]), row[1]
+
+    def save(self, user_id, state, expected_version):
+        return not self.save_many([(user_id, state, expected_version)])
+
+    def save_many(self, writes):
+        conflicts = []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for user_id, state, expected_version in writes:
+                    body = json.dumps(state)
+                    if expected_version == 0:
+                        cursor = conn.execute(
+                            "INSERT OR IGNORE INTO user_state (user_id, state, version) VALUES (?, ?, 1)",
+                            (user_id, body)
+                        )
+                    else:
+                        cursor = conn.execute(
+                            "UPDATE user_state SET state = ?, version = version + 1 "
+                            "WHERE user_id = ? AND version = ?",
+                            (body, user_id, expected_version)
+                        )
+                    if cursor.rowcount != 1:
+                        conflicts.append(user_id)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return conflicts
+
+    def scan(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT user_id, state FROM user_state ORDER BY user_id").fetchall()
+        for user_id, state in rows:
+            yield user_id, json.loads(state)
+
+class DynamoDBUserBackend:
+    """DynamoDB backend; set endpoint_url to test against DynamoDB Local"""
+
+    shared = True
+
+    def __init__(self, table_name, region_name=None, endpoint_url=None):
+        import boto3
+        self.table = boto3.resource(
+            'dynamodb',
+            region_name=region_name or os.environ.get('AWS_REGION', 'us-east-1'),
+            endpoint_url=endpoint_url
+        ).Table(table_name)
+
+    def load(self, user_id):
+        item = self.table.get_item(Key={'pk': f"user#{user_id}"}, ConsistentRead=True).get('Item')
+        if item is None:
+            return {}, 0
+        return json.loads(item['state']), int(item['version'])
+
+    def save(self, user_id, state, expected_version):
+        from botocore.exceptions import ClientError
+        item = {'pk': f"user#{user_id}", 'state': json.dumps(state), 'version': expected_version + 1}
+        try:
+            if expected_version == 0:
+                self.table.put_item(Item=item, ConditionExpression='attribute_not_exists(pk)')
+            else:
+                self.table.put_item(
+                    Item=item,
+                    ConditionExpression='version = :expected',
+                    ExpressionAttributeValues={':expected': expected_version}
+                )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def save_many(self, writes):
+        # Conditional writes can't use BatchWriteItem; fall back to one put per user
+        return [user_id for user_id, state, expected_version in writes
+                if not self.save(user_id, state, expected_version)]
+
+    def scan(self):
+        from boto3.dynamodb.conditions import Attr
+        kwargs = {'FilterExpression': Attr('pk').begins_with('user#'), 'ProjectionExpression': 'pk, #s',
+                  'ExpressionAttributeNames': {'#s': 'state'}}
+        while True:
+            page = self.table.scan(**kwargs)
+            for item in page.get('Items', []):
+                yield item['pk'][len('user#'):], json.loads(item['state'])
+            if 'LastEvaluatedKey' not in page:
+                return
+            kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+class UserStore:
+    """User state with a write-through cache, batched writes and optimistic concurrency
+
+    State is changed through update(user_id, mutate): mutate receives a copy of
+    the current state dict and edits it in place. If another container wrote
+    the same user in the meantime, the state is reloaded and mutate re-applied.
+    """
+
+    def __init__(self, backend=None, cache_ttl=DEFAULT_CACHE_TTL, max_retries=DEFAULT_MAX_RETRIES):
+        self.backend = backend if backend is not None else MemoryUserBackend()
+        self.cache_ttl = cache_ttl
+        self.max_retries = max_retries
+        self._cache = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        """True if other processes see this store's state (False for the memory backend)"""
+        return getattr(self.backend, 'shared', False)
+
+    def _load(self, user_id, fresh=False):
+        with self._lock:
+            cached = self._cache.get(user_id)
+        if cached and not fresh and time.time() - cached[2] < self.cache_ttl:
+            return copy.deepcopy(cached[0]), cached[1]
+        state, version = self.backend.load(user_id)
+        self._remember(user_id, state, version)
+        return copy.deepcopy(state), version
+
+    def _remember(self, user_id, state, version):
+        with self._lock:
+            self._cache[user_id] = (copy.deepcopy(state), version, time.time())
+
+    def _forget(self, user_id):
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def get(self, user_id):
+        """Return a copy of the user's state (including writes pending in this thread's batch)"""
+        user_id = str(user_id)
+        pending = getattr(self._local, 'pending', None)
+        if pending and user_id in pending:
+            return copy.deepcopy(pending[user_id][0])
+        return self._load(user_id)[0]
+
+    def update(self, user_id, mutate):
+        """Apply mutate(state) and persist it; returns the new state"""
+        user_id = str(user_id)
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            # Inside batch(): apply now, write once on exit
+            if user_id in pending:
+                state, version, mutations = pending[user_id]
+            else:
+                state, version = self._load(user_id)
+                mutations = []
+            mutate(state)
+            mutations.append(mutate)
+            pending[user_id] = (state, version, mutations)
+            return copy.deepcopy(state)
+        return self._apply(user_id, [mutate])
+
+    def _apply(self, user_id, mutations):
+        fresh = False
+        for attempt in range(self.max_retries):
+            state, version = self._load(user_id, fresh=fresh)
+            for mutate in mutations:
+                mutate(state)
+            if self.backend.save(user_id, state, version):
+                self._remember(user_id, state, version + 1)
+                return state
+            logger.info(f"Concurrent update for user {user_id}, retrying ({attempt + 1})")
+            self._forget(user_id)
+            fresh = True
+        raise RuntimeError(f"Could not update state for user {user_id} after {self.max_retries} attempts")
+
+    @contextmanager
+    def batch(self):
+        """Group updates made in this thread into one write per user"""
+        if getattr(self._local, 'pending', None) is not None:
+            # Nested batch: the outer one flushes
+            yield self
+            return
+        self._local.pending = {}
+        try:
+            yield self
+            pending = self._local.pending
+        finally:
+            self._local.pending = None
+        self._flush(pending)
+
+    def scan(self):
+        """Iterate (user_id, state) over every stored user (reads the backend, not the cache)"""
+        return self.backend.scan()
+
+    def _flush(self, pending):
+        if not pending:
+            return
+        writes = [(user_id, state, version) for user_id, (state, version, _) in pending.items()]
+        conflicts = set(self.backend.save_many(writes))
+        for user_id, (state, version, mutations) in pending.items():
+            if user_id in conflicts:
+                self._forget(user_id)
+                self._apply(user_id, mutations)
+            else:
+                self._remember(user_id, state, version + 1)
+
+def create_user_store(backend_name=None, table_name=None, shared=False):
+    """Create a store from USER_STORE_BACKEND (memory, sqlite or dynamodb)
+
+    shared=True is for state another process reads (the weekly batch job):
+    the memory backend raises ValueError instead of silently losing it.
+    """
+    backend_name = (backend_name or os.environ.get('USER_STORE_BACKEND', 'memory')).lower()
+    if shared and backend_name not in ('sqlite', 'dynamodb'):
+        raise ValueError(f"Weekly meal plans need USER_STORE_BACKEND=dynamodb or sqlite, not {backend_name}")
+    if backend_name == 'sqlite':
+        return UserStore(SQLiteUserBackend())
+    if backend_name == 'dynamodb':
+        return UserStore(DynamoDBUserBackend(
+            table_name or os.environ.get('DYNAMODB_TABLE_NAME', 'nutrition_tracker'),
+            endpoint_url=os.environ.get('DYNAMODB_ENDPOINT')
+        ))
+    return UserStore(MemoryUserBackend())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+In-memory voice note handling for Whisper transcription
+Telegram voice files go straight from the download into the Whisper upload - small notes as
+one bytes buffer, large notes as a chunked stream over the open HTTP response. Nothing touches /tmp.
+"""
+import io
+import os
+
+from resilience import TELEGRAM, send_request
+
+TELEGRAM_FILE_URL = 'https://api.telegram.org/file/bot{token}/{file_path}'
+VOICE_FILENAME = 'voice.ogg'
+CHUNK_SIZE = 64 * 1024
+# Notes up to this size are buffered (so a failed upload can be retried); larger ones are streamed
+STREAM_THRESHOLD = int(os.environ.get('VOICE_STREAM_THRESHOLD', 1024 * 1024))
+# Whisper rejects uploads over 25 MB
+MAX_VOICE_BYTES = 25 * 1024 * 1024
+
+class VoiceTooLarge(ValueError):
+    """Raised when a voice note exceeds the Whisper upload limit"""
+
+class TelegramFileStream(io.RawIOBase):
+    """Read-only file object over a streaming Telegram file download
+
+    Reads come from the open HTTP response in CHUNK_SIZE pieces, so the upload
+    never holds the whole note in memory. Can only be consumed once.
+    """
+
+    def __init__(self, response, max_bytes=MAX_VOICE_BYTES):
+        self._response = response
+        self._chunks = response.iter_content(CHUNK_SIZE)
+        self._buffer = b''
+        self._read = 0
+        self.max_bytes = max_bytes
+        self.name = VOICE_FILENAME
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._buffer:
+            self._buffer = next(self._chunks, b'')
+            self._read += len(self._buffer)
+            if self._read > self.max_bytes:
+                raise VoiceTooLarge(f"Voice note is larger than {self.max_bytes} bytes")
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._response.close()
+        super().close()
+
+def download_voice(bot_token, file_path, file_size=None, session=None):
+    """Download a Telegram file for Whisper without writing it to disk
+
+    Returns bytes when the note is small (or its size is unknown and it turns out small),
+    otherwise a TelegramFileStream. Close the stream once the upload is done.
+    """
+    if file_size and file_size > MAX_VOICE_BYTES:
+        raise VoiceTooLarge(f"Voice note is larger than {MAX_VOICE_BYTES} bytes")
+    response = send_request(
+        TELEGRAM, 'get', TELEGRAM_FILE_URL.format(token=bot_token, file_path=file_path),
+        session=session, stream=True
+    )
+    if response.status_code != 200:
+        response.close()
+        raise IOError(f"Telegram file download failed: {response.status_code}")
+
+    if file_size is None:
+        file_size = int(response.headers.get('Content-Length') or 0) or None
+    if file_size is not None and file_size <= STREAM_THRESHOLD:
+        with response:
+            return response.content
+    return TelegramFileStream(response)
+
+def whisper_file(audio, filename=VOICE_FILENAME):
+    """(filename, content) tuple for a Whisper upload; the extension tells Whisper the format"""
+    return (filename, audio)
+
+def is_streamed(audio):
+    """True if audio is a one-shot stream that can't be re-sent on retry"""
+    return not isinstance(audio, (bytes, bytearray))
+
+def close_audio(audio):
+    """Release the HTTP response behind a streamed note (no-op for bytes)"""
+    if is_streamed(audio) and hasattr(audio, 'close'):
+        audio.close()